@@ -1,15 +1,17 @@
 # Dataclasses and enums for storing neuron-indexed information about activations. Also, related
 # helper functions.
 
+import base64
+import json
 import math
 from dataclasses import dataclass, field
-from typing import List, Optional, Union
+from typing import Iterable, List, Optional, Sequence, Union
 
+import numpy as np
 import urllib.request
-import blobfile as bf
-import boostedblob as bbb
 from neuron_explainer.fast_dataclasses import FastDataclass, loads, register_dataclass
-from neuron_explainer.azure import standardize_azure_url
+from neuron_explainer.azure import ensure_session, standardize_azure_url
+from neuron_explainer.sharded_archive import get_sharded_archive
 
 
 @register_dataclass
@@ -23,6 +25,178 @@ class ActivationRecord(FastDataclass):
     """Raw activation values for the neuron on each token in the text sequence."""
 
 
+class TokenVocabulary:
+    """
+    A named list of token strings shared by EncodedActivationRecords, which store indices into it.
+    Tokens are only ever appended, so IDs stay valid as the vocabulary grows. Register a vocabulary
+    with register_token_vocabulary before decoding records that use it.
+    """
+
+    def __init__(self, name: str, tokens: Iterable[str] = ()):
+        self.name = name
+        self.tokens: list[str] = []
+        self._token_ids: dict[str, int] = {}
+        self.add(tokens)
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def add(self, tokens: Iterable[str]) -> None:
+        for token in tokens:
+            if token not in self._token_ids:
+                self._token_ids[token] = len(self.tokens)
+                self.tokens.append(token)
+
+    def encode(self, tokens: Sequence[str], add_missing: bool = False) -> np.ndarray:
+        """Return the IDs of the tokens. Raises ValueError for unknown tokens unless add_missing."""
+        if add_missing:
+            self.add(tokens)
+        try:
+            return np.array([self._token_ids[token] for token in tokens], dtype=np.int64)
+        except KeyError as e:
+            raise ValueError(f"Token {e.args[0]!r} is not in vocabulary {self.name}") from None
+
+    def decode(self, token_ids: np.ndarray) -> list[str]:
+        return [self.tokens[token_id] for token_id in token_ids.tolist()]
+
+    def dumps(self) -> bytes:
+        return json.dumps({"name": self.name, "tokens": self.tokens}).encode("utf-8")
+
+    @classmethod
+    def loads(cls, serialized: Union[str, bytes]) -> "TokenVocabulary":
+        vocabulary = json.loads(serialized)
+        return cls(vocabulary["name"], vocabulary["tokens"])
+
+    def save(self, path: str) -> None:
+        import blobfile as bf
+
+        with bf.BlobFile(path, "wb") as f:
+            f.write(self.dumps())
+
+    @classmethod
+    def load(cls, path: str) -> "TokenVocabulary":
+        import blobfile as bf
+
+        with bf.BlobFile(path, "rb") as f:
+            return cls.loads(f.read())
+
+
+_token_vocabularies_by_name: dict[str, TokenVocabulary] = {}
+
+
+def register_token_vocabulary(vocabulary: TokenVocabulary) -> TokenVocabulary:
+    """Make the vocabulary available for decoding records. Returns it for convenience."""
+    _token_vocabularies_by_name[vocabulary.name] = vocabulary
+    return vocabulary
+
+
+def get_token_vocabulary(name: str) -> TokenVocabulary:
+    if name not in _token_vocabularies_by_name:
+        raise KeyError(
+            f"Token vocabulary {name} is not registered, use "
+            "register_token_vocabulary(TokenVocabulary.load(path)) first"
+        )
+    return _token_vocabularies_by_name[name]
+
+
+def _encode_array(array: np.ndarray) -> str:
+    return base64.b64encode(array.astype(array.dtype.newbyteorder("<")).tobytes()).decode("ascii")
+
+
+def _decode_array(encoded: str, dtype: Union[str, type]) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(encoded), dtype=np.dtype(dtype).newbyteorder("<"))
+
+
+ACTIVATION_DTYPES = ("float16", "int8")
+
+
+@register_dataclass
+@dataclass
+class EncodedActivationRecord(FastDataclass):
+    """
+    Compact equivalent of an ActivationRecord, for storing large numbers of records in memory or on
+    disk. Tokens are stored as IDs in a registered TokenVocabulary, and activations are quantized
+    after dividing by a per-record scale: to float16 (relative error below 1e-3 of the largest
+    absolute activation) or int8 (error below 1/254 of it). Arrays are base64-encoded. The tokens
+    and activations properties decode on access, so the record can be used in place of an
+    ActivationRecord for reading.
+    """
+
+    vocabulary_name: str
+    token_id_dtype: str
+    """uint16, or uint32 if the vocabulary had more than 65536 tokens when the record was encoded."""
+    packed_token_ids: str
+    activation_dtype: str
+    """One of ACTIVATION_DTYPES."""
+    packed_activations: str
+    """Array of activation_dtype: the activations divided by activation_scale."""
+    activation_scale: float
+
+    @classmethod
+    def from_activation_record(
+        cls,
+        activation_record: ActivationRecord,
+        vocabulary: TokenVocabulary,
+        activation_dtype: str = "float16",
+        add_missing_tokens: bool = False,
+    ) -> "EncodedActivationRecord":
+        """
+        Raises ValueError if a token is missing from the vocabulary (unless add_missing_tokens) or
+        an activation isn't finite.
+        """
+        if activation_dtype not in ACTIVATION_DTYPES:
+            raise ValueError(
+                f"Unknown dtype {activation_dtype}, expected one of {ACTIVATION_DTYPES}"
+            )
+        token_ids = vocabulary.encode(activation_record.tokens, add_missing=add_missing_tokens)
+        activations = np.array(activation_record.activations, dtype=np.float64)
+        if not np.all(np.isfinite(activations)):
+            raise ValueError("Activations must be finite to be encoded")
+        max_abs_activation = float(np.abs(activations).max()) if len(activations) > 0 else 0.0
+        if activation_dtype == "int8":
+            scale = max_abs_activation / 127 if max_abs_activation > 0 else 1.0
+            quantized = np.clip(np.round(activations / scale), -127, 127).astype(np.int8)
+        else:
+            scale = max_abs_activation if max_abs_activation > 0 else 1.0
+            quantized = (activations / scale).astype(np.float16)
+        token_id_dtype = "uint16" if len(vocabulary) <= 2**16 else "uint32"
+        return cls(
+            vocabulary_name=vocabulary.name,
+            token_id_dtype=token_id_dtype,
+            packed_token_ids=_encode_array(token_ids.astype(token_id_dtype)),
+            activation_dtype=activation_dtype,
+            packed_activations=_encode_array(quantized),
+            activation_scale=scale,
+        )
+
+    @property
+    def tokens(self) -> list[str]:
+        return get_token_vocabulary(self.vocabulary_name).decode(
+            _decode_array(self.packed_token_ids, self.token_id_dtype)
+        )
+
+    @property
+    def activations(self) -> list[float]:
+        quantized = _decode_array(self.packed_activations, self.activation_dtype)
+        return (quantized.astype(np.float64) * self.activation_scale).tolist()
+
+    def to_activation_record(self) -> ActivationRecord:
+        return ActivationRecord(tokens=self.tokens, activations=self.activations)
+
+
+def _decode_activation_records(
+    activation_records: Sequence[Union[ActivationRecord, EncodedActivationRecord]],
+) -> list[ActivationRecord]:
+    return [
+        (
+            activation_record.to_activation_record()
+            if isinstance(activation_record, EncodedActivationRecord)
+            else activation_record
+        )
+        for activation_record in activation_records
+    ]
+
+
 @register_dataclass
 @dataclass
 class NeuronId(FastDataclass):
@@ -94,12 +268,16 @@ class NeuronRecord(FastDataclass):
     neuron_id: NeuronId
     """Identifier for the neuron."""
 
-    random_sample: list[ActivationRecord] = field(default_factory=list)
+    random_sample: list[Union[ActivationRecord, EncodedActivationRecord]] = field(
+        default_factory=list
+    )
     """
     Random activation records for this neuron. The random sample is independent from those used for
     other neurons.
     """
-    random_sample_by_quantile: Optional[list[list[ActivationRecord]]] = None
+    random_sample_by_quantile: Optional[
+        list[list[Union[ActivationRecord, EncodedActivationRecord]]]
+    ] = None
     """
     Random samples of activation records in each of the specified quantiles. None if quantile
     tracking is disabled.
@@ -113,7 +291,9 @@ class NeuronRecord(FastDataclass):
     skewness: Optional[float] = math.nan
     kurtosis: Optional[float] = math.nan
 
-    most_positive_activation_records: list[ActivationRecord] = field(default_factory=list)
+    most_positive_activation_records: list[Union[ActivationRecord, EncodedActivationRecord]] = (
+        field(default_factory=list)
+    )
     """
     Activation records with the most positive figure of merit value for this neuron over all dataset
     examples.
@@ -154,9 +334,11 @@ class NeuronRecord(FastDataclass):
         top-activating records since context window limitations make it difficult to include
         random records.
         """
-        return self.most_positive_activation_records[
-            self._get_top_activation_slices(activation_record_slice_params)["train"]
-        ]
+        return _decode_activation_records(
+            self.most_positive_activation_records[
+                self._get_top_activation_slices(activation_record_slice_params)["train"]
+            ]
+        )
 
     def calibration_activation_records(
         self,
@@ -167,7 +349,7 @@ class NeuronRecord(FastDataclass):
         http://go/neuron_explanation_methodology for an explanation of calibration. Consists of
         top-activating records and random records in a 1:1 ratio.
         """
-        return (
+        return _decode_activation_records(
             self.most_positive_activation_records[
                 self._get_top_activation_slices(activation_record_slice_params)["calibration"]
             ]
@@ -185,7 +367,7 @@ class NeuronRecord(FastDataclass):
         simulation + correlation coefficient scoring, or manually by humans. Consists of
         top-activating records and random records in a 1:1 ratio.
         """
-        return (
+        return _decode_activation_records(
             self.most_positive_activation_records[
                 self._get_top_activation_slices(activation_record_slice_params)["valid"]
             ]
@@ -202,7 +384,7 @@ class NeuronRecord(FastDataclass):
         Test split, typically used for explanation evaluations that can't use the validation split.
         Consists of top-activating records and random records in a 1:1 ratio.
         """
-        return (
+        return _decode_activation_records(
             self.most_positive_activation_records[
                 self._get_top_activation_slices(activation_record_slice_params)["test"]
             ]
@@ -212,10 +394,52 @@ class NeuronRecord(FastDataclass):
         )
 
 
+def _get_activation_record_lists(
+    neuron_record: NeuronRecord,
+) -> list[list[Union[ActivationRecord, EncodedActivationRecord]]]:
+    return [
+        neuron_record.random_sample,
+        neuron_record.most_positive_activation_records,
+        *(neuron_record.random_sample_by_quantile or []),
+    ]
+
+
+def encode_neuron_record(
+    neuron_record: NeuronRecord,
+    vocabulary: TokenVocabulary,
+    activation_dtype: str = "float16",
+    add_missing_tokens: bool = True,
+) -> NeuronRecord:
+    """
+    Replace every ActivationRecord in the neuron record with an EncodedActivationRecord, in place.
+    By default, tokens missing from the vocabulary are added to it, so save the vocabulary after
+    encoding a dataset. Returns the record for convenience.
+    """
+    for activation_records in _get_activation_record_lists(neuron_record):
+        for i, activation_record in enumerate(activation_records):
+            if isinstance(activation_record, ActivationRecord):
+                activation_records[i] = EncodedActivationRecord.from_activation_record(
+                    activation_record, vocabulary, activation_dtype, add_missing_tokens
+                )
+    return neuron_record
+
+
+def decode_neuron_record(neuron_record: NeuronRecord) -> NeuronRecord:
+    """Replace every EncodedActivationRecord with an ActivationRecord, in place."""
+    for activation_records in _get_activation_record_lists(neuron_record):
+        activation_records[:] = _decode_activation_records(activation_records)
+    return neuron_record
+
+
 def neuron_exists(
     dataset_path: str, layer_index: Union[str, int], neuron_index: Union[str, int]
 ) -> bool:
-    """Return whether the specified neuron exists."""
+    """
+    Return whether the specified neuron exists. To check many neurons, use
+    DatasetCatalog(bf.join(dataset_path, "neurons")), which lists the dataset once.
+    """
+    import blobfile as bf
+
     file = bf.join(dataset_path, "neurons", str(layer_index), f"{neuron_index}.json")
     return bf.exists(file)
 
@@ -237,20 +461,24 @@ def load_neuron(
         return neuron_record
 
 
-@bbb.ensure_session
+@ensure_session
 async def load_neuron_async(
     layer_index: Union[str, int],
     neuron_index: Union[str, int],
     dataset_path: str = "az://openaipublic/neuron-explainer/data/collated-activations",
 ) -> NeuronRecord:
     """Async version of load_neuron."""
+    import blobfile as bf
+
     file = bf.join(dataset_path, str(layer_index), f"{neuron_index}.json")
     return await read_neuron_file(file)
 
 
-@bbb.ensure_session
+@ensure_session
 async def read_neuron_file(neuron_filename: str) -> NeuronRecord:
     """Like load_neuron_async, but takes a raw neuron filename."""
+    import boostedblob as bbb
+
     raw_contents = await bbb.read.read_single(neuron_filename)
     neuron_record = loads(raw_contents.decode("utf-8"))
     if not isinstance(neuron_record, NeuronRecord):
@@ -260,8 +488,42 @@ async def read_neuron_file(neuron_filename: str) -> NeuronRecord:
     return neuron_record
 
 
+def _parse_neuron_record(raw_contents: Optional[bytes], description: str) -> NeuronRecord:
+    if raw_contents is None:
+        raise FileNotFoundError(f"No neuron record for {description}")
+    neuron_record = loads(raw_contents.decode("utf-8"))
+    if not isinstance(neuron_record, NeuronRecord):
+        raise ValueError(
+            f"Stored data incompatible with current version of NeuronRecord dataclass."
+        )
+    return neuron_record
+
+
+def load_neuron_from_archive(
+    archive_path: str, layer_index: Union[str, int], neuron_index: Union[str, int]
+) -> NeuronRecord:
+    """
+    Like load_neuron, but reads from a sharded archive of collated activations (see
+    neuron_explainer.sharded_archive), fetching only the neuron's byte range.
+    """
+    raw_contents = get_sharded_archive(archive_path).read(int(layer_index), int(neuron_index))
+    return _parse_neuron_record(raw_contents, f"{archive_path}/{layer_index}/{neuron_index}")
+
+
+async def load_neuron_from_archive_async(
+    archive_path: str, layer_index: Union[str, int], neuron_index: Union[str, int]
+) -> NeuronRecord:
+    """Async version of load_neuron_from_archive."""
+    raw_contents = await get_sharded_archive(archive_path).read_async(
+        int(layer_index), int(neuron_index)
+    )
+    return _parse_neuron_record(raw_contents, f"{archive_path}/{layer_index}/{neuron_index}")
+
+
 def get_sorted_neuron_indices(dataset_path: str, layer_index: Union[str, int]) -> List[int]:
     """Returns the indices of all neurons in this layer, in ascending order."""
+    import blobfile as bf
+
     layer_dir = bf.join(dataset_path, "neurons", str(layer_index))
     return sorted(
         [int(f.split(".")[0]) for f in bf.listdir(layer_dir) if f.split(".")[0].isnumeric()]
@@ -272,6 +534,8 @@ def get_sorted_layers(dataset_path: str) -> List[str]:
     """
     Return the indices of all layers in this dataset, in ascending numerical order, as strings.
     """
+    import blobfile as bf
+
     return [
         str(x)
         for x in sorted(
@@ -0,0 +1,332 @@
+# Packed, memory-mapped tables of the tokens most strongly connected to each neuron, built from the
+# per-neuron files read by token_connections.py. Looking up the top tokens for a neuron, or the
+# neurons most strongly connected to a token, is a slice of a memory-mapped array.
+#
+# A packed table is a local directory with this layout:
+#
+#   metadata.json   Kind of table, list names and number of neurons in each layer.
+#   vocab.json      Token strings, indexed by token ID. Shared by all layers.
+#   {layer}/        For each layer, .npy arrays:
+#     offsets           token_ids[offsets[i] : offsets[i + 1]] is list i % num_lists of neuron
+#                       i // num_lists, where num_lists is the number of list names.
+#     token_ids         int32 token IDs.
+#     strengths         float32 strengths, in the same order as in the source files.
+#     reverse_offsets   Shape (num_lists, vocab_size + 1). With start, end = reverse_offsets[l, t]
+#                       and reverse_offsets[l, t + 1], reverse_neuron_indices[start:end] are the
+#                       neurons whose list l contains token t, in descending order of absolute
+#                       strength, and reverse_strengths[start:end] are the strengths.
+#     reverse_neuron_indices, reverse_strengths
+#
+# To build a packed table:
+#
+#   python -m neuron_explainer.activations.packed_token_connections weight-based <output_dir>
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import urllib.error
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence, Union
+
+import numpy as np
+from neuron_explainer.activations.token_connections import (
+    TokenLookupTableSummaryOfNeuron,
+    TokensAndWeights,
+    WeightBasedSummaryOfNeuron,
+    load_token_lookup_table_connections_of_neuron,
+    load_token_weight_connections_of_neuron,
+)
+
+WEIGHT_BASED = "weight-based"
+ACTIVATION_BASED = "activation-based"
+LIST_NAMES_BY_KIND = {
+    WEIGHT_BASED: ("input_positive", "input_negative", "output_positive", "output_negative"),
+    ACTIVATION_BASED: ("average_activations",),
+}
+
+Summary = Union[WeightBasedSummaryOfNeuron, TokenLookupTableSummaryOfNeuron]
+
+
+def _get_lists(summary: Summary) -> list[tuple[list[str], list[float]]]:
+    """Return the (tokens, strengths) lists of a summary, in the order of LIST_NAMES_BY_KIND."""
+    if isinstance(summary, WeightBasedSummaryOfNeuron):
+        return [
+            (tokens_and_weights.tokens, tokens_and_weights.strengths)
+            for tokens_and_weights in [
+                summary.input_positive,
+                summary.input_negative,
+                summary.output_positive,
+                summary.output_negative,
+            ]
+        ]
+    return [(summary.tokens, summary.average_activations)]
+
+
+@dataclass
+class TokenIdsAndStrengths:
+    """Views into a packed table. token_ids are indices into the table's vocabulary."""
+
+    token_ids: np.ndarray
+    strengths: np.ndarray
+
+
+class PackedTokenConnections:
+    """A packed table of token connections, loaded from a directory written by pack()."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "metadata.json")) as f:
+            metadata = json.load(f)
+        self.kind: str = metadata["kind"]
+        self.list_names: tuple[str, ...] = tuple(metadata["list_names"])
+        self.num_neurons_by_layer: dict[int, int] = {
+            int(layer_index): num_neurons
+            for layer_index, num_neurons in metadata["num_neurons_by_layer"].items()
+        }
+        with open(os.path.join(path, "vocab.json")) as f:
+            self.vocab: list[str] = json.load(f)
+        self._token_ids = {token: i for i, token in enumerate(self.vocab)}
+        self._layers: dict[int, dict[str, np.ndarray]] = {}
+
+    @staticmethod
+    def pack(
+        output_dir: str,
+        kind: str,
+        summaries_by_layer: dict[int, Sequence[Optional[Summary]]],
+    ) -> PackedTokenConnections:
+        """
+        Write a packed table. summaries_by_layer has the summary of each neuron in each layer, or
+        None for neurons without one.
+        """
+        list_names = LIST_NAMES_BY_KIND[kind]
+        vocab: list[str] = []
+        token_ids_by_token: dict[str, int] = {}
+
+        def get_token_id(token: str) -> int:
+            if token not in token_ids_by_token:
+                token_ids_by_token[token] = len(vocab)
+                vocab.append(token)
+            return token_ids_by_token[token]
+
+        packed_layers = {}
+        for layer_index, summaries in summaries_by_layer.items():
+            lengths = []
+            token_ids: list[int] = []
+            strengths: list[float] = []
+            for summary in summaries:
+                lists = _get_lists(summary) if summary is not None else [([], [])] * len(list_names)
+                assert len(lists) == len(list_names)
+                for tokens, list_strengths in lists:
+                    assert len(tokens) == len(list_strengths)
+                    lengths.append(len(tokens))
+                    token_ids.extend(get_token_id(token) for token in tokens)
+                    strengths.extend(list_strengths)
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(lengths)
+            packed_layers[layer_index] = {
+                "offsets": offsets,
+                "token_ids": np.array(token_ids, dtype=np.int32),
+                "strengths": np.array(strengths, dtype=np.float32),
+            }
+        # The reverse index needs the final vocabulary size, so it's built in a second pass.
+        for arrays in packed_layers.values():
+            arrays.update(_build_reverse_index(arrays, len(list_names), len(vocab)))
+
+        os.makedirs(output_dir, exist_ok=True)
+        for layer_index, arrays in packed_layers.items():
+            layer_dir = os.path.join(output_dir, str(layer_index))
+            os.makedirs(layer_dir, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(os.path.join(layer_dir, f"{name}.npy"), array)
+        with open(os.path.join(output_dir, "vocab.json"), "w") as f:
+            json.dump(vocab, f)
+        # metadata.json is written last, so a partially written table can't be loaded.
+        with open(os.path.join(output_dir, "metadata.json"), "w") as f:
+            json.dump(
+                {
+                    "kind": kind,
+                    "list_names": list(list_names),
+                    "num_neurons_by_layer": {
+                        str(layer_index): len(summaries)
+                        for layer_index, summaries in summaries_by_layer.items()
+                    },
+                },
+                f,
+            )
+        return PackedTokenConnections(output_dir)
+
+    def get_layer_arrays(self, layer_index: int) -> dict[str, np.ndarray]:
+        """Return the memory-mapped arrays for a layer, described at the top of this file."""
+        if layer_index not in self._layers:
+            if layer_index not in self.num_neurons_by_layer:
+                raise KeyError(f"Layer {layer_index} is not in {self.path}")
+            layer_dir = os.path.join(self.path, str(layer_index))
+            self._layers[layer_index] = {
+                name: np.load(os.path.join(layer_dir, f"{name}.npy"), mmap_mode="r")
+                for name in [
+                    "offsets",
+                    "token_ids",
+                    "strengths",
+                    "reverse_offsets",
+                    "reverse_neuron_indices",
+                    "reverse_strengths",
+                ]
+            }
+        return self._layers[layer_index]
+
+    def _get_list_index(self, list_name: Optional[str]) -> int:
+        if list_name is None:
+            if len(self.list_names) != 1:
+                raise ValueError(f"list_name must be one of {self.list_names}")
+            return 0
+        if list_name not in self.list_names:
+            raise ValueError(f"Unknown list {list_name}, expected one of {self.list_names}")
+        return self.list_names.index(list_name)
+
+    def get_token_id(self, token: str) -> Optional[int]:
+        return self._token_ids.get(token)
+
+    def get_tokens(self, token_ids: np.ndarray) -> list[str]:
+        return [self.vocab[token_id] for token_id in token_ids.tolist()]
+
+    def get_top_tokens(
+        self, layer_index: int, neuron_index: int, list_name: Optional[str] = None
+    ) -> TokenIdsAndStrengths:
+        """
+        Return the tokens most strongly connected to a neuron, as stored in the source files.
+        list_name may be omitted for activation-based tables, which only have one list.
+        """
+        layer = self.get_layer_arrays(layer_index)
+        if not 0 <= neuron_index < self.num_neurons_by_layer[layer_index]:
+            raise KeyError(f"Neuron {layer_index}:{neuron_index} is not in {self.path}")
+        i = neuron_index * len(self.list_names) + self._get_list_index(list_name)
+        start, end = layer["offsets"][i], layer["offsets"][i + 1]
+        return TokenIdsAndStrengths(
+            token_ids=layer["token_ids"][start:end], strengths=layer["strengths"][start:end]
+        )
+
+    def get_neurons_for_token(
+        self, token: Union[str, int], layer_index: int, list_name: Optional[str] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return the indices of the neurons in a layer whose list contains the token, and the
+        corresponding strengths, in descending order of absolute strength.
+        """
+        layer = self.get_layer_arrays(layer_index)
+        token_id = self.get_token_id(token) if isinstance(token, str) else token
+        if token_id is None:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        reverse_offsets = layer["reverse_offsets"][self._get_list_index(list_name)]
+        start, end = reverse_offsets[token_id], reverse_offsets[token_id + 1]
+        return layer["reverse_neuron_indices"][start:end], layer["reverse_strengths"][start:end]
+
+    def get_summary(self, layer_index: int, neuron_index: int) -> Summary:
+        """Return the summary of a neuron in the same format as token_connections.py."""
+        lists = []
+        for list_name in self.list_names:
+            top_tokens = self.get_top_tokens(layer_index, neuron_index, list_name)
+            lists.append(
+                (self.get_tokens(top_tokens.token_ids), top_tokens.strengths.astype(float).tolist())
+            )
+        if self.kind == WEIGHT_BASED:
+            return WeightBasedSummaryOfNeuron(
+                *[
+                    TokensAndWeights(tokens=tokens, strengths=strengths)
+                    for tokens, strengths in lists
+                ]
+            )
+        ((tokens, strengths),) = lists
+        return TokenLookupTableSummaryOfNeuron(tokens=tokens, average_activations=strengths)
+
+
+def _build_reverse_index(
+    arrays: dict[str, np.ndarray], num_lists: int, vocab_size: int
+) -> dict[str, np.ndarray]:
+    offsets = arrays["offsets"]
+    lengths = np.diff(offsets)
+    # The (neuron, list) each entry belongs to.
+    entry_lists = np.repeat(np.arange(len(lengths)), lengths)
+    entry_neuron_indices = (entry_lists // num_lists).astype(np.int32)
+    entry_list_indices = entry_lists % num_lists
+    reverse_offsets = np.zeros((num_lists, vocab_size + 1), dtype=np.int64)
+    reverse_neuron_indices = []
+    reverse_strengths = []
+    total = 0
+    for list_index in range(num_lists):
+        mask = entry_list_indices == list_index
+        token_ids = arrays["token_ids"][mask]
+        strengths = arrays["strengths"][mask]
+        neuron_indices = entry_neuron_indices[mask]
+        order = np.lexsort((-np.abs(strengths), token_ids))
+        reverse_neuron_indices.append(neuron_indices[order])
+        reverse_strengths.append(strengths[order])
+        reverse_offsets[list_index, 1:] = total + np.cumsum(
+            np.bincount(token_ids, minlength=vocab_size)
+        )
+        reverse_offsets[list_index, 0] = total
+        total += len(order)
+    return {
+        "reverse_offsets": reverse_offsets,
+        "reverse_neuron_indices": np.concatenate(reverse_neuron_indices).astype(np.int32),
+        "reverse_strengths": np.concatenate(reverse_strengths).astype(np.float32),
+    }
+
+
+async def build_packed_token_connections(
+    kind: str,
+    output_dir: str,
+    layer_indices: Sequence[int],
+    num_neurons: int,
+    dataset_path: Optional[str] = None,
+    max_concurrency: int = 64,
+) -> PackedTokenConnections:
+    """
+    Fetch the per-neuron files for the given layers concurrently and pack them. Neurons without a
+    file get empty lists. dataset_path defaults to the public dataset of the given kind.
+    """
+    load: Callable[..., Summary] = (
+        load_token_weight_connections_of_neuron
+        if kind == WEIGHT_BASED
+        else load_token_lookup_table_connections_of_neuron
+    )
+    kwargs = {"dataset_path": dataset_path} if dataset_path is not None else {}
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def load_or_none(layer_index: int, neuron_index: int) -> Optional[Summary]:
+        async with semaphore:
+            try:
+                # The loaders are blocking, so run them in threads.
+                return await asyncio.to_thread(load, layer_index, neuron_index, **kwargs)
+            except urllib.error.HTTPError as e:
+                if e.code == 404:
+                    return None
+                raise
+
+    summaries_by_layer = {}
+    for layer_index in layer_indices:
+        summaries_by_layer[layer_index] = await asyncio.gather(
+            *[load_or_none(layer_index, neuron_index) for neuron_index in range(num_neurons)]
+        )
+    return PackedTokenConnections.pack(output_dir, kind, summaries_by_layer)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pack token connections into local tables.")
+    parser.add_argument("kind", choices=list(LIST_NAMES_BY_KIND))
+    parser.add_argument("output_dir")
+    parser.add_argument("--layers", type=int, nargs="*", default=list(range(48)))
+    parser.add_argument("--num_neurons", type=int, default=6400)
+    parser.add_argument("--dataset_path", default=None)
+    args = parser.parse_args()
+    asyncio.run(
+        build_packed_token_connections(
+            args.kind, args.output_dir, args.layers, args.num_neurons, args.dataset_path
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from neuron_explainer.activations.activations import (
+    ActivationRecord,
+    ActivationRecordSliceParams,
+    EncodedActivationRecord,
+    NeuronId,
+    NeuronRecord,
+    TokenVocabulary,
+    decode_neuron_record,
+    encode_neuron_record,
+    register_token_vocabulary,
+)
+from neuron_explainer.fast_dataclasses import dumps, loads
+
+
+def _make_record(seed: int, num_tokens: int = 64) -> ActivationRecord:
+    rng = np.random.default_rng(seed)
+    return ActivationRecord(
+        tokens=[f" token{i}" for i in rng.integers(0, 1000, num_tokens)],
+        activations=(rng.standard_normal(num_tokens) * 3).tolist(),
+    )
+
+
+@pytest.mark.parametrize("activation_dtype,tolerance", [("float16", 1e-3), ("int8", 1 / 254)])
+def test_encoded_activation_record_round_trip(activation_dtype: str, tolerance: float) -> None:
+    vocabulary = register_token_vocabulary(TokenVocabulary("test-round-trip"))
+    record = _make_record(0)
+    encoded = loads(
+        dumps(
+            EncodedActivationRecord.from_activation_record(
+                record, vocabulary, activation_dtype, add_missing_tokens=True
+            )
+        )
+    )
+    assert isinstance(encoded, EncodedActivationRecord)
+    assert encoded.tokens == record.tokens
+    max_abs_activation = max(abs(a) for a in record.activations)
+    assert np.allclose(
+        encoded.activations, record.activations, rtol=0, atol=tolerance * max_abs_activation
+    )
+    assert len(dumps(encoded)) * 2 < len(dumps(record))
+
+    # Zeros and empty records are exact.
+    for zero_record in [
+        ActivationRecord(tokens=[], activations=[]),
+        ActivationRecord(tokens=record.tokens[:1], activations=[0.0]),
+    ]:
+        encoded_zero = EncodedActivationRecord.from_activation_record(
+            zero_record, vocabulary, activation_dtype
+        )
+        assert encoded_zero.to_activation_record() == zero_record
+
+
+def test_encoded_activation_record_errors() -> None:
+    vocabulary = register_token_vocabulary(TokenVocabulary("test-errors", ["a"]))
+    with pytest.raises(ValueError):
+        EncodedActivationRecord.from_activation_record(
+            ActivationRecord(tokens=["b"], activations=[1.0]), vocabulary
+        )
+    with pytest.raises(ValueError):
+        EncodedActivationRecord.from_activation_record(
+            ActivationRecord(tokens=["a"], activations=[float("nan")]), vocabulary
+        )
+    encoded = EncodedActivationRecord.from_activation_record(
+        ActivationRecord(tokens=["a"], activations=[1.0]), TokenVocabulary("unregistered", ["a"])
+    )
+    with pytest.raises(KeyError):
+        encoded.tokens
+
+
+def test_encode_neuron_record() -> None:
+    neuron_record = NeuronRecord(
+        neuron_id=NeuronId(layer_index=0, neuron_index=1),
+        random_sample=[_make_record(seed) for seed in range(3)],
+        random_sample_by_quantile=[[_make_record(3)], [_make_record(4)]],
+        most_positive_activation_records=[_make_record(seed) for seed in range(5, 9)],
+    )
+    original_activations = [r.activations for r in neuron_record.most_positive_activation_records]
+    vocabulary = TokenVocabulary("test-neuron-record")
+    encode_neuron_record(neuron_record, vocabulary)
+    # The vocabulary is saved with the dataset and registered before loading.
+    register_token_vocabulary(TokenVocabulary.loads(vocabulary.dumps()))
+    neuron_record = loads(dumps(neuron_record))
+    assert all(
+        isinstance(r, EncodedActivationRecord)
+        for r in neuron_record.random_sample + neuron_record.random_sample_by_quantile[1]
+    )
+    assert np.isclose(neuron_record.max_activation, max(max(a) for a in original_activations))
+
+    # Splits are decoded.
+    train_records = neuron_record.train_activation_records(
+        ActivationRecordSliceParams(n_examples_per_split=1)
+    )
+    assert [type(r) for r in train_records] == [ActivationRecord]
+    assert train_records[0].tokens == _make_record(5).tokens
+
+    decode_neuron_record(neuron_record)
+    assert all(
+        isinstance(r, ActivationRecord)
+        for r in neuron_record.most_positive_activation_records
+        + neuron_record.random_sample_by_quantile[0]
+    )
@@ -0,0 +1,72 @@
+import tempfile
+
+import numpy as np
+from neuron_explainer.activations.packed_token_connections import (
+    ACTIVATION_BASED,
+    WEIGHT_BASED,
+    PackedTokenConnections,
+)
+from neuron_explainer.activations.token_connections import (
+    TokenLookupTableSummaryOfNeuron,
+    TokensAndWeights,
+    WeightBasedSummaryOfNeuron,
+)
+
+
+def test_packed_activation_based_token_connections() -> None:
+    summaries_by_layer = {
+        0: [
+            TokenLookupTableSummaryOfNeuron(tokens=["a", "b"], average_activations=[2.0, 1.0]),
+            None,
+            TokenLookupTableSummaryOfNeuron(tokens=["b", "c"], average_activations=[3.0, 0.5]),
+        ],
+        3: [TokenLookupTableSummaryOfNeuron(tokens=["c"], average_activations=[4.0])],
+    }
+    with tempfile.TemporaryDirectory() as output_dir:
+        table = PackedTokenConnections.pack(output_dir, ACTIVATION_BASED, summaries_by_layer)
+        table = PackedTokenConnections(output_dir)
+
+        top_tokens = table.get_top_tokens(0, 2)
+        assert table.get_tokens(top_tokens.token_ids) == ["b", "c"]
+        assert top_tokens.strengths.tolist() == [3.0, 0.5]
+        assert len(table.get_top_tokens(0, 1).token_ids) == 0
+        assert table.get_summary(0, 0) == summaries_by_layer[0][0]
+
+        neuron_indices, strengths = table.get_neurons_for_token("b", 0)
+        assert neuron_indices.tolist() == [2, 0]
+        assert strengths.tolist() == [3.0, 1.0]
+        assert table.get_neurons_for_token("c", 3)[0].tolist() == [0]
+        assert table.get_neurons_for_token("a", 3)[0].tolist() == []
+        assert table.get_neurons_for_token("unknown", 0)[0].tolist() == []
+
+
+def test_packed_weight_based_token_connections() -> None:
+    def tokens_and_weights(tokens: list[str], strengths: list[float]) -> TokensAndWeights:
+        return TokensAndWeights(tokens=tokens, strengths=strengths)
+
+    summaries = [
+        WeightBasedSummaryOfNeuron(
+            input_positive=tokens_and_weights(["x", "y"], [0.5, 0.25]),
+            input_negative=tokens_and_weights(["z"], [-0.5]),
+            output_positive=tokens_and_weights(["y"], [0.75]),
+            output_negative=tokens_and_weights([], []),
+        ),
+        WeightBasedSummaryOfNeuron(
+            input_positive=tokens_and_weights(["y"], [1.0]),
+            input_negative=tokens_and_weights(["x"], [-0.25]),
+            output_positive=tokens_and_weights(["x"], [0.5]),
+            output_negative=tokens_and_weights(["z"], [-1.0]),
+        ),
+    ]
+    with tempfile.TemporaryDirectory() as output_dir:
+        table = PackedTokenConnections.pack(output_dir, WEIGHT_BASED, {5: summaries})
+        assert table.get_summary(5, 0) == summaries[0]
+        assert table.get_summary(5, 1) == summaries[1]
+        top_tokens = table.get_top_tokens(5, 1, "output_negative")
+        assert table.get_tokens(top_tokens.token_ids) == ["z"]
+        assert np.allclose(top_tokens.strengths, [-1.0])
+
+        neuron_indices, strengths = table.get_neurons_for_token("y", 5, "input_positive")
+        assert neuron_indices.tolist() == [1, 0]
+        assert strengths.tolist() == [1.0, 0.25]
+        assert table.get_neurons_for_token("x", 5, "input_negative")[0].tolist() == [1]
@@ -0,0 +1,69 @@
+import os
+import tempfile
+
+from neuron_explainer.activations.packed_token_connections import (
+    ACTIVATION_BASED,
+    WEIGHT_BASED,
+    PackedTokenConnections,
+)
+from neuron_explainer.activations.token_connections import (
+    TokenLookupTableSummaryOfNeuron,
+    TokensAndWeights,
+    WeightBasedSummaryOfNeuron,
+)
+from neuron_explainer.activations.token_neuron_index import TokenNeuronIndex
+
+
+def test_token_neuron_index() -> None:
+    def lookup_table(
+        tokens: list[str], activations: list[float]
+    ) -> TokenLookupTableSummaryOfNeuron:
+        return TokenLookupTableSummaryOfNeuron(tokens=tokens, average_activations=activations)
+
+    def weight_based(input_positive: list[str]) -> WeightBasedSummaryOfNeuron:
+        empty = TokensAndWeights(tokens=[], strengths=[])
+        return WeightBasedSummaryOfNeuron(
+            input_positive=TokensAndWeights(
+                tokens=input_positive, strengths=[1.0] * len(input_positive)
+            ),
+            input_negative=empty,
+            output_positive=empty,
+            output_negative=empty,
+        )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        activation_table = PackedTokenConnections.pack(
+            os.path.join(tmp_dir, "activation"),
+            ACTIVATION_BASED,
+            {
+                0: [lookup_table([" dog", " cat"], [2.0, 1.0]), lookup_table([" dog"], [5.0])],
+                1: [lookup_table([" cat"], [3.0]), lookup_table([" dog"], [3.0])],
+            },
+        )
+        weight_table = PackedTokenConnections.pack(
+            os.path.join(tmp_dir, "weight"), WEIGHT_BASED, {2: [weight_based([" bird", " dog"])]}
+        )
+        TokenNeuronIndex.build(
+            os.path.join(tmp_dir, "index"), [activation_table, weight_table], top_k=2
+        )
+        index = TokenNeuronIndex(os.path.join(tmp_dir, "index"))
+
+        assert index.sources == [
+            "activation-based.average_activations",
+            "weight-based.input_positive",
+            "weight-based.input_negative",
+            "weight-based.output_positive",
+            "weight-based.output_negative",
+        ]
+        top_neurons = index.get_top_neurons(" dog", "activation-based.average_activations")
+        # Only the top 2 of the 3 neurons are kept.
+        assert [
+            (c.neuron_id.layer_index, c.neuron_id.neuron_index, c.strength) for c in top_neurons
+        ] == [(0, 1, 5.0), (1, 1, 3.0)]
+        assert len(index.get_top_neurons(" dog", "activation-based.average_activations", 1)) == 1
+        top_neurons_by_source = index.get_top_neurons_by_source(" bird")
+        assert top_neurons_by_source["activation-based.average_activations"] == []
+        assert [
+            c.neuron_id.layer_index for c in top_neurons_by_source["weight-based.input_positive"]
+        ] == [2]
+        assert index.get_top_neurons("unknown", "weight-based.input_positive") == []
@@ -0,0 +1,180 @@
+# Index from each token to the neurons most strongly associated with it across all layers of a
+# model, built from packed token connection tables (see packed_token_connections.py). Each list of
+# each table (e.g. "activation-based.average_activations" or "weight-based.output_positive") is
+# inverted separately, keeping the top_k neurons for each token.
+#
+# The index is a local directory with this layout:
+#
+#   metadata.json       Source names and top_k.
+#   vocab.json          Token strings, indexed by token ID.
+#   {source}.{name}.npy For each source, offsets (vocab_size + 1), layer_indices, neuron_indices and
+#                       strengths. The top neurons for token t are entries offsets[t] to
+#                       offsets[t + 1], in descending order of absolute strength.
+#
+# To build an index from packed tables:
+#
+#   python -m neuron_explainer.activations.token_neuron_index <output_dir> <packed_table_dir>...
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+from neuron_explainer.activations.activations import NeuronId
+from neuron_explainer.activations.packed_token_connections import PackedTokenConnections
+
+_ARRAY_NAMES = ("offsets", "layer_indices", "neuron_indices", "strengths")
+
+
+@dataclass
+class TokenNeuronConnection:
+    neuron_id: NeuronId
+    strength: float
+
+
+def _invert_list(
+    table: PackedTokenConnections,
+    list_index: int,
+    global_token_ids: np.ndarray,
+    vocab_size: int,
+    top_k: int,
+) -> dict[str, np.ndarray]:
+    """Return the top_k neurons for each token in one list of a table, across all layers."""
+    # Start with empty arrays so that concatenation works for tables without layers.
+    token_ids = [np.zeros(0, dtype=np.int64)]
+    layer_indices = [np.zeros(0, dtype=np.int16)]
+    neuron_indices = [np.zeros(0, dtype=np.int32)]
+    strengths = [np.zeros(0, dtype=np.float32)]
+    num_lists = len(table.list_names)
+    for layer_index in sorted(table.num_neurons_by_layer):
+        layer = table.get_layer_arrays(layer_index)
+        lengths = np.diff(layer["offsets"])
+        entry_lists = np.repeat(np.arange(len(lengths)), lengths)
+        mask = entry_lists % num_lists == list_index
+        token_ids.append(global_token_ids[layer["token_ids"][mask]])
+        layer_indices.append(np.full(int(mask.sum()), layer_index, dtype=np.int16))
+        neuron_indices.append((entry_lists[mask] // num_lists).astype(np.int32))
+        strengths.append(np.asarray(layer["strengths"][mask], dtype=np.float32))
+    all_token_ids = np.concatenate(token_ids)
+    all_strengths = np.concatenate(strengths)
+    order = np.lexsort((-np.abs(all_strengths), all_token_ids))
+    sorted_token_ids = all_token_ids[order]
+    counts = np.bincount(sorted_token_ids, minlength=vocab_size)
+    starts = np.zeros(vocab_size + 1, dtype=np.int64)
+    starts[1:] = np.cumsum(counts)
+    # Each entry's rank among the entries for the same token.
+    ranks = np.arange(len(order)) - starts[sorted_token_ids]
+    keep = order[ranks < top_k]
+    offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.minimum(counts, top_k))
+    return {
+        "offsets": offsets,
+        "layer_indices": np.concatenate(layer_indices)[keep],
+        "neuron_indices": np.concatenate(neuron_indices)[keep],
+        "strengths": all_strengths[keep],
+    }
+
+
+class TokenNeuronIndex:
+    """Top neurons for each token, across all layers. Load with TokenNeuronIndex(path)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "metadata.json")) as f:
+            metadata = json.load(f)
+        self.sources: list[str] = metadata["sources"]
+        self.top_k: int = metadata["top_k"]
+        with open(os.path.join(path, "vocab.json")) as f:
+            self.vocab: list[str] = json.load(f)
+        self._token_ids = {token: i for i, token in enumerate(self.vocab)}
+        self._arrays = {
+            source: {
+                name: np.load(os.path.join(path, f"{source}.{name}.npy"), mmap_mode="r")
+                for name in _ARRAY_NAMES
+            }
+            for source in self.sources
+        }
+
+    @staticmethod
+    def build(
+        output_dir: str, tables: Sequence[PackedTokenConnections], top_k: int = 100
+    ) -> TokenNeuronIndex:
+        """Invert every list of the given packed tables, keeping the top_k neurons per token."""
+        vocab: list[str] = []
+        token_ids_by_token: dict[str, int] = {}
+        global_token_ids_by_table = []
+        for table in tables:
+            for token in table.vocab:
+                if token not in token_ids_by_token:
+                    token_ids_by_token[token] = len(vocab)
+                    vocab.append(token)
+            global_token_ids_by_table.append(
+                np.array([token_ids_by_token[token] for token in table.vocab], dtype=np.int64)
+            )
+        os.makedirs(output_dir, exist_ok=True)
+        sources = []
+        for table, global_token_ids in zip(tables, global_token_ids_by_table):
+            for list_index, list_name in enumerate(table.list_names):
+                source = f"{table.kind}.{list_name}"
+                arrays = _invert_list(table, list_index, global_token_ids, len(vocab), top_k)
+                for name in _ARRAY_NAMES:
+                    np.save(os.path.join(output_dir, f"{source}.{name}.npy"), arrays[name])
+                sources.append(source)
+        with open(os.path.join(output_dir, "vocab.json"), "w") as f:
+            json.dump(vocab, f)
+        # metadata.json is written last, so a partially written index can't be loaded.
+        with open(os.path.join(output_dir, "metadata.json"), "w") as f:
+            json.dump({"sources": sources, "top_k": top_k}, f)
+        return TokenNeuronIndex(output_dir)
+
+    def get_top_neurons(
+        self, token: str, source: str, limit: Optional[int] = None
+    ) -> list[TokenNeuronConnection]:
+        """
+        Return the neurons most strongly associated with the token according to one source, in
+        descending order of absolute strength. Tokens must match exactly, including leading spaces.
+        """
+        if source not in self._arrays:
+            raise ValueError(f"Unknown source {source}, expected one of {self.sources}")
+        token_id = self._token_ids.get(token)
+        if token_id is None:
+            return []
+        arrays = self._arrays[source]
+        start, end = int(arrays["offsets"][token_id]), int(arrays["offsets"][token_id + 1])
+        if limit is not None:
+            end = min(end, start + limit)
+        return [
+            TokenNeuronConnection(
+                neuron_id=NeuronId(layer_index=layer_index, neuron_index=neuron_index),
+                strength=strength,
+            )
+            for layer_index, neuron_index, strength in zip(
+                arrays["layer_indices"][start:end].tolist(),
+                arrays["neuron_indices"][start:end].tolist(),
+                arrays["strengths"][start:end].tolist(),
+            )
+        ]
+
+    def get_top_neurons_by_source(
+        self, token: str, limit: Optional[int] = None
+    ) -> dict[str, list[TokenNeuronConnection]]:
+        return {source: self.get_top_neurons(token, source, limit) for source in self.sources}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build a token to top neurons index.")
+    parser.add_argument("output_dir")
+    parser.add_argument("packed_table_dirs", nargs="+")
+    parser.add_argument("--top_k", type=int, default=100)
+    args = parser.parse_args()
+    tables = [PackedTokenConnections(path) for path in args.packed_table_dirs]
+    index = TokenNeuronIndex.build(args.output_dir, tables, top_k=args.top_k)
+    print(f"Indexed {len(index.vocab)} tokens from {len(index.sources)} sources")
+
+
+if __name__ == "__main__":
+    main()
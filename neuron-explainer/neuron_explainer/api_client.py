@@ -1,47 +1,281 @@
+from __future__ import annotations
+
 import asyncio
 import contextlib
+import email.utils
 import os
 import random
+import time
 import traceback
 from asyncio import Semaphore
+from collections import deque
+from collections.abc import Hashable
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from functools import wraps
-from typing import Any, Callable, Optional
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Optional, TypeVar
 
-import httpx
 import orjson
+from neuron_explainer.tracing import get_trace_attributes, span, traced
 
+if TYPE_CHECKING:
+    import httpx
+
+T = TypeVar("T")
+
+
+@dataclass
+class ErrorClassification:
+    """How a RetryPolicy should handle an exception raised by a request."""
+
+    retry: bool
+    """Whether the request should be retried."""
+    backend_failure: bool = False
+    """Whether the error suggests the backend is unhealthy. Counted by the circuit breaker."""
+    retry_after_s: Optional[float] = None
+    """The minimum delay before retrying requested by the server via the Retry-After header."""
+
+
+# Status codes that are worth retrying, in addition to all 5xx codes.
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+def _get_error_data(response: httpx.Response) -> dict[str, Any]:
+    """Return the "error" object from an API error response, or {} if it can't be parsed."""
+    try:
+        data = response.json()
+    except ValueError:
+        return {}
+    error_data = data.get("error") if isinstance(data, dict) else None
+    return error_data if isinstance(error_data, dict) else {}
+
+
+def _get_retry_after_s(response: httpx.Response) -> Optional[float]:
+    """Parse the Retry-After header (in seconds or as an HTTP date), if present."""
+    retry_after_ms = response.headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+    retry_after = response.headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def classify_api_error(err: Exception) -> ErrorClassification:
+    """Decide whether an exception raised while making an API request should be retried."""
+    # httpx is imported lazily since importing it is relatively slow.
+    import httpx
 
-def is_api_error(err: Exception) -> bool:
     if isinstance(err, httpx.HTTPStatusError):
         response = err.response
-        error_data = response.json().get("error", {})
+        error_data = _get_error_data(response)
         error_message = error_data.get("message")
-        if response.status_code in [400, 404, 415]:
-            if error_data.get("type") == "idempotency_error":
-                print(f"Retrying after idempotency error: {error_message} ({response.url})")
-                return True
-            else:
-                # Invalid request
-                return False
-        else:
-            print(f"Retrying after API error: {error_message} ({response.url})")
-            return True
+        status_code = response.status_code
+        if error_data.get("type") == "idempotency_error":
+            print(f"Retrying after idempotency error: {error_message} ({response.url})")
+            return ErrorClassification(retry=True)
+        if status_code in RETRYABLE_STATUS_CODES or status_code >= 500:
+            print(f"Retrying after API error {status_code}: {error_message} ({response.url})")
+            return ErrorClassification(
+                retry=True,
+                backend_failure=status_code >= 500,
+                retry_after_s=_get_retry_after_s(response),
+            )
+        # Invalid request
+        return ErrorClassification(retry=False)
 
     elif isinstance(err, httpx.ConnectError):
         print(f"Retrying after connection error... ({err.request.url})")
-        return True
+        return ErrorClassification(retry=True, backend_failure=True)
 
     elif isinstance(err, httpx.TimeoutException):
         print(f"Retrying after a timeout error... ({err.request.url})")
-        return True
+        return ErrorClassification(retry=True, backend_failure=True)
+
+    elif isinstance(err, httpx.TransportError):
+        print(f"Retrying after a transport error: {repr(err)}")
+        return ErrorClassification(retry=True, backend_failure=True)
+
+    print(f"Not retrying after an unexpected error: {repr(err)}")
+    return ErrorClassification(retry=False)
+
+
+def is_api_error(err: Exception) -> bool:
+    """Return whether an exception raised while making an API request should be retried."""
+    return classify_api_error(err).retry
+
 
-    elif isinstance(err, httpx.ReadError):
-        print(f"Retrying after a read error... ({err.request.url})")
-        return True
+class CircuitBreaker:
+    """
+    Pauses requests from all clients while the backend is failing, instead of letting every
+    request retry against it independently.
+
+    After failure_threshold consecutive backend failures, the circuit opens and requests wait for
+    cooldown_s. Then a single probe request is let through. If it succeeds, the circuit closes;
+    otherwise it reopens with double the cooldown, up to max_cooldown_s. Waiting requests poll at
+    jittered intervals so they don't resume in lockstep.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 20,
+        cooldown_s: float = 10.0,
+        max_cooldown_s: float = 300.0,
+        poll_interval_s: float = 1.0,
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.max_cooldown_s = max_cooldown_s
+        self.poll_interval_s = poll_interval_s
+        self._consecutive_failures = 0
+        self._current_cooldown_s = cooldown_s
+        self._open_until: Optional[float] = None
+        """time.monotonic() value after which a probe request may be sent, or None if closed."""
+        self._probe_in_flight = False
 
-    print(f"Retrying after an unexpected error: {repr(err)}")
-    traceback.print_tb(err.__traceback__)
-    return True
+    @property
+    def is_open(self) -> bool:
+        return self._open_until is not None
+
+    def record_success(self) -> None:
+        """Record that the backend handled a request (even if the request itself was invalid)."""
+        self._consecutive_failures = 0
+        self._current_cooldown_s = self.cooldown_s
+        self._open_until = None
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """Record a request that failed because of the backend."""
+        self._consecutive_failures += 1
+        if self._probe_in_flight:
+            self._probe_in_flight = False
+            self._current_cooldown_s = min(self._current_cooldown_s * 2, self.max_cooldown_s)
+            self._open()
+        elif self._open_until is None and self._consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def abandon_probe(self) -> None:
+        """Let another request probe the backend, e.g. because the probe request was cancelled."""
+        self._probe_in_flight = False
+
+    def _open(self) -> None:
+        print(
+            f"Pausing requests for {self._current_cooldown_s:.0f}s after "
+            f"{self._consecutive_failures} consecutive backend failures"
+        )
+        self._open_until = time.monotonic() + self._current_cooldown_s
+
+    async def wait_until_closed(self) -> bool:
+        """
+        Wait until a request may be sent. Returns True if the caller was chosen to send the probe
+        request, in which case it must report the outcome via record_success, record_failure or
+        abandon_probe.
+        """
+        if self._open_until is None:
+            return False
+        with span("circuit_breaker_wait"):
+            while self._open_until is not None:
+                now = time.monotonic()
+                if now >= self._open_until and not self._probe_in_flight:
+                    self._probe_in_flight = True
+                    return True
+                wait_s = max(self._open_until - now, 0.0) + random.uniform(
+                    0.5 * self.poll_interval_s, 1.5 * self.poll_interval_s
+                )
+                await asyncio.sleep(wait_s)
+        return False
+
+
+_circuit_breaker = CircuitBreaker()
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    return _circuit_breaker
+
+
+def set_circuit_breaker(circuit_breaker: CircuitBreaker) -> None:
+    """Replace the process-wide circuit breaker used by default by all RetryPolicy instances."""
+    global _circuit_breaker
+    _circuit_breaker = circuit_breaker
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Retries failed requests with exponential backoff and jitter, honoring Retry-After headers, up to
+    a retry limit and a total deadline per request.
+    """
+
+    init_delay_s: float = 1.0
+    max_delay_s: float = 10.0
+    backoff_multiplier: float = 2.0
+    jitter: float = 0.2
+    max_tries: int = 200
+    deadline_s: Optional[float] = 30 * 60
+    """Give up if a retry would start more than this long after the first attempt."""
+    max_retry_after_s: float = 120.0
+    """Upper bound on the delay requested by a Retry-After header."""
+    classify_error: Callable[[Exception], ErrorClassification] = classify_api_error
+    circuit_breaker: Optional[CircuitBreaker] = field(default_factory=get_circuit_breaker)
+    """Defaults to the process-wide circuit breaker. None to disable circuit breaking."""
+
+    async def call(self, f: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        """Call the async function f, retrying it according to this policy."""
+        start_time_s = time.monotonic()
+        delay_s = self.init_delay_s
+        for i in range(self.max_tries):
+            is_probe = False
+            if self.circuit_breaker is not None:
+                is_probe = await self.circuit_breaker.wait_until_closed()
+            try:
+                result = await f(*args, **kwargs)
+            except Exception as err:
+                classification = self.classify_error(err)
+                if self.circuit_breaker is not None:
+                    if classification.backend_failure:
+                        self.circuit_breaker.record_failure()
+                    else:
+                        self.circuit_breaker.record_success()
+                if not classification.retry or i == self.max_tries - 1:
+                    raise
+                jittered_delay_s = random.uniform(
+                    delay_s * (1 - self.jitter), delay_s * (1 + self.jitter)
+                )
+                if classification.retry_after_s is not None:
+                    jittered_delay_s = max(
+                        jittered_delay_s, min(classification.retry_after_s, self.max_retry_after_s)
+                    )
+                if (
+                    self.deadline_s is not None
+                    and time.monotonic() - start_time_s + jittered_delay_s > self.deadline_s
+                ):
+                    raise
+                with span("retry_backoff", attempt=i, error=type(err).__name__):
+                    await asyncio.sleep(jittered_delay_s)
+                delay_s = min(delay_s * self.backoff_multiplier, self.max_delay_s)
+            except BaseException:
+                # E.g. the request was cancelled, so it can't report whether the backend is healthy.
+                if is_probe and self.circuit_breaker is not None:
+                    self.circuit_breaker.abandon_probe()
+                raise
+            else:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_success()
+                return result
+        raise AssertionError("unreachable")
 
 
 def exponential_backoff(
@@ -52,45 +286,224 @@ def exponential_backoff(
     function returns True for the exception, applying exponential backoff with jitter after
     failures, up to a retry limit.
     """
-    init_delay_s = 1.0
-    max_delay_s = 10.0
-    # Roughly 30 minutes before we give up.
-    max_tries = 200
-    backoff_multiplier = 2.0
-    jitter = 0.2
+    retry_policy = RetryPolicy(
+        deadline_s=None,
+        classify_error=lambda err: ErrorClassification(retry=retry_on(err)),
+        circuit_breaker=None,
+    )
 
     def decorate(f: Callable) -> Callable:
         assert asyncio.iscoroutinefunction(f)
 
         @wraps(f)
-        async def f_retry(*args: Any, **kwargs: Any) -> None:
-            delay_s = init_delay_s
-            for i in range(max_tries):
-                try:
-                    return await f(*args, **kwargs)
-                except Exception as err:
-                    if not retry_on(err) or i == max_tries - 1:
-                        raise
-                    jittered_delay = random.uniform(delay_s * (1 - jitter), delay_s * (1 + jitter))
-                    await asyncio.sleep(jittered_delay)
-                    delay_s = min(delay_s * backoff_multiplier, max_delay_s)
+        async def f_retry(*args: Any, **kwargs: Any) -> Any:
+            return await retry_policy.call(f, *args, **kwargs)
 
         return f_retry
 
     return decorate
 
 
-API_KEY = os.getenv("OPENAI_API_KEY")
-assert API_KEY, "Please set the OPENAI_API_KEY environment variable"
-API_HTTP_HEADERS = {
-    "Content-Type": "application/json",
-    "Authorization": "Bearer " + API_KEY,
-}
 BASE_API_URL = "https://api.openai.com/v1"
 
 
+def get_api_http_headers() -> dict[str, str]:
+    """
+    Return the headers for API requests. The API key is read when a request is made rather than at
+    import time, so modules that use ApiClient can be imported without credentials.
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    assert api_key, "Please set the OPENAI_API_KEY environment variable"
+    return {
+        "Content-Type": "application/json",
+        "Authorization": "Bearer " + api_key,
+    }
+
+
+@dataclass
+class HedgingPolicy:
+    """
+    Configuration for hedged requests: if a request hasn't returned after a high percentile of
+    recent request latencies, a duplicate request is sent and whichever response arrives first is
+    used. The other request is cancelled.
+    """
+
+    latency_percentile: float = 95.0
+    """Percentile of recent latencies after which a duplicate request is sent."""
+    max_hedged_fraction: float = 0.05
+    """At most this fraction of requests are hedged, bounding the extra cost."""
+    min_latency_samples: int = 20
+    """Requests are not hedged until this many latencies have been observed."""
+    latency_window_size: int = 1000
+    """The number of recent latencies used to compute the percentile."""
+
+
+async def _first_successful(tasks: list[asyncio.Future]) -> Any:
+    """Return the result of the first task to succeed, or raise the last error if all fail."""
+    pending = set(tasks)
+    error: Optional[BaseException] = None
+    while len(pending) > 0:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                return task.result()
+            error = task.exception()
+    assert error is not None
+    raise error
+
+
+EXPLANATION_REQUEST_CLASS = "explanation"
+SIMULATION_REQUEST_CLASS = "simulation"
+DEFAULT_REQUEST_CLASS = "default"
+# Explanation requests are few and gate the next neurons, so they get a larger share of the slots
+# than the many simulation requests when both are queued.
+DEFAULT_REQUEST_CLASS_WEIGHTS = {EXPLANATION_REQUEST_CLASS: 4.0, SIMULATION_REQUEST_CLASS: 1.0}
+
+
+class _StrideQueue:
+    """
+    Weighted fair queue using stride scheduling: pop() returns the oldest item of the non-empty key
+    that would have received the smallest share of pops relative to its weight after this one.
+    """
+
+    def __init__(self, weight_for_key: Callable[[Hashable], float] = lambda key: 1.0):
+        self._weight_for_key = weight_for_key
+        self._items_by_key: dict[Hashable, deque] = {}
+        self._passes_by_key: dict[Hashable, float] = {}
+        self._virtual_time = 0.0
+        self._num_items = 0
+
+    def __len__(self) -> int:
+        return self._num_items
+
+    def push(self, key: Hashable, item: Any) -> None:
+        if key not in self._items_by_key:
+            self._items_by_key[key] = deque()
+            # Keys that were idle don't get credit for the time they weren't queued.
+            self._passes_by_key[key] = max(self._passes_by_key.get(key, 0.0), self._virtual_time)
+        self._items_by_key[key].append(item)
+        self._num_items += 1
+
+    def pop(self) -> tuple[Hashable, Any]:
+        key = min(
+            self._items_by_key,
+            # Break ties in favor of the higher weight.
+            key=lambda key: (
+                self._passes_by_key[key] + 1 / self._weight_for_key(key),
+                -self._weight_for_key(key),
+            ),
+        )
+        items = self._items_by_key[key]
+        item = items.popleft()
+        self._num_items -= 1
+        self._virtual_time = self._passes_by_key[key]
+        self._passes_by_key[key] += 1 / self._weight_for_key(key)
+        if len(items) == 0:
+            del self._items_by_key[key]
+            if len(self._passes_by_key) > 2 * len(self._items_by_key) + 16:
+                self._prune_passes()
+        return key, item
+
+    def _prune_passes(self) -> None:
+        """Forget idle keys whose pass would be reset to the virtual time anyway."""
+        self._passes_by_key = {
+            key: pass_
+            for key, pass_ in self._passes_by_key.items()
+            if key in self._items_by_key or pass_ > self._virtual_time
+        }
+
+
+class RequestScheduler:
+    """
+    Limits the number of concurrent HTTP requests across all ApiClients that share it, granting
+    free slots by weighted fair queuing: first between request classes (e.g. explanation vs.
+    simulation), according to class_weights, then equally between the neurons within a class.
+    Neurons are identified by the layer_index and neuron_index trace attributes (see
+    neuron_explainer.tracing.trace_attributes), so that one neuron's burst of simulations doesn't
+    starve the others.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        class_weights: Optional[dict[str, float]] = None,
+    ):
+        self.max_concurrent = max_concurrent
+        self.class_weights = (
+            class_weights if class_weights is not None else DEFAULT_REQUEST_CLASS_WEIGHTS
+        )
+        self._available_slots = max_concurrent
+        self._class_queue = _StrideQueue(lambda key: self.class_weights.get(str(key), 1.0))
+        self._neuron_queues_by_class: dict[str, _StrideQueue] = {}
+
+    @property
+    def num_waiting(self) -> int:
+        return len(self._class_queue)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, request_class: str = DEFAULT_REQUEST_CLASS) -> AsyncIterator[None]:
+        """Wait for a free slot, and hold it for the duration of the async with block."""
+        await self._acquire(request_class)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, request_class: str) -> None:
+        if self._available_slots > 0 and len(self._class_queue) == 0:
+            self._available_slots -= 1
+            return
+        trace_attributes = get_trace_attributes()
+        neuron_key = (trace_attributes.get("layer_index"), trace_attributes.get("neuron_index"))
+        future = asyncio.get_running_loop().create_future()
+        if request_class not in self._neuron_queues_by_class:
+            self._neuron_queues_by_class[request_class] = _StrideQueue()
+        self._class_queue.push(request_class, None)
+        self._neuron_queues_by_class[request_class].push(neuron_key, future)
+        try:
+            with span("RequestScheduler.wait", request_class=request_class):
+                await future
+        except asyncio.CancelledError:
+            # If the slot was granted just before cancellation, give it to someone else.
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self._available_slots += 1
+        while self._available_slots > 0 and len(self._class_queue) > 0:
+            request_class, _ = self._class_queue.pop()
+            _, future = self._neuron_queues_by_class[request_class].pop()
+            if future.done():
+                # The waiter was cancelled.
+                continue
+            self._available_slots -= 1
+            future.set_result(None)
+
+
+_request_scheduler: Optional[RequestScheduler] = None
+
+
+def get_request_scheduler() -> Optional[RequestScheduler]:
+    return _request_scheduler
+
+
+def set_request_scheduler(request_scheduler: Optional[RequestScheduler]) -> None:
+    """
+    Set the process-wide scheduler used by ApiClients that weren't given one explicitly. Pass None
+    to disable scheduling.
+    """
+    global _request_scheduler
+    _request_scheduler = request_scheduler
+
+
 class ApiClient:
-    """Performs inference using the OpenAI API. Supports response caching and concurrency limits."""
+    """
+    Performs inference using the OpenAI API. Supports response caching and concurrency limits.
+
+    HTTP connections are pooled, so whoever creates a client must call aclose() when done with it.
+    Simulators and explainers that create their own client close it in their own aclose().
+    """
 
     def __init__(
         self,
@@ -99,8 +512,33 @@ class ApiClient:
         max_concurrent: Optional[int] = None,
         # Whether to cache request/response pairs in memory to avoid duplicating requests.
         cache: bool = False,
+        # If set, slow requests are hedged by sending a duplicate request. See HedgingPolicy.
+        hedging_policy: Optional[HedgingPolicy] = None,
+        # How failed requests are retried. Defaults to RetryPolicy(), which uses the process-wide
+        # circuit breaker.
+        retry_policy: Optional[RetryPolicy] = None,
+        # Which class of request this client makes, for prioritization by the RequestScheduler.
+        request_class: str = DEFAULT_REQUEST_CLASS,
+        # Scheduler for concurrency slots shared with other clients. Defaults to the process-wide
+        # scheduler (see set_request_scheduler), if any. Applies in addition to max_concurrent.
+        request_scheduler: Optional[RequestScheduler] = None,
+        # If set, HTTP requests are sent through this transport, e.g. an httpx.MockTransport in
+        # tests.
+        http_transport: Optional[httpx.AsyncBaseTransport] = None,
     ):
         self.model_name = model_name
+        self.max_concurrent = max_concurrent
+        self.request_class = request_class
+        self.request_scheduler = request_scheduler
+        self._http_transport = http_transport
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.hedging_policy = hedging_policy
+        # Latencies of recent successful HTTP requests, used to decide when to hedge.
+        self._latencies_s: deque[float] = deque(
+            maxlen=hedging_policy.latency_window_size if hedging_policy is not None else 0
+        )
+        self.num_requests = 0
+        self.num_hedged_requests = 0
 
         if max_concurrent is not None:
             self._concurrency_check: Optional[Semaphore] = Semaphore(max_concurrent)
@@ -112,31 +550,166 @@ class ApiClient:
         else:
             self._cache = None
 
-    @exponential_backoff(retry_on=is_api_error)
+        # Connections are pooled across requests. httpx clients can't be shared across event loops,
+        # so we track which loop the client was created on.
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._http_client is not None and self._http_client_loop is not loop:
+            self._discard_http_client()
+        if self._http_client is None:
+            # Concurrency is limited by max_concurrent and the request scheduler, where it's visible
+            # to the hedge timers, so httpx's default cap of 100 connections is lifted. Requests
+            # over that cap would otherwise queue inside httpx.
+            self._http_client = httpx.AsyncClient(
+                transport=self._http_transport,
+                limits=httpx.Limits(
+                    max_connections=None, max_keepalive_connections=self.max_concurrent
+                ),
+            )
+            self._http_client_loop = loop
+        return self._http_client
+
+    def _discard_http_client(self) -> None:
+        """Close a pooled client that belongs to another event loop, or abandon it if we can't."""
+        http_client, loop = self._http_client, self._http_client_loop
+        self._http_client = None
+        self._http_client_loop = None
+        if http_client is None or loop is None:
+            return
+        if loop.is_running() and not loop.is_closed():
+            # The client's connections can only be closed on the loop that opened them.
+            asyncio.run_coroutine_threadsafe(http_client.aclose(), loop)
+        # Otherwise the loop has stopped (e.g. asyncio.run returned), so the client can't be closed
+        # gracefully. Dropping the last reference releases its sockets when it's garbage collected.
+
+    async def aclose(self) -> None:
+        """Close pooled connections."""
+        if self._http_client is not None:
+            if self._http_client_loop is asyncio.get_running_loop():
+                await self._http_client.aclose()
+                self._http_client = None
+                self._http_client_loop = None
+            else:
+                self._discard_http_client()
+
+    def _get_hedge_delay_s(self) -> Optional[float]:
+        """Return how long to wait before hedging the next request, or None to not hedge it."""
+        policy = self.hedging_policy
+        if policy is None or len(self._latencies_s) < policy.min_latency_samples:
+            return None
+        if self.num_hedged_requests >= policy.max_hedged_fraction * self.num_requests:
+            return None
+        sorted_latencies_s = sorted(self._latencies_s)
+        index = int(len(sorted_latencies_s) * policy.latency_percentile / 100)
+        return sorted_latencies_s[min(index, len(sorted_latencies_s) - 1)]
+
+    @contextlib.asynccontextmanager
+    async def _request_slot(self) -> AsyncIterator[None]:
+        """Wait for the scheduler and concurrency limits to allow a request, and hold the slot."""
+        async with contextlib.AsyncExitStack() as stack:
+            # Wait for this client's own limit first, so that a request blocked by it doesn't hold
+            # a shared slot that requests from other clients could use.
+            if self._concurrency_check is not None:
+                await stack.enter_async_context(self._concurrency_check)
+            request_scheduler = self.request_scheduler or get_request_scheduler()
+            if request_scheduler is not None:
+                await stack.enter_async_context(request_scheduler.slot(self.request_class))
+            yield
+
+    async def _send_request(
+        self, url: str, json: dict[str, Any], timeout_seconds: Optional[int]
+    ) -> httpx.Response:
+        """Send one HTTP request. Callers must hold a slot from _request_slot."""
+        http_client = self._get_http_client()
+        start_time_s = time.perf_counter()
+        response = await http_client.post(
+            url, headers=get_api_http_headers(), json=json, timeout=timeout_seconds
+        )
+        self._latencies_s.append(time.perf_counter() - start_time_s)
+        return response
+
+    async def _send_request_in_slot(
+        self,
+        url: str,
+        json: dict[str, Any],
+        timeout_seconds: Optional[int],
+        slot_acquired: Optional[asyncio.Event] = None,
+    ) -> httpx.Response:
+        async with self._request_slot():
+            if slot_acquired is not None:
+                slot_acquired.set()
+            return await self._send_request(url, json, timeout_seconds)
+
+    async def _post(
+        self, url: str, json: dict[str, Any], timeout_seconds: Optional[int]
+    ) -> httpx.Response:
+        """Send a single API request, hedging it if a HedgingPolicy is configured."""
+        self.num_requests += 1
+        hedge_delay_s = self._get_hedge_delay_s()
+        if hedge_delay_s is None:
+            return await self._send_request_in_slot(url, json, timeout_seconds)
+        slot_acquired = asyncio.Event()
+        tasks = [
+            asyncio.ensure_future(
+                self._send_request_in_slot(url, json, timeout_seconds, slot_acquired)
+            )
+        ]
+        slot_acquired_task = asyncio.ensure_future(slot_acquired.wait())
+        try:
+            # The hedge timer only starts once the request is sent, so that requests that are merely
+            # queued aren't hedged, which would add to the queue when it's already saturated.
+            await asyncio.wait([tasks[0], slot_acquired_task], return_when=asyncio.FIRST_COMPLETED)
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay_s)
+            if len(done) > 0:
+                return tasks[0].result()
+            self.num_hedged_requests += 1
+            with span("ApiClient.hedged_request", hedge_delay_s=hedge_delay_s):
+                # The hedge needs its own slot, so it counts against max_concurrent and the
+                # scheduler's fair share like any other request.
+                tasks.append(
+                    asyncio.ensure_future(self._send_request_in_slot(url, json, timeout_seconds))
+                )
+                return await _first_successful(tasks)
+        finally:
+            slot_acquired_task.cancel()
+            for task in tasks:
+                task.cancel()
+
+    @traced("ApiClient.make_request")
     async def make_request(
         self, timeout_seconds: Optional[int] = None, **kwargs: Any
+    ) -> dict[str, Any]:
+        return await self.retry_policy.call(self._make_request, timeout_seconds, **kwargs)
+
+    async def _make_request(
+        self, timeout_seconds: Optional[int] = None, **kwargs: Any
     ) -> dict[str, Any]:
         if self._cache is not None:
             key = orjson.dumps(kwargs)
             if key in self._cache:
                 return self._cache[key]
-        async with contextlib.AsyncExitStack() as stack:
-            if self._concurrency_check is not None:
-                await stack.enter_async_context(self._concurrency_check)
-            http_client = await stack.enter_async_context(
-                httpx.AsyncClient(timeout=timeout_seconds)
-            )
-            # If the request has a "messages" key, it should be sent to the /chat/completions
-            # endpoint. Otherwise, it should be sent to the /completions endpoint.
-            url = BASE_API_URL + ("/chat/completions" if "messages" in kwargs else "/completions")
-            kwargs["model"] = self.model_name
-            response = await http_client.post(url, headers=API_HTTP_HEADERS, json=kwargs)
+        # If the request has a "messages" key, it should be sent to the /chat/completions
+        # endpoint, and if it has an "input" key, to the /embeddings endpoint. Otherwise, it should
+        # be sent to the /completions endpoint.
+        if "messages" in kwargs:
+            url = BASE_API_URL + "/chat/completions"
+        elif "input" in kwargs:
+            url = BASE_API_URL + "/embeddings"
+        else:
+            url = BASE_API_URL + "/completions"
+        kwargs["model"] = self.model_name
+        response = await self._post(url, kwargs, timeout_seconds)
         # The response json has useful information but the exception doesn't include it, so print it
         # out then reraise.
         try:
             response.raise_for_status()
         except Exception as e:
-            print(response.json())
+            print(response.text)
             raise e
         if self._cache is not None:
             self._cache[key] = response.json()
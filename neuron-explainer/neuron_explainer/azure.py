@@ -1,5 +1,52 @@
+import contextlib
+import inspect
+from functools import wraps
+from typing import Any, AsyncIterator, Callable
+
+
 def standardize_azure_url(url):
     """Make sure url is converted to url format, not an azure path"""
     if url.startswith("az://openaipublic/"):
         url = url.replace("az://openaipublic/", "https://openaipublic.blob.core.windows.net/")
     return url
+
+
+@contextlib.asynccontextmanager
+async def _session_context() -> AsyncIterator[None]:
+    from boostedblob.globals import config, session_context
+
+    async with session_context():
+        # boostedblob creates the session lazily, on the first request. Create it up front, so that
+        # concurrent calls nested in this one see it as preexisting and don't close it when they
+        # finish, while the others are still using it.
+        config.session
+        yield
+
+
+def ensure_session(f: Callable) -> Callable:
+    """
+    Equivalent to boostedblob.ensure_session, but imports boostedblob when the wrapped function is
+    first called rather than when it's decorated, since importing boostedblob is slow. Async
+    generators are also supported: the session stays open until the generator finishes or is
+    closed.
+
+    Functions that make concurrent calls to other wrapped functions must be wrapped themselves, so
+    that the calls share the outer session.
+    """
+
+    if inspect.isasyncgenfunction(f):
+
+        @wraps(f)
+        async def generator_wrapper(*args: Any, **kwargs: Any) -> Any:
+            async with _session_context():
+                async for item in f(*args, **kwargs):
+                    yield item
+
+        return generator_wrapper
+
+    @wraps(f)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        async with _session_context():
+            return await f(*args, **kwargs)
+
+    return wrapper
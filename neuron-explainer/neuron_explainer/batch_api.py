@@ -0,0 +1,331 @@
+# Batch mode for ApiClient. Requests are accumulated into JSONL files and submitted to the batch
+# API, which has lower cost and higher rate limits than synchronous requests but may take hours to
+# complete. Intended for large offline sweeps, e.g. scoring explanations for every neuron.
+#
+# Example usage:
+#
+#   api_client = BatchApiClient(model_name="gpt-4", batch_config=BatchConfig(max_wait_s=600))
+#   simulator = ExplanationNeuronSimulator(model_name, explanation, api_client=api_client)
+#   ...  # Use the simulator as usual. Requests are resolved as their batches complete.
+#
+# LocalBatchServer is an in-process stand-in for the batch endpoints, for testing without network
+# access.
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import urllib.parse
+from dataclasses import dataclass
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Any, Callable, Optional
+
+import httpx
+import orjson
+from neuron_explainer.api_client import (
+    BASE_API_URL,
+    DEFAULT_REQUEST_CLASS,
+    ApiClient,
+    RetryPolicy,
+    get_api_http_headers,
+)
+from neuron_explainer.tracing import span
+
+TERMINAL_BATCH_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+@dataclass
+class BatchConfig:
+    """Controls how BatchApiClient groups requests into batches and polls for their results."""
+
+    max_batch_size: int = 10_000
+    """A batch is submitted as soon as it has this many requests."""
+    max_wait_s: float = 60.0
+    """A partial batch is submitted once its oldest request has waited this long."""
+    poll_interval_s: float = 60.0
+    """How often to check the status of submitted batches."""
+    completion_window: str = "24h"
+
+
+@dataclass
+class _PendingRequest:
+    custom_id: str
+    body: dict[str, Any]
+    future: asyncio.Future
+
+
+class BatchApiClient(ApiClient):
+    """
+    ApiClient that submits requests through the batch API instead of making them synchronously.
+    make_request() resolves once the batch containing the request has completed.
+
+    Failed requests are retried in a later batch according to the retry policy. Requests in expired
+    or cancelled batches are treated as timeouts (HTTP 408), so they are retried too. The default
+    retry policy has no deadline, since a batch can take up to its completion window (24 hours by
+    default) to expire. Hedging, timeout_seconds and the request scheduler don't apply in batch
+    mode.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        batch_config: Optional[BatchConfig] = None,
+        cache: bool = False,
+        retry_policy: Optional[RetryPolicy] = None,
+        request_class: str = DEFAULT_REQUEST_CLASS,
+        http_transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        super().__init__(
+            model_name=model_name,
+            cache=cache,
+            retry_policy=retry_policy if retry_policy is not None else RetryPolicy(deadline_s=None),
+            request_class=request_class,
+            http_transport=http_transport,
+        )
+        self.batch_config = batch_config if batch_config is not None else BatchConfig()
+        self._pending_requests_by_endpoint: dict[str, list[_PendingRequest]] = {}
+        self._flush_handles_by_endpoint: dict[str, asyncio.TimerHandle] = {}
+        self._batch_tasks: set[asyncio.Task] = set()
+        self._request_ids = itertools.count()
+        self.num_batches_submitted = 0
+
+    async def _post(
+        self, url: str, json: dict[str, Any], timeout_seconds: Optional[int]
+    ) -> httpx.Response:
+        endpoint = urllib.parse.urlsplit(url).path
+        loop = asyncio.get_running_loop()
+        pending_request = _PendingRequest(
+            custom_id=f"request-{next(self._request_ids)}",
+            body=json,
+            future=loop.create_future(),
+        )
+        pending_requests = self._pending_requests_by_endpoint.setdefault(endpoint, [])
+        pending_requests.append(pending_request)
+        if len(pending_requests) >= self.batch_config.max_batch_size:
+            self._submit_pending_requests(endpoint)
+        elif len(pending_requests) == 1:
+            self._flush_handles_by_endpoint[endpoint] = loop.call_later(
+                self.batch_config.max_wait_s, self._submit_pending_requests, endpoint
+            )
+        return await pending_request.future
+
+    def flush(self) -> None:
+        """Submit all pending requests now, without waiting for max_wait_s."""
+        for endpoint in list(self._pending_requests_by_endpoint):
+            self._submit_pending_requests(endpoint)
+
+    def _submit_pending_requests(self, endpoint: str) -> None:
+        flush_handle = self._flush_handles_by_endpoint.pop(endpoint, None)
+        if flush_handle is not None:
+            flush_handle.cancel()
+        pending_requests = [
+            pending_request
+            for pending_request in self._pending_requests_by_endpoint.pop(endpoint, [])
+            # Skip requests whose callers have been cancelled.
+            if not pending_request.future.done()
+        ]
+        if len(pending_requests) == 0:
+            return
+        task = asyncio.ensure_future(self._run_batch(endpoint, pending_requests))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _batch_api_request(self, method: str, path: str, **kwargs: Any) -> httpx.Response:
+        response = await self._get_http_client().request(
+            method,
+            BASE_API_URL + path,
+            headers={k: v for k, v in get_api_http_headers().items() if k != "Content-Type"},
+            **kwargs,
+        )
+        response.raise_for_status()
+        return response
+
+    async def _run_batch(self, endpoint: str, pending_requests: list[_PendingRequest]) -> None:
+        try:
+            with span(
+                "BatchApiClient.batch", endpoint=endpoint, num_requests=len(pending_requests)
+            ):
+                batch, results_by_custom_id = await self._submit_and_wait(
+                    endpoint, pending_requests
+                )
+        except Exception as e:
+            for pending_request in pending_requests:
+                if not pending_request.future.done():
+                    pending_request.future.set_exception(e)
+            return
+        request = httpx.Request("POST", BASE_API_URL + endpoint.removeprefix("/v1"))
+        for pending_request in pending_requests:
+            if pending_request.future.done():
+                continue
+            result = results_by_custom_id.get(pending_request.custom_id)
+            if result is not None and result.get("response") is not None:
+                response = httpx.Response(
+                    result["response"]["status_code"],
+                    json=result["response"]["body"],
+                    request=request,
+                )
+            else:
+                error = result.get("error") if result is not None else None
+                message = (
+                    f"Batch {batch['id']} ended with status {batch['status']} without a result"
+                    f" for {pending_request.custom_id}: {error}"
+                )
+                # Failed batches were rejected as a whole (e.g. invalid input). Otherwise the
+                # request didn't complete in time, which is worth retrying.
+                status_code = 400 if batch["status"] == "failed" else 408
+                response = httpx.Response(
+                    status_code, json={"error": {"message": message}}, request=request
+                )
+            pending_request.future.set_result(response)
+
+    async def _submit_and_wait(
+        self, endpoint: str, pending_requests: list[_PendingRequest]
+    ) -> tuple[dict[str, Any], dict[str, dict[str, Any]]]:
+        """Submit a batch, wait for it to finish, and return it and its results by custom_id."""
+        input_file_contents = b"".join(
+            orjson.dumps(
+                {
+                    "custom_id": pending_request.custom_id,
+                    "method": "POST",
+                    "url": endpoint,
+                    "body": pending_request.body,
+                }
+            )
+            + b"\n"
+            for pending_request in pending_requests
+        )
+        # Each step is retried on its own, so that e.g. a failed poll doesn't resubmit the batch.
+        input_file = await self.retry_policy.call(
+            self._batch_api_request,
+            "POST",
+            "/files",
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", input_file_contents, "application/jsonl")},
+        )
+        batch_response = await self.retry_policy.call(
+            self._batch_api_request,
+            "POST",
+            "/batches",
+            json={
+                "input_file_id": input_file.json()["id"],
+                "endpoint": endpoint,
+                "completion_window": self.batch_config.completion_window,
+            },
+        )
+        batch = batch_response.json()
+        self.num_batches_submitted += 1
+        while batch["status"] not in TERMINAL_BATCH_STATUSES:
+            await asyncio.sleep(self.batch_config.poll_interval_s)
+            batch_response = await self.retry_policy.call(
+                self._batch_api_request, "GET", f"/batches/{batch['id']}"
+            )
+            batch = batch_response.json()
+        results_by_custom_id: dict[str, dict[str, Any]] = {}
+        for file_id in [batch.get("output_file_id"), batch.get("error_file_id")]:
+            if file_id is None:
+                continue
+            file_response = await self.retry_policy.call(
+                self._batch_api_request, "GET", f"/files/{file_id}/content"
+            )
+            for line in file_response.content.splitlines():
+                if line.strip():
+                    result = orjson.loads(line)
+                    results_by_custom_id[result["custom_id"]] = result
+        return batch, results_by_custom_id
+
+
+class LocalBatchServer:
+    """
+    In-process stand-in for the files and batches endpoints of the API. Each request in a batch is
+    answered by calling handle_request(endpoint, body), which returns the response body. Batches
+    complete after they have been polled num_polls_until_complete times.
+
+    Use the transport property as BatchApiClient's http_transport.
+    """
+
+    def __init__(
+        self,
+        handle_request: Callable[[str, dict[str, Any]], dict[str, Any]],
+        num_polls_until_complete: int = 1,
+    ):
+        self.handle_request = handle_request
+        self.num_polls_until_complete = num_polls_until_complete
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict[str, Any]] = {}
+        self._num_polls_by_batch_id: dict[str, int] = {}
+        self._ids = itertools.count()
+
+    @property
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self._handle)
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.removeprefix("/v1")
+        parts = path.strip("/").split("/")
+        if request.method == "POST" and parts == ["files"]:
+            return self._create_file(request)
+        if request.method == "GET" and len(parts) == 3 and parts[0] == "files":
+            return httpx.Response(200, content=self.files[parts[1]])
+        if request.method == "POST" and parts == ["batches"]:
+            return self._create_batch(orjson.loads(request.content))
+        if request.method == "GET" and len(parts) == 2 and parts[0] == "batches":
+            return self._poll_batch(parts[1])
+        return httpx.Response(404, json={"error": {"message": f"Unknown path {path}"}})
+
+    def _create_file(self, request: httpx.Request) -> httpx.Response:
+        message = BytesParser(policy=HTTP).parsebytes(
+            b"Content-Type: "
+            + request.headers["Content-Type"].encode()
+            + b"\r\n\r\n"
+            + request.content
+        )
+        for part in message.iter_parts():
+            if part.get_filename() is not None:
+                file_id = f"file-{next(self._ids)}"
+                self.files[file_id] = part.get_payload(decode=True)
+                return httpx.Response(200, json={"id": file_id, "object": "file"})
+        return httpx.Response(400, json={"error": {"message": "No file uploaded"}})
+
+    def _create_batch(self, body: dict[str, Any]) -> httpx.Response:
+        batch_id = f"batch-{next(self._ids)}"
+        self.batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"],
+            "status": "in_progress",
+        }
+        self._num_polls_by_batch_id[batch_id] = 0
+        return httpx.Response(200, json=self.batches[batch_id])
+
+    def _poll_batch(self, batch_id: str) -> httpx.Response:
+        batch = self.batches[batch_id]
+        self._num_polls_by_batch_id[batch_id] += 1
+        if (
+            batch["status"] == "in_progress"
+            and self._num_polls_by_batch_id[batch_id] >= self.num_polls_until_complete
+        ):
+            self._complete_batch(batch)
+        return httpx.Response(200, json=batch)
+
+    def _complete_batch(self, batch: dict[str, Any]) -> None:
+        output_lines = []
+        for line in self.files[batch["input_file_id"]].splitlines():
+            request = orjson.loads(line)
+            output_lines.append(
+                orjson.dumps(
+                    {
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": self.handle_request(request["url"], request["body"]),
+                        },
+                        "error": None,
+                    }
+                )
+            )
+        output_file_id = f"file-{next(self._ids)}"
+        self.files[output_file_id] = b"\n".join(output_lines)
+        batch["status"] = "completed"
+        batch["output_file_id"] = output_file_id
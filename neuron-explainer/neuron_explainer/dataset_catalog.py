@@ -0,0 +1,171 @@
+# Catalogue of the neurons in a dataset directory laid out as {root}/{layer_index}/{neuron_index}.*,
+# e.g. the "neurons" directory of an activations dataset or an explanations dataset. The directory is
+# listed concurrently and the resulting manifest is cached on local disk, so that sweeps don't spend
+# their startup enumerating remote directories.
+#
+# Example usage:
+#
+#   catalog = DatasetCatalog("az://openaipublic/neuron-explainer/data/explanations")
+#   for layer_index in await catalog.get_sorted_layers():
+#       for neuron_index in await catalog.get_sorted_neuron_indices(layer_index):
+#           ...
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Union
+
+from neuron_explainer.azure import ensure_session
+from neuron_explainer.fast_dataclasses import FastDataclass, dumps, loads, register_dataclass
+
+DEFAULT_CATALOG_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "neuron_explainer", "catalog"
+)
+
+
+@register_dataclass
+@dataclass
+class LayerManifest(FastDataclass):
+    layer_index: int
+    neuron_indices: List[int]
+    """Sorted in ascending order."""
+
+
+@register_dataclass
+@dataclass
+class DatasetManifest(FastDataclass):
+    root: str
+    created_at: float
+    """Unix time at which the directory was listed."""
+    layers: List[LayerManifest]
+    """Sorted by layer index."""
+
+
+def _get_numeric_name(path: str) -> Optional[int]:
+    """Return the number at the start of the last component of a path, e.g. 12 for "a/12.json"."""
+    name = path.rstrip("/").rsplit("/", 1)[-1].split(".")[0]
+    return int(name) if name.isnumeric() else None
+
+
+@ensure_session
+async def list_dataset(root: str, max_concurrency: int = 64) -> DatasetManifest:
+    """List every layer and neuron in the dataset, listing layer directories concurrently."""
+    import boostedblob as bbb
+
+    created_at = time.time()
+    # A single listing of the root tells us which entries are directories.
+    layer_indices = [
+        layer_index
+        async for entry in bbb.scandir(root)
+        if entry.is_dir and (layer_index := _get_numeric_name(str(entry.path))) is not None
+    ]
+    layer_indices.sort()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def list_layer(layer_index: int) -> LayerManifest:
+        async with semaphore:
+            neuron_indices = [
+                neuron_index
+                async for path in bbb.listdir(f"{root.rstrip('/')}/{layer_index}")
+                if (neuron_index := _get_numeric_name(str(path))) is not None
+            ]
+        return LayerManifest(layer_index=layer_index, neuron_indices=sorted(neuron_indices))
+
+    layers = await asyncio.gather(*[list_layer(layer_index) for layer_index in layer_indices])
+    return DatasetManifest(root=root, created_at=created_at, layers=list(layers))
+
+
+class DatasetCatalog:
+    """
+    Answers questions about which layers and neurons exist in a dataset from a manifest. The
+    manifest is listed at most once per ttl_s, and cached in memory and in cache_dir (if not None).
+    """
+
+    def __init__(
+        self,
+        root: str,
+        cache_dir: Optional[str] = DEFAULT_CATALOG_CACHE_DIR,
+        ttl_s: float = 24 * 60 * 60,
+        max_concurrency: int = 64,
+    ):
+        self.root = root
+        self.cache_dir = cache_dir
+        self.ttl_s = ttl_s
+        self.max_concurrency = max_concurrency
+        self._manifest: Optional[DatasetManifest] = None
+        self._neuron_index_sets: dict[int, frozenset[int]] = {}
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def cache_path(self) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        return os.path.join(
+            self.cache_dir, hashlib.sha256(self.root.encode("utf-8")).hexdigest() + ".json"
+        )
+
+    def _is_fresh(self, manifest: DatasetManifest) -> bool:
+        return time.time() - manifest.created_at < self.ttl_s
+
+    def _read_cached_manifest(self) -> Optional[DatasetManifest]:
+        cache_path = self.cache_path
+        if cache_path is None or not os.path.exists(cache_path):
+            return None
+        with open(cache_path, "rb") as f:
+            manifest = loads(f.read())
+        if not isinstance(manifest, DatasetManifest) or manifest.root != self.root:
+            return None
+        return manifest
+
+    def _write_cached_manifest(self, manifest: DatasetManifest) -> None:
+        cache_path = self.cache_path
+        if cache_path is None:
+            return
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Write to a temporary file first so that concurrent readers never see a partial manifest.
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(dumps(manifest))
+        os.replace(tmp_path, cache_path)
+
+    def _set_manifest(self, manifest: DatasetManifest) -> None:
+        self._manifest = manifest
+        self._neuron_index_sets = {
+            layer.layer_index: frozenset(layer.neuron_indices) for layer in manifest.layers
+        }
+
+    async def get_manifest(self, refresh: bool = False) -> DatasetManifest:
+        """Return the manifest, listing the dataset if there's no fresh cached manifest."""
+        if not refresh and self._manifest is not None and self._is_fresh(self._manifest):
+            return self._manifest
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Concurrent callers wait for a single listing.
+        async with self._lock:
+            if not refresh and self._manifest is not None and self._is_fresh(self._manifest):
+                return self._manifest
+            manifest = None if refresh else await asyncio.to_thread(self._read_cached_manifest)
+            if manifest is None or not self._is_fresh(manifest):
+                manifest = await list_dataset(self.root, max_concurrency=self.max_concurrency)
+                await asyncio.to_thread(self._write_cached_manifest, manifest)
+            self._set_manifest(manifest)
+            return manifest
+
+    async def get_sorted_layers(self) -> list[int]:
+        return [layer.layer_index for layer in (await self.get_manifest()).layers]
+
+    async def get_sorted_neuron_indices(self, layer_index: Union[str, int]) -> list[int]:
+        for layer in (await self.get_manifest()).layers:
+            if layer.layer_index == int(layer_index):
+                return layer.neuron_indices
+        return []
+
+    async def neuron_exists(
+        self, layer_index: Union[str, int], neuron_index: Union[str, int]
+    ) -> bool:
+        await self.get_manifest()
+        return int(neuron_index) in self._neuron_index_sets.get(int(layer_index), frozenset())
@@ -12,14 +12,26 @@ methods.)
 from __future__ import annotations
 
 import asyncio
+import itertools
 from abc import abstractmethod
+from dataclasses import dataclass
 from typing import Optional, Sequence
 
 import numpy as np
-from neuron_explainer.activations.activations import ActivationRecord
-from neuron_explainer.explanations.explanations import ActivationScale
-from neuron_explainer.explanations.simulator import NeuronSimulator, SequenceSimulation
-from sklearn import linear_model
+from neuron_explainer.activations.activations import ActivationRecord, NeuronId
+from neuron_explainer.explanations.explanations import (
+    ActivationScale,
+    CalibrationParameters,
+    LinearCalibration,
+    PercentileMatchingCalibration,
+)
+from neuron_explainer.explanations.simulator import (
+    NeuronSimulator,
+    SequenceSimulation,
+    SimulationStore,
+)
+from neuron_explainer.fast_dataclasses import FastDataclass, dumps, loads, register_dataclass
+from neuron_explainer.tracing import span, traced
 
 
 class CalibratedNeuronSimulator(NeuronSimulator):
@@ -28,23 +40,54 @@ class CalibratedNeuronSimulator(NeuronSimulator):
     actual neuron activation space.
     """
 
-    def __init__(self, uncalibrated_simulator: NeuronSimulator):
+    def __init__(
+        self,
+        uncalibrated_simulator: NeuronSimulator,
+        # If set, uncalibrated simulations are looked up in and added to this store, so they can be
+        # shared with other calibrated simulators and with scoring.
+        simulation_store: Optional[SimulationStore] = None,
+    ):
         self.uncalibrated_simulator = uncalibrated_simulator
+        self.simulation_store = simulation_store
 
     @classmethod
     async def create(
         cls,
         uncalibrated_simulator: NeuronSimulator,
         calibration_activation_records: Sequence[ActivationRecord],
+        simulation_store: Optional[SimulationStore] = None,
     ) -> CalibratedNeuronSimulator:
         """
         Create and calibrate a calibrated simulator (so initialization and calibration can be done
         in one call).
         """
-        calibrated_simulator = cls(uncalibrated_simulator)
+        calibrated_simulator = cls(uncalibrated_simulator, simulation_store=simulation_store)
         await calibrated_simulator.calibrate(calibration_activation_records)
         return calibrated_simulator
 
+    @classmethod
+    def from_calibration(
+        cls,
+        uncalibrated_simulator: NeuronSimulator,
+        calibration: Optional[CalibrationParameters],
+        simulation_store: Optional[SimulationStore] = None,
+    ) -> CalibratedNeuronSimulator:
+        """
+        Create a calibrated simulator from previously fitted calibration parameters (e.g. from
+        ScoredSimulation.calibration), without simulating the calibration set again.
+        """
+        calibrated_simulator = cls(uncalibrated_simulator, simulation_store=simulation_store)
+        calibrated_simulator.set_calibration(calibration)
+        return calibrated_simulator
+
+    async def aclose(self) -> None:
+        await self.uncalibrated_simulator.aclose()
+
+    async def _simulate_uncalibrated(self, tokens: Sequence[str]) -> SequenceSimulation:
+        if self.simulation_store is not None:
+            return await self.simulation_store.simulate(self.uncalibrated_simulator, tokens)
+        return await self.uncalibrated_simulator.simulate(tokens)
+
     async def calibrate(self, calibration_activation_records: Sequence[ActivationRecord]) -> None:
         """
         Determine parameters to map from the predicted activation space to the real neuron
@@ -52,13 +95,18 @@ class CalibratedNeuronSimulator(NeuronSimulator):
 
         Use when simulated sequences haven't already been produced on the calibration set.
         """
-        simulations = await asyncio.gather(
-            *[
-                self.uncalibrated_simulator.simulate(activations.tokens)
-                for activations in calibration_activation_records
-            ]
-        )
-        self.calibrate_from_simulations(calibration_activation_records, simulations)
+        with span(
+            "CalibratedNeuronSimulator.calibrate",
+            calibrator=type(self).__name__,
+            num_records=len(calibration_activation_records),
+        ):
+            simulations = await asyncio.gather(
+                *[
+                    self._simulate_uncalibrated(activations.tokens)
+                    for activations in calibration_activation_records
+                ]
+            )
+            self.calibrate_from_simulations(calibration_activation_records, simulations)
 
     def calibrate_from_simulations(
         self,
@@ -71,6 +119,11 @@ class CalibratedNeuronSimulator(NeuronSimulator):
 
         Use when simulated sequences have already been produced on the calibration set.
         """
+        if self.simulation_store is not None:
+            for activations, simulation in zip(calibration_activation_records, simulations):
+                self.simulation_store.add(
+                    self.uncalibrated_simulator, activations.tokens, simulation
+                )
         flattened_activations = []
         flattened_simulated_activations: list[float] = []
         for activations, simulation in zip(calibration_activation_records, simulations):
@@ -95,17 +148,45 @@ class CalibratedNeuronSimulator(NeuronSimulator):
         """
 
     @abstractmethod
+    def get_calibration(self) -> Optional[CalibrationParameters]:
+        """
+        Return the fitted calibration parameters, or None if this calibrator has no parameters.
+        Raises ValueError if calibration hasn't been run yet.
+        """
+
+    @abstractmethod
+    def set_calibration(self, calibration: Optional[CalibrationParameters]) -> None:
+        """Use previously fitted calibration parameters instead of calling calibrate()."""
+
+    @abstractmethod
+    def apply_calibration_to_array(self, values: np.ndarray) -> np.ndarray:
+        """Apply the learned calibration elementwise to a 1D array of values."""
+
     def apply_calibration(self, values: Sequence[float]) -> list[float]:
         """Apply the learned calibration to a sequence of values."""
+        return self.apply_calibration_to_array(np.asarray(values, dtype=np.float64)).tolist()
 
+    @traced("CalibratedNeuronSimulator.simulate")
     async def simulate(self, tokens: Sequence[str]) -> SequenceSimulation:
-        uncalibrated_seq_simulation = await self.uncalibrated_simulator.simulate(tokens)
-        calibrated_activations = self.apply_calibration(
-            uncalibrated_seq_simulation.expected_activations
+        uncalibrated_seq_simulation = await self._simulate_uncalibrated(tokens)
+        # Calibrate the expected values and all distribution values in a single call.
+        num_tokens = len(uncalibrated_seq_simulation.expected_activations)
+        distribution_lengths = [len(dv) for dv in uncalibrated_seq_simulation.distribution_values]
+        all_values = np.fromiter(
+            itertools.chain(
+                uncalibrated_seq_simulation.expected_activations,
+                *uncalibrated_seq_simulation.distribution_values,
+            ),
+            dtype=np.float64,
+            count=num_tokens + sum(distribution_lengths),
         )
-        calibrated_distribution_values = [
-            self.apply_calibration(dv) for dv in uncalibrated_seq_simulation.distribution_values
-        ]
+        all_calibrated_values = self.apply_calibration_to_array(all_values).tolist()
+        calibrated_activations = all_calibrated_values[:num_tokens]
+        calibrated_distribution_values = []
+        start = num_tokens
+        for length in distribution_lengths:
+            calibrated_distribution_values.append(all_calibrated_values[start : start + length])
+            start += length
         return SequenceSimulation(
             tokens=uncalibrated_seq_simulation.tokens,
             expected_activations=calibrated_activations,
@@ -119,8 +200,12 @@ class CalibratedNeuronSimulator(NeuronSimulator):
 class UncalibratedNeuronSimulator(CalibratedNeuronSimulator):
     """Pass through the activations without trying to calibrate."""
 
-    def __init__(self, uncalibrated_simulator: NeuronSimulator):
-        super().__init__(uncalibrated_simulator)
+    def __init__(
+        self,
+        uncalibrated_simulator: NeuronSimulator,
+        simulation_store: Optional[SimulationStore] = None,
+    ):
+        super().__init__(uncalibrated_simulator, simulation_store=simulation_store)
 
     async def calibrate(self, calibration_activation_records: Sequence[ActivationRecord]) -> None:
         pass
@@ -132,6 +217,16 @@ class UncalibratedNeuronSimulator(CalibratedNeuronSimulator):
     ) -> None:
         pass
 
+    def get_calibration(self) -> Optional[CalibrationParameters]:
+        return None
+
+    def set_calibration(self, calibration: Optional[CalibrationParameters]) -> None:
+        if calibration is not None:
+            raise ValueError(f"Expected no calibration parameters, got {calibration}")
+
+    def apply_calibration_to_array(self, values: np.ndarray) -> np.ndarray:
+        return values
+
     def apply_calibration(self, values: Sequence[float]) -> list[float]:
         return values if isinstance(values, list) else list(values)
 
@@ -142,24 +237,49 @@ class LinearCalibratedNeuronSimulator(CalibratedNeuronSimulator):
     Should not change ev_correlation_score because it is invariant to linear transformations.
     """
 
-    def __init__(self, uncalibrated_simulator: NeuronSimulator):
-        super().__init__(uncalibrated_simulator)
-        self._regression: Optional[linear_model.LinearRegression] = None
+    def __init__(
+        self,
+        uncalibrated_simulator: NeuronSimulator,
+        simulation_store: Optional[SimulationStore] = None,
+    ):
+        super().__init__(uncalibrated_simulator, simulation_store=simulation_store)
+        self.slope: Optional[float] = None
+        self.intercept: Optional[float] = None
 
     def _calibrate_from_flattened_activations(
         self,
         true_activations: np.ndarray,
         uncalibrated_activations: np.ndarray,
     ) -> None:
-        self._regression = linear_model.LinearRegression()
-        self._regression.fit(uncalibrated_activations.reshape(-1, 1), true_activations)
+        # Ordinary least squares in closed form.
+        uncalibrated_centered = uncalibrated_activations - uncalibrated_activations.mean()
+        variance = np.dot(uncalibrated_centered, uncalibrated_centered)
+        self.slope = (
+            float(
+                np.dot(uncalibrated_centered, true_activations - true_activations.mean()) / variance
+            )
+            if variance > 0
+            else 0.0
+        )
+        self.intercept = float(
+            true_activations.mean() - self.slope * uncalibrated_activations.mean()
+        )
 
-    def apply_calibration(self, values: Sequence[float]) -> list[float]:
-        if self._regression is None:
+    def get_calibration(self) -> Optional[CalibrationParameters]:
+        if self.slope is None or self.intercept is None:
+            raise ValueError("Must call calibrate() before get_calibration")
+        return LinearCalibration(slope=self.slope, intercept=self.intercept)
+
+    def set_calibration(self, calibration: Optional[CalibrationParameters]) -> None:
+        if not isinstance(calibration, LinearCalibration):
+            raise ValueError(f"Expected LinearCalibration, got {calibration}")
+        self.slope = calibration.slope
+        self.intercept = calibration.intercept
+
+    def apply_calibration_to_array(self, values: np.ndarray) -> np.ndarray:
+        if self.slope is None or self.intercept is None:
             raise ValueError("Must call calibrate() before apply_calibration")
-        if len(values) == 0:
-            return []
-        return self._regression.predict(np.reshape(np.array(values), (-1, 1))).tolist()
+        return values * self.slope + self.intercept
 
 
 class PercentileMatchingCalibratedNeuronSimulator(CalibratedNeuronSimulator):
@@ -171,24 +291,151 @@ class PercentileMatchingCalibratedNeuronSimulator(CalibratedNeuronSimulator):
     overconfident outside of the calibration set.
     """
 
-    def __init__(self, uncalibrated_simulator: NeuronSimulator):
-        super().__init__(uncalibrated_simulator)
-        self._uncalibrated_activations: Optional[np.ndarray] = None
-        self._true_activations: Optional[np.ndarray] = None
+    def __init__(
+        self,
+        uncalibrated_simulator: NeuronSimulator,
+        simulation_store: Optional[SimulationStore] = None,
+    ):
+        super().__init__(uncalibrated_simulator, simulation_store=simulation_store)
+        self.uncalibrated_activations: Optional[np.ndarray] = None
+        """Sorted uncalibrated activations on the calibration set."""
+        self.true_activations: Optional[np.ndarray] = None
+        """Sorted true activations on the calibration set."""
 
     def _calibrate_from_flattened_activations(
         self,
         true_activations: np.ndarray,
         uncalibrated_activations: np.ndarray,
     ) -> None:
-        self._uncalibrated_activations = np.sort(uncalibrated_activations)
-        self._true_activations = np.sort(true_activations)
+        self.uncalibrated_activations = np.sort(uncalibrated_activations)
+        self.true_activations = np.sort(true_activations)
+
+    def get_calibration(self) -> Optional[CalibrationParameters]:
+        if self.true_activations is None or self.uncalibrated_activations is None:
+            raise ValueError("Must call calibrate() before get_calibration")
+        return PercentileMatchingCalibration(
+            uncalibrated_activations=self.uncalibrated_activations.tolist(),
+            true_activations=self.true_activations.tolist(),
+        )
 
-    def apply_calibration(self, values: Sequence[float]) -> list[float]:
-        if self._true_activations is None or self._uncalibrated_activations is None:
+    def set_calibration(self, calibration: Optional[CalibrationParameters]) -> None:
+        if not isinstance(calibration, PercentileMatchingCalibration):
+            raise ValueError(f"Expected PercentileMatchingCalibration, got {calibration}")
+        self.uncalibrated_activations = np.asarray(
+            calibration.uncalibrated_activations, dtype=np.float64
+        )
+        self.true_activations = np.asarray(calibration.true_activations, dtype=np.float64)
+
+    def apply_calibration_to_array(self, values: np.ndarray) -> np.ndarray:
+        if self.true_activations is None or self.uncalibrated_activations is None:
             raise ValueError("Must call calibrate() before apply_calibration")
-        if len(values) == 0:
-            return []
-        return np.interp(
-            np.array(values), self._uncalibrated_activations, self._true_activations
-        ).tolist()
+        return np.interp(values, self.uncalibrated_activations, self.true_activations)
+
+
+@register_dataclass
+@dataclass
+class CachedCalibration(FastDataclass):
+    """Calibration parameters fitted for one neuron and one simulator configuration."""
+
+    neuron_id: NeuronId
+    simulator_cache_key: str
+    """The uncalibrated simulator's get_simulation_cache_key()."""
+    calibrator_name: str
+    """The name of the CalibratedNeuronSimulator subclass that fitted the calibration."""
+    calibration: Optional[CalibrationParameters]
+
+
+class CalibrationCache:
+    """
+    Cache of fitted calibration parameters keyed by (neuron, explanation and simulator config,
+    calibration method). Re-scoring an explanation (e.g. on a new split, or in the viewer) can reuse
+    the cached parameters instead of simulating the calibration set again.
+
+    The cache should only be shared between runs that use the same calibration set for each neuron.
+    """
+
+    def __init__(self, cached_calibrations: Sequence[CachedCalibration] = ()) -> None:
+        self._calibrations: dict[tuple[int, int, str, str], CachedCalibration] = {}
+        for cached_calibration in cached_calibrations:
+            self._calibrations[self._key_for_cached_calibration(cached_calibration)] = (
+                cached_calibration
+            )
+
+    @staticmethod
+    def _key_for_cached_calibration(
+        cached_calibration: CachedCalibration,
+    ) -> tuple[int, int, str, str]:
+        return (
+            cached_calibration.neuron_id.layer_index,
+            cached_calibration.neuron_id.neuron_index,
+            cached_calibration.simulator_cache_key,
+            cached_calibration.calibrator_name,
+        )
+
+    @staticmethod
+    def _make_key(
+        neuron_id: NeuronId, calibrated_simulator: CalibratedNeuronSimulator
+    ) -> Optional[tuple[int, int, str, str]]:
+        simulator_cache_key = calibrated_simulator.uncalibrated_simulator.get_simulation_cache_key()
+        if simulator_cache_key is None:
+            return None
+        return (
+            neuron_id.layer_index,
+            neuron_id.neuron_index,
+            simulator_cache_key,
+            type(calibrated_simulator).__name__,
+        )
+
+    def __len__(self) -> int:
+        return len(self._calibrations)
+
+    @property
+    def cached_calibrations(self) -> list[CachedCalibration]:
+        return list(self._calibrations.values())
+
+    async def calibrate(
+        self,
+        calibrated_simulator: CalibratedNeuronSimulator,
+        neuron_id: NeuronId,
+        calibration_activation_records: Sequence[ActivationRecord],
+    ) -> bool:
+        """
+        Calibrate the simulator using cached parameters if there are any, otherwise by running
+        calibration and caching the result. Returns whether the cache was hit. Simulators without a
+        simulation cache key are always calibrated from scratch and never cached.
+        """
+        key = self._make_key(neuron_id, calibrated_simulator)
+        if key is not None and key in self._calibrations:
+            calibrated_simulator.set_calibration(self._calibrations[key].calibration)
+            return True
+        await calibrated_simulator.calibrate(calibration_activation_records)
+        if key is not None:
+            self._calibrations[key] = CachedCalibration(
+                neuron_id=neuron_id,
+                simulator_cache_key=key[2],
+                calibrator_name=key[3],
+                calibration=calibrated_simulator.get_calibration(),
+            )
+        return False
+
+    def dumps(self) -> bytes:
+        return dumps(self.cached_calibrations)
+
+    @classmethod
+    def loads(cls, serialized: bytes) -> CalibrationCache:
+        cached_calibrations = loads(serialized)
+        assert all(isinstance(c, CachedCalibration) for c in cached_calibrations)
+        return cls(cached_calibrations)
+
+    def save(self, path: str) -> None:
+        import blobfile as bf
+
+        with bf.BlobFile(path, "wb") as f:
+            f.write(self.dumps())
+
+    @classmethod
+    def load(cls, path: str) -> CalibrationCache:
+        import blobfile as bf
+
+        with bf.BlobFile(path, "rb") as f:
+            return cls.loads(f.read())
@@ -14,7 +14,7 @@ from neuron_explainer.activations.activation_records import (
     non_zero_activation_proportion,
 )
 from neuron_explainer.activations.activations import ActivationRecord
-from neuron_explainer.api_client import ApiClient
+from neuron_explainer.api_client import EXPLANATION_REQUEST_CLASS, ApiClient
 from neuron_explainer.explanations.few_shot_examples import FewShotExampleSet
 from neuron_explainer.explanations.prompt_builder import (
     HarmonyMessage,
@@ -25,6 +25,7 @@ from neuron_explainer.explanations.prompt_builder import (
 from neuron_explainer.explanations.token_space_few_shot_examples import (
     TokenSpaceFewShotExampleSet,
 )
+from neuron_explainer.tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -92,8 +93,18 @@ class NeuronExplainer(ABC):
         self.model_name = model_name
         self.prompt_format = prompt_format
         self.context_size = context_size
-        self.client = ApiClient(model_name=model_name, max_concurrent=max_concurrent, cache=cache)
+        self.client = ApiClient(
+            model_name=model_name,
+            max_concurrent=max_concurrent,
+            cache=cache,
+            request_class=EXPLANATION_REQUEST_CLASS,
+        )
+
+    async def aclose(self) -> None:
+        """Close the explainer's API client. Whoever creates an explainer should call this."""
+        await self.client.aclose()
 
+    @traced("NeuronExplainer.generate_explanations")
     async def generate_explanations(
         self,
         *,
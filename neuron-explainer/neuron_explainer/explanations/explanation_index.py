@@ -0,0 +1,348 @@
+# Index over all scored explanations in an explanations dataset, for queries like "all neurons with
+# ev_correlation_score > 0.6 whose explanation mentions X" without reading every explanation file.
+#
+# The index is built once per dataset and stored as a single .npz file. It has a columnar table
+# with one row per scored explanation (neuron, explanation text and scores), plus an inverted index
+# from each word to the rows whose explanation contains it.
+#
+# To build an index:
+#
+#   python -m neuron_explainer.explanations.explanation_index <explanations_path> <index_path>
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import math
+import re
+from dataclasses import dataclass
+from typing import Iterable, Mapping, Optional, Sequence, Union
+
+import numpy as np
+from neuron_explainer.activations.activations import NeuronId
+from neuron_explainer.azure import ensure_session
+from neuron_explainer.dataset_catalog import DatasetCatalog
+from neuron_explainer.explanations.explanations import (
+    NeuronSimulationResults,
+    load_neuron_explanations_async,
+)
+
+SCORE_NAMES = ("ev_correlation_score", "rsquared_score", "absolute_dev_explained_score")
+"""Scores stored for each explanation. Missing scores are stored as NaN."""
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize_explanation(explanation: str) -> list[str]:
+    """Split an explanation or query into lowercase words, ignoring punctuation."""
+    return _WORD_PATTERN.findall(explanation.lower())
+
+
+@dataclass
+class ExplanationIndexEntry:
+    """A scored explanation returned by ExplanationIndex.query."""
+
+    neuron_id: NeuronId
+    explanation: str
+    scores: dict[str, Optional[float]]
+
+
+def get_entries(neuron_simulation_results: NeuronSimulationResults) -> list[ExplanationIndexEntry]:
+    """
+    Return the index entries for a neuron's scored explanations, without the per-sequence
+    simulations, which make up almost all of the results.
+    """
+    return [
+        ExplanationIndexEntry(
+            neuron_id=neuron_simulation_results.neuron_id,
+            explanation=scored_explanation.explanation,
+            scores={
+                score_name: getattr(scored_explanation.scored_simulation, score_name)
+                for score_name in SCORE_NAMES
+            },
+        )
+        for scored_explanation in neuron_simulation_results.scored_explanations
+    ]
+
+
+def encode_strings(strings: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Pack strings into a uint8 array of UTF-8 bytes and an int64 array of offsets into it."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def decode_strings(data: np.ndarray, offsets: np.ndarray) -> list[str]:
+    raw = data.tobytes()
+    return [
+        raw[start:end].decode("utf-8") for start, end in zip(offsets[:-1].tolist(), offsets[1:])
+    ]
+
+
+class ExplanationIndex:
+    """
+    Scored explanations for many neurons, with fast queries by score range, layer and words in the
+    explanation. Rows are ordered by (layer_index, neuron_index), in the order explanations appear
+    in each neuron's file.
+    """
+
+    def __init__(
+        self,
+        layer_indices: np.ndarray,
+        neuron_indices: np.ndarray,
+        explanations: list[str],
+        scores: dict[str, np.ndarray],
+        words: Optional[list[str]] = None,
+        postings_offsets: Optional[np.ndarray] = None,
+        postings: Optional[np.ndarray] = None,
+    ):
+        assert len(layer_indices) == len(neuron_indices) == len(explanations)
+        assert set(scores) == set(SCORE_NAMES)
+        assert all(len(column) == len(explanations) for column in scores.values())
+        self.layer_indices = layer_indices
+        self.neuron_indices = neuron_indices
+        self.explanations = explanations
+        self.scores = scores
+        if words is None or postings_offsets is None or postings is None:
+            words, postings_offsets, postings = self._build_inverted_index(explanations)
+        self.words = words
+        self.postings_offsets = postings_offsets
+        self.postings = postings
+        self._word_ids = {word: i for i, word in enumerate(words)}
+
+    @staticmethod
+    def _build_inverted_index(explanations: list[str]) -> tuple[list[str], np.ndarray, np.ndarray]:
+        rows_by_word: dict[str, list[int]] = {}
+        for row, explanation in enumerate(explanations):
+            for word in set(tokenize_explanation(explanation)):
+                rows_by_word.setdefault(word, []).append(row)
+        words = sorted(rows_by_word)
+        postings_offsets = np.zeros(len(words) + 1, dtype=np.int64)
+        postings_offsets[1:] = np.cumsum([len(rows_by_word[word]) for word in words])
+        postings = np.array(
+            [row for word in words for row in rows_by_word[word]], dtype=np.int32
+        ).reshape(-1)
+        return words, postings_offsets, postings
+
+    @classmethod
+    def from_neuron_simulation_results(
+        cls, all_neuron_simulation_results: Iterable[NeuronSimulationResults]
+    ) -> ExplanationIndex:
+        return cls.from_entries(
+            entry
+            for neuron_simulation_results in all_neuron_simulation_results
+            for entry in get_entries(neuron_simulation_results)
+        )
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[ExplanationIndexEntry]) -> ExplanationIndex:
+        layer_indices = []
+        neuron_indices = []
+        explanations = []
+        scores: dict[str, list[float]] = {score_name: [] for score_name in SCORE_NAMES}
+        # The sort is stable, so each neuron's explanations stay in their original order.
+        for entry in sorted(
+            entries, key=lambda entry: (entry.neuron_id.layer_index, entry.neuron_id.neuron_index)
+        ):
+            layer_indices.append(entry.neuron_id.layer_index)
+            neuron_indices.append(entry.neuron_id.neuron_index)
+            explanations.append(entry.explanation)
+            for score_name in SCORE_NAMES:
+                score = entry.scores.get(score_name)
+                scores[score_name].append(math.nan if score is None else score)
+        return cls(
+            layer_indices=np.array(layer_indices, dtype=np.int32),
+            neuron_indices=np.array(neuron_indices, dtype=np.int32),
+            explanations=explanations,
+            scores={
+                score_name: np.array(column, dtype=np.float64)
+                for score_name, column in scores.items()
+            },
+        )
+
+    def __len__(self) -> int:
+        return len(self.explanations)
+
+    def _get_rows_containing(self, words: list[str]) -> np.ndarray:
+        """Return the sorted rows whose explanation contains all of the given words."""
+        rows = None
+        # Intersecting the rarest words first keeps the intermediate results small.
+        word_ids = sorted(
+            (self._word_ids.get(word, -1) for word in set(words)),
+            key=lambda word_id: (
+                0
+                if word_id < 0
+                else self.postings_offsets[word_id + 1] - self.postings_offsets[word_id]
+            ),
+        )
+        for word_id in word_ids:
+            if word_id < 0:
+                return np.zeros(0, dtype=np.int32)
+            word_rows = self.postings[
+                self.postings_offsets[word_id] : self.postings_offsets[word_id + 1]
+            ]
+            rows = (
+                word_rows if rows is None else np.intersect1d(rows, word_rows, assume_unique=True)
+            )
+        assert rows is not None
+        return rows
+
+    def query(
+        self,
+        text: Optional[str] = None,
+        min_score: Optional[float] = None,
+        max_score: Optional[float] = None,
+        score_name: str = "ev_correlation_score",
+        layer_indices: Optional[Sequence[int]] = None,
+        limit: Optional[int] = None,
+    ) -> list[ExplanationIndexEntry]:
+        """
+        Return explanations that contain every word in text, whose score is in [min_score,
+        max_score] and whose neuron is in one of layer_indices, sorted by descending score.
+        Explanations without a score only match if no score range is given, and come last.
+        """
+        if score_name not in SCORE_NAMES:
+            raise ValueError(f"Unknown score {score_name}, expected one of {SCORE_NAMES}")
+        if text is not None and len(tokenize_explanation(text)) > 0:
+            rows = self._get_rows_containing(tokenize_explanation(text))
+        else:
+            rows = np.arange(len(self), dtype=np.int32)
+        row_scores = self.scores[score_name][rows]
+        mask = np.ones(len(rows), dtype=bool)
+        if min_score is not None:
+            mask &= row_scores >= min_score
+        if max_score is not None:
+            mask &= row_scores <= max_score
+        if layer_indices is not None:
+            mask &= np.isin(self.layer_indices[rows], layer_indices)
+        rows, row_scores = rows[mask], row_scores[mask]
+        # Stable sort by descending score, with NaN last.
+        order = np.argsort(np.where(np.isnan(row_scores), np.inf, -row_scores), kind="stable")
+        if limit is not None:
+            order = order[:limit]
+        return [self.get_entry(int(row)) for row in rows[order]]
+
+    def get_entry(self, row: int) -> ExplanationIndexEntry:
+        """Return the explanation in the given row."""
+        return ExplanationIndexEntry(
+            neuron_id=NeuronId(
+                layer_index=int(self.layer_indices[row]),
+                neuron_index=int(self.neuron_indices[row]),
+            ),
+            explanation=self.explanations[row],
+            scores={
+                score_name: None if math.isnan(column[row]) else float(column[row])
+                for score_name, column in self.scores.items()
+            },
+        )
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        explanations_data, explanations_offsets = encode_strings(self.explanations)
+        words_data, words_offsets = encode_strings(self.words)
+        return {
+            "layer_indices": self.layer_indices,
+            "neuron_indices": self.neuron_indices,
+            "explanations_data": explanations_data,
+            "explanations_offsets": explanations_offsets,
+            "words_data": words_data,
+            "words_offsets": words_offsets,
+            "postings_offsets": self.postings_offsets,
+            "postings": self.postings,
+            **{f"scores_{score_name}": column for score_name, column in self.scores.items()},
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Mapping[str, np.ndarray]) -> ExplanationIndex:
+        return cls(
+            layer_indices=arrays["layer_indices"],
+            neuron_indices=arrays["neuron_indices"],
+            explanations=decode_strings(
+                arrays["explanations_data"], arrays["explanations_offsets"]
+            ),
+            scores={score_name: arrays[f"scores_{score_name}"] for score_name in SCORE_NAMES},
+            words=decode_strings(arrays["words_data"], arrays["words_offsets"]),
+            postings_offsets=arrays["postings_offsets"],
+            postings=arrays["postings"],
+        )
+
+    def dumps(self) -> bytes:
+        f = io.BytesIO()
+        np.savez_compressed(f, **self.to_arrays())
+        return f.getvalue()
+
+    @classmethod
+    def loads(cls, serialized: bytes) -> ExplanationIndex:
+        with np.load(io.BytesIO(serialized), allow_pickle=False) as arrays:
+            return cls.from_arrays(arrays)
+
+    def save(self, path: str) -> None:
+        import blobfile as bf
+
+        with bf.BlobFile(path, "wb") as f:
+            f.write(self.dumps())
+
+    @classmethod
+    def load(cls, path: str) -> ExplanationIndex:
+        import blobfile as bf
+
+        with bf.BlobFile(path, "rb") as f:
+            return cls.loads(f.read())
+
+
+@ensure_session
+async def build_explanation_index(
+    explanations_path: str,
+    layer_indices: Optional[Sequence[Union[str, int]]] = None,
+    max_concurrency: int = 64,
+) -> ExplanationIndex:
+    """
+    Build an index of every explanation in the dataset, reading explanation files concurrently. By
+    default all layers are indexed. One session is shared by all reads, so that the first read to
+    finish doesn't close it while the others are still running.
+    """
+    catalog = DatasetCatalog(explanations_path, cache_dir=None, max_concurrency=max_concurrency)
+    if layer_indices is None:
+        layer_indices = await catalog.get_sorted_layers()
+    neuron_indices_by_layer = [
+        await catalog.get_sorted_neuron_indices(layer_index) for layer_index in layer_indices
+    ]
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def load(layer_index: Union[str, int], neuron_index: int) -> list[ExplanationIndexEntry]:
+        async with semaphore:
+            neuron_simulation_results = await load_neuron_explanations_async(
+                explanations_path, layer_index, neuron_index
+            )
+        # Only the entries are kept, so that the simulations for all neurons aren't held in memory
+        # at once.
+        if neuron_simulation_results is None:
+            return []
+        return get_entries(neuron_simulation_results)
+
+    entries_by_neuron = await asyncio.gather(
+        *[
+            load(layer_index, neuron_index)
+            for layer_index, neuron_indices in zip(layer_indices, neuron_indices_by_layer)
+            for neuron_index in neuron_indices
+        ]
+    )
+    return ExplanationIndex.from_entries(
+        entry for entries in entries_by_neuron for entry in entries
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build an index of an explanations dataset.")
+    parser.add_argument("explanations_path")
+    parser.add_argument("index_path")
+    parser.add_argument("--layers", type=int, nargs="*", default=None)
+    args = parser.parse_args()
+    index = asyncio.run(build_explanation_index(args.explanations_path, args.layers))
+    index.save(args.index_path)
+    print(f"Indexed {len(index)} explanations with {len(index.words)} distinct words")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,536 @@
+# Search over the explanations in an ExplanationIndex, for finding neurons by concept. Supports
+# keyword search ranked by BM25, approximate nearest neighbour search over explanation embeddings,
+# and a hybrid of the two.
+#
+# The search index is built from an explanation index and stored as a single .npz file. Embeddings
+# are computed by a pluggable Embedder; the embedder's name is stored with the index so that queries
+# are embedded the same way.
+#
+# To build a search index:
+#
+#   python -m neuron_explainer.explanations.explanation_search <explanation_index_path> \
+#       <search_index_path> --embedder hashing
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import math
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Mapping, Optional, Sequence
+
+import numpy as np
+from neuron_explainer.api_client import ApiClient
+from neuron_explainer.explanations.explanation_index import (
+    ExplanationIndex,
+    ExplanationIndexEntry,
+    decode_strings,
+    encode_strings,
+    tokenize_explanation,
+)
+
+SEARCH_METHODS = ("bm25", "embedding", "hybrid")
+
+
+class Embedder(ABC):
+    """Computes unit-norm embeddings of explanations and queries."""
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        """Identifies the embedder, so it can be recreated with get_embedder."""
+        ...
+
+    @abstractmethod
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Return a float32 array of shape (len(texts), dimension) with unit-norm rows."""
+        ...
+
+    async def aclose(self) -> None:
+        """
+        Release resources held by the embedder, e.g. an API client it created for itself. Whoever
+        creates an embedder should call this when done with it.
+        """
+
+
+def _normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class HashingEmbedder(Embedder):
+    """
+    Local embedder that needs no model: words and pairs of adjacent words are hashed into a fixed
+    number of dimensions. Only captures lexical similarity, but is fast and deterministic.
+    """
+
+    def __init__(self, dimension: int = 512):
+        self.dimension = dimension
+
+    @property
+    def name(self) -> str:
+        return f"hashing:{self.dimension}"
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            words = tokenize_explanation(text)
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            for feature in features:
+                embeddings[i, zlib.crc32(feature.encode("utf-8")) % self.dimension] += 1.0
+        return _normalize_rows(embeddings)
+
+
+class ApiEmbedder(Embedder):
+    """
+    Embedder that uses an embedding model through the API. Texts are sent in batches of batch_size,
+    with at most max_concurrent_batches requests in flight at once.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "text-embedding-3-small",
+        batch_size: int = 512,
+        api_client: Optional[ApiClient] = None,
+        max_concurrent_batches: int = 8,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_concurrent_batches = max_concurrent_batches
+        self.api_client = (
+            api_client if api_client is not None else ApiClient(model_name=model_name, cache=True)
+        )
+        self._owns_api_client = api_client is None
+
+    @property
+    def name(self) -> str:
+        return f"api:{self.model_name}"
+
+    async def aclose(self) -> None:
+        if self._owns_api_client:
+            await self.api_client.aclose()
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        if len(texts) == 0:
+            # The dimension isn't known without calling the model.
+            return np.zeros((0, 0), dtype=np.float32)
+        semaphore = asyncio.Semaphore(self.max_concurrent_batches)
+
+        async def embed_batch(batch: Sequence[str]) -> list[list[float]]:
+            async with semaphore:
+                response = await self.api_client.make_request(input=list(batch))
+            return [
+                item["embedding"] for item in sorted(response["data"], key=lambda x: x["index"])
+            ]
+
+        batches = await asyncio.gather(
+            *[
+                embed_batch(texts[start : start + self.batch_size])
+                for start in range(0, len(texts), self.batch_size)
+            ]
+        )
+        return _normalize_rows(np.array([e for batch in batches for e in batch], dtype=np.float32))
+
+
+def get_embedder(name: str) -> Embedder:
+    """Recreate an embedder from its name, e.g. "hashing:512" or "api:text-embedding-3-small"."""
+    kind, _, argument = name.partition(":")
+    if kind == "hashing":
+        return HashingEmbedder(dimension=int(argument)) if argument else HashingEmbedder()
+    if kind == "api":
+        return ApiEmbedder(model_name=argument) if argument else ApiEmbedder()
+    raise ValueError(f"Unknown embedder {name}")
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the indices of the k largest scores, in descending order of score."""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class Bm25Index:
+    """Inverted index with term frequencies, for ranking documents by BM25."""
+
+    def __init__(
+        self,
+        words: list[str],
+        postings_offsets: np.ndarray,
+        postings: np.ndarray,
+        term_frequencies: np.ndarray,
+        document_lengths: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.words = words
+        self.postings_offsets = postings_offsets
+        self.postings = postings
+        self.term_frequencies = term_frequencies
+        self.document_lengths = document_lengths
+        self.k1 = k1
+        self.b = b
+        self._word_ids = {word: i for i, word in enumerate(words)}
+        average_document_length = (
+            max(float(document_lengths.mean()), 1.0) if len(document_lengths) > 0 else 1.0
+        )
+        self._length_norms = (k1 * (1 - b + b * document_lengths / average_document_length)).astype(
+            np.float32
+        )
+
+    @classmethod
+    def build(cls, documents: Sequence[str]) -> Bm25Index:
+        counts_by_word: dict[str, list[tuple[int, int]]] = {}
+        document_lengths = np.zeros(len(documents), dtype=np.int32)
+        for row, document in enumerate(documents):
+            words = tokenize_explanation(document)
+            document_lengths[row] = len(words)
+            counts: dict[str, int] = {}
+            for word in words:
+                counts[word] = counts.get(word, 0) + 1
+            for word, count in counts.items():
+                counts_by_word.setdefault(word, []).append((row, count))
+        words = sorted(counts_by_word)
+        postings_offsets = np.zeros(len(words) + 1, dtype=np.int64)
+        postings_offsets[1:] = np.cumsum([len(counts_by_word[word]) for word in words])
+        flat_postings = [posting for word in words for posting in counts_by_word[word]]
+        return cls(
+            words=words,
+            postings_offsets=postings_offsets,
+            postings=np.array([row for row, _ in flat_postings], dtype=np.int32).reshape(-1),
+            term_frequencies=np.array(
+                [count for _, count in flat_postings], dtype=np.uint16
+            ).reshape(-1),
+            document_lengths=document_lengths,
+        )
+
+    def search(self, query: str, limit: int) -> tuple[np.ndarray, np.ndarray]:
+        """Return the rows and BM25 scores of the best matching documents."""
+        num_documents = len(self.document_lengths)
+        scores = np.zeros(num_documents, dtype=np.float32)
+        for word in set(tokenize_explanation(query)):
+            word_id = self._word_ids.get(word)
+            if word_id is None:
+                continue
+            start, end = self.postings_offsets[word_id], self.postings_offsets[word_id + 1]
+            rows = self.postings[start:end]
+            term_frequencies = self.term_frequencies[start:end].astype(np.float32)
+            idf = math.log(1 + (num_documents - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += (
+                idf
+                * term_frequencies
+                * (self.k1 + 1)
+                / (term_frequencies + self._length_norms[rows])
+            )
+        rows = _top_k(scores, limit)
+        rows = rows[scores[rows] > 0]
+        return rows, scores[rows]
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        words_data, words_offsets = encode_strings(self.words)
+        return {
+            "words_data": words_data,
+            "words_offsets": words_offsets,
+            "postings_offsets": self.postings_offsets,
+            "postings": self.postings,
+            "term_frequencies": self.term_frequencies,
+            "document_lengths": self.document_lengths,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Mapping[str, np.ndarray]) -> Bm25Index:
+        return cls(
+            words=decode_strings(arrays["words_data"], arrays["words_offsets"]),
+            postings_offsets=arrays["postings_offsets"],
+            postings=arrays["postings"],
+            term_frequencies=arrays["term_frequencies"],
+            document_lengths=arrays["document_lengths"],
+        )
+
+
+def _assign_to_centroids(
+    embeddings: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536
+) -> np.ndarray:
+    assignments = np.zeros(len(embeddings), dtype=np.int32)
+    for start in range(0, len(embeddings), chunk_size):
+        chunk = embeddings[start : start + chunk_size].astype(np.float32)
+        assignments[start : start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+class IvfIndex:
+    """
+    Inverted file index for approximate nearest neighbour search by cosine similarity. Embeddings
+    are clustered with spherical k-means; a query is compared only with the embeddings in the
+    num_probes clusters whose centroids are closest to it.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        list_rows: np.ndarray,
+        embeddings: np.ndarray,
+    ):
+        self.centroids = centroids
+        """float32 array of shape (num_lists, dimension)."""
+        self.list_offsets = list_offsets
+        """list_rows[list_offsets[i] : list_offsets[i + 1]] are the rows in cluster i."""
+        self.list_rows = list_rows
+        self.embeddings = embeddings
+        """float16 array of shape (num_rows, dimension)."""
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        num_lists: Optional[int] = None,
+        num_iterations: int = 10,
+        seed: int = 0,
+    ) -> IvfIndex:
+        embeddings = embeddings.astype(np.float32)
+        if len(embeddings) == 0:
+            return cls(
+                centroids=np.zeros((0, embeddings.shape[1]), dtype=np.float32),
+                list_offsets=np.zeros(1, dtype=np.int64),
+                list_rows=np.zeros(0, dtype=np.int32),
+                embeddings=embeddings.astype(np.float16),
+            )
+        if num_lists is None:
+            num_lists = int(math.sqrt(len(embeddings)))
+        num_lists = max(1, min(num_lists, len(embeddings)))
+        rng = np.random.default_rng(seed)
+        centroids = embeddings[rng.choice(len(embeddings), num_lists, replace=False)].copy()
+        for _ in range(num_iterations):
+            assignments = _assign_to_centroids(embeddings, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, embeddings)
+            # Clusters that end up empty keep their previous centroid.
+            nonempty = np.bincount(assignments, minlength=num_lists) > 0
+            centroids[nonempty] = _normalize_rows(sums[nonempty])
+        assignments = _assign_to_centroids(embeddings, centroids)
+        list_rows = np.argsort(assignments, kind="stable").astype(np.int32)
+        list_offsets = np.zeros(num_lists + 1, dtype=np.int64)
+        list_offsets[1:] = np.cumsum(np.bincount(assignments, minlength=num_lists))
+        return cls(centroids, list_offsets, list_rows, embeddings.astype(np.float16))
+
+    def search(
+        self, query_embedding: np.ndarray, limit: int, num_probes: int = 8
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return the rows and cosine similarities of the (approximately) nearest embeddings."""
+        if len(self.list_rows) == 0:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        query_embedding = query_embedding.astype(np.float32)
+        probes = _top_k(self.centroids @ query_embedding, num_probes)
+        rows = np.concatenate(
+            [self.list_rows[self.list_offsets[i] : self.list_offsets[i + 1]] for i in probes]
+        )
+        similarities = self.embeddings[rows].astype(np.float32) @ query_embedding
+        top = _top_k(similarities, limit)
+        return rows[top], similarities[top]
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        return {
+            "centroids": self.centroids,
+            "list_offsets": self.list_offsets,
+            "list_rows": self.list_rows,
+            "embeddings": self.embeddings,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Mapping[str, np.ndarray]) -> IvfIndex:
+        return cls(
+            arrays["centroids"], arrays["list_offsets"], arrays["list_rows"], arrays["embeddings"]
+        )
+
+
+@dataclass
+class ExplanationSearchResult:
+    entry: ExplanationIndexEntry
+    relevance: float
+    """BM25 score, cosine similarity or reciprocal rank fusion score, depending on the method."""
+
+
+class ExplanationSearchIndex:
+    """BM25 and embedding indexes over the rows of an ExplanationIndex."""
+
+    def __init__(
+        self,
+        explanation_index: ExplanationIndex,
+        bm25_index: Bm25Index,
+        ivf_index: Optional[IvfIndex] = None,
+        embedder: Optional[Embedder] = None,
+    ):
+        assert (ivf_index is None) == (embedder is None)
+        self.explanation_index = explanation_index
+        self.bm25_index = bm25_index
+        self.ivf_index = ivf_index
+        self.embedder = embedder
+        # Set by loads when it creates the embedder itself.
+        self._owns_embedder = False
+
+    async def aclose(self) -> None:
+        """Close the embedder, if the index created it when it was loaded."""
+        if self.embedder is not None and self._owns_embedder:
+            await self.embedder.aclose()
+
+    @classmethod
+    async def build(
+        cls,
+        explanation_index: ExplanationIndex,
+        embedder: Optional[Embedder] = None,
+        num_lists: Optional[int] = None,
+    ) -> ExplanationSearchIndex:
+        """Build the search index. Embedding search is only available if an embedder is given."""
+        bm25_index = Bm25Index.build(explanation_index.explanations)
+        ivf_index = None
+        if embedder is not None:
+            embeddings = await embedder.embed(explanation_index.explanations)
+            ivf_index = IvfIndex.build(embeddings, num_lists=num_lists)
+        return cls(explanation_index, bm25_index, ivf_index, embedder)
+
+    async def search(
+        self,
+        query: str,
+        method: str = "hybrid",
+        limit: int = 20,
+        num_probes: int = 8,
+    ) -> list[ExplanationSearchResult]:
+        """
+        Return the explanations most relevant to the query, most relevant first. method is "bm25",
+        "embedding", or "hybrid", which combines the two rankings by reciprocal rank fusion. Without
+        an embedding index, "hybrid" falls back to "bm25".
+        """
+        if method not in SEARCH_METHODS:
+            raise ValueError(f"Unknown search method {method}, expected one of {SEARCH_METHODS}")
+        if method == "embedding" and self.ivf_index is None:
+            raise ValueError("This search index has no embeddings")
+        if method == "bm25" or (method == "hybrid" and self.ivf_index is None):
+            rows, relevances = self.bm25_index.search(query, limit)
+        elif method == "embedding":
+            rows, relevances = await self._search_embeddings(query, limit, num_probes)
+        else:
+            # Consider more candidates from each ranking than are returned, since the fused ranking
+            # can promote results that are lower in both.
+            rankings = [
+                self.bm25_index.search(query, 4 * limit)[0],
+                (await self._search_embeddings(query, 4 * limit, num_probes))[0],
+            ]
+            rows, relevances = self._reciprocal_rank_fusion(rankings, limit)
+        return [
+            ExplanationSearchResult(
+                entry=self.explanation_index.get_entry(int(row)), relevance=float(relevance)
+            )
+            for row, relevance in zip(rows, relevances)
+        ]
+
+    async def _search_embeddings(
+        self, query: str, limit: int, num_probes: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        assert self.ivf_index is not None and self.embedder is not None
+        query_embedding = (await self.embedder.embed([query]))[0]
+        return self.ivf_index.search(query_embedding, limit, num_probes=num_probes)
+
+    @staticmethod
+    def _reciprocal_rank_fusion(
+        rankings: list[np.ndarray], limit: int, k: int = 60
+    ) -> tuple[np.ndarray, np.ndarray]:
+        fused_scores: dict[int, float] = {}
+        for ranking in rankings:
+            for rank, row in enumerate(ranking.tolist()):
+                fused_scores[row] = fused_scores.get(row, 0.0) + 1.0 / (k + rank + 1)
+        best = sorted(fused_scores.items(), key=lambda item: -item[1])[:limit]
+        return np.array([row for row, _ in best], dtype=np.int32), np.array(
+            [score for _, score in best], dtype=np.float32
+        )
+
+    def dumps(self) -> bytes:
+        arrays = {
+            **{f"explanations_{k}": v for k, v in self.explanation_index.to_arrays().items()},
+            **{f"bm25_{k}": v for k, v in self.bm25_index.to_arrays().items()},
+        }
+        if self.ivf_index is not None and self.embedder is not None:
+            arrays.update({f"ivf_{k}": v for k, v in self.ivf_index.to_arrays().items()})
+            arrays["embedder_name"] = np.array(self.embedder.name)
+        f = io.BytesIO()
+        # Not compressed, since most of the size is embeddings, which don't compress well.
+        np.savez(f, **arrays)
+        return f.getvalue()
+
+    @classmethod
+    def loads(
+        cls, serialized: bytes, embedder: Optional[Embedder] = None
+    ) -> ExplanationSearchIndex:
+        """
+        Load a search index. By default, queries are embedded with an embedder recreated from the
+        name stored with the index.
+        """
+        with np.load(io.BytesIO(serialized), allow_pickle=False) as npz:
+            arrays = dict(npz)
+
+        def with_prefix(prefix: str) -> dict[str, np.ndarray]:
+            return {k[len(prefix) :]: v for k, v in arrays.items() if k.startswith(prefix)}
+
+        ivf_index = None
+        owns_embedder = False
+        if "embedder_name" in arrays:
+            ivf_index = IvfIndex.from_arrays(with_prefix("ivf_"))
+            if embedder is None:
+                embedder = get_embedder(str(arrays["embedder_name"]))
+                owns_embedder = True
+            assert embedder.name == str(arrays["embedder_name"]), embedder.name
+        else:
+            embedder = None
+        search_index = cls(
+            ExplanationIndex.from_arrays(with_prefix("explanations_")),
+            Bm25Index.from_arrays(with_prefix("bm25_")),
+            ivf_index,
+            embedder,
+        )
+        search_index._owns_embedder = owns_embedder
+        return search_index
+
+    def save(self, path: str) -> None:
+        import blobfile as bf
+
+        with bf.BlobFile(path, "wb") as f:
+            f.write(self.dumps())
+
+    @classmethod
+    def load(cls, path: str, embedder: Optional[Embedder] = None) -> ExplanationSearchIndex:
+        import blobfile as bf
+
+        with bf.BlobFile(path, "rb") as f:
+            return cls.loads(f.read(), embedder=embedder)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build a search index over explanations.")
+    parser.add_argument("explanation_index_path")
+    parser.add_argument("search_index_path")
+    parser.add_argument(
+        "--embedder",
+        default=None,
+        help='e.g. "hashing" or "api:text-embedding-3-small". Omit for BM25 search only.',
+    )
+    args = parser.parse_args()
+    explanation_index = ExplanationIndex.load(args.explanation_index_path)
+
+    async def build() -> ExplanationSearchIndex:
+        embedder = get_embedder(args.embedder) if args.embedder is not None else None
+        try:
+            return await ExplanationSearchIndex.build(explanation_index, embedder=embedder)
+        finally:
+            if embedder is not None:
+                await embedder.aclose()
+
+    search_index = asyncio.run(build())
+    search_index.save(args.search_index_path)
+    print(f"Built search index over {len(explanation_index)} explanations")
+
+
+if __name__ == "__main__":
+    main()
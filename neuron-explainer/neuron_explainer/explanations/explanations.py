@@ -8,10 +8,11 @@ from dataclasses import dataclass
 from enum import Enum
 from typing import List, Optional, Union
 
-import blobfile as bf
-import boostedblob as bbb
-from neuron_explainer.activations.activations import NeuronId
+import numpy as np
+from neuron_explainer.activations.activations import NeuronId, _decode_array, _encode_array
+from neuron_explainer.azure import ensure_session
 from neuron_explainer.fast_dataclasses import FastDataclass, loads, register_dataclass
+from neuron_explainer.sharded_archive import get_sharded_archive
 
 
 class ActivationScale(str, Enum):
@@ -68,6 +69,169 @@ class SequenceSimulation(FastDataclass):
     """The result of the simulation before calibration."""
 
 
+# Simulators produce distributions over the normalized activations 0 through 10.
+NUM_DISTRIBUTION_BINS = 11
+
+
+def _get_distribution_bins(distribution_values: list[list[float]]) -> list[list[int]]:
+    bins = []
+    for values in distribution_values:
+        bins.append([int(value) for value in values])
+        if any(value != int(value) or not 0 <= value < NUM_DISTRIBUTION_BINS for value in values):
+            raise ValueError(f"Distribution values {values} are not normalized activations")
+    return bins
+
+
+def _get_bin_values(
+    bins: list[list[int]], distribution_values: list[list[float]]
+) -> list[Optional[float]]:
+    """Return the value of each bin, given values that must be a function of the bin."""
+    bin_values: list[Optional[float]] = [None] * NUM_DISTRIBUTION_BINS
+    for token_bins, token_values in zip(bins, distribution_values):
+        for bin_index, value in zip(token_bins, token_values):
+            if bin_values[bin_index] is None:
+                bin_values[bin_index] = value
+            elif not np.isclose(bin_values[bin_index], value):
+                raise ValueError(
+                    f"Bin {bin_index} maps to both {bin_values[bin_index]} and {value}"
+                )
+    return bin_values
+
+
+@register_dataclass
+@dataclass
+class CompactSequenceSimulation(FastDataclass):
+    """
+    Compact equivalent of a SequenceSimulation (including its uncalibrated_simulation, if any),
+    for storing large numbers of simulations in memory or on disk.
+
+    Per-token distributions are stored in a CSR-style layout: the number of values for each token,
+    the bin (normalized activation, 0-10) of each value, and its probability, as base64-encoded
+    arrays. Distribution values are recovered from a per-simulation table of bin values, which works
+    because calibration maps each bin to the same value for every token. The distribution_values,
+    distribution_probabilities and uncalibrated_simulation properties convert back to lists on
+    access. Probabilities are stored as float32.
+    """
+
+    tokens: list[str]
+    expected_activations: list[float]
+    activation_scale: ActivationScale
+    bin_values: list[Optional[float]]
+    """The value of each bin in activation_scale units. None for bins that never occur."""
+    packed_distribution_lengths: str
+    """uint8 array: the number of distribution values for each token."""
+    packed_distribution_bins: str
+    """uint8 array: the bin of each distribution value, for all tokens."""
+    packed_distribution_probabilities: str
+    """float32 array: the probability of each distribution value, for all tokens."""
+    uncalibrated_expected_activations: Optional[list[float]] = None
+    uncalibrated_activation_scale: Optional[ActivationScale] = None
+    uncalibrated_bin_values: Optional[list[Optional[float]]] = None
+
+    @classmethod
+    def from_sequence_simulation(cls, simulation: SequenceSimulation) -> CompactSequenceSimulation:
+        """
+        Raises ValueError if the simulation's distributions can't be represented, e.g. because
+        distribution values aren't a function of the uncalibrated normalized activation.
+        """
+        uncalibrated_simulation = simulation.uncalibrated_simulation
+        if uncalibrated_simulation is None:
+            bins = _get_distribution_bins(simulation.distribution_values)
+        else:
+            if uncalibrated_simulation.uncalibrated_simulation is not None:
+                raise ValueError("Nested calibration is not supported")
+            if (
+                uncalibrated_simulation.tokens != simulation.tokens
+                or uncalibrated_simulation.distribution_probabilities
+                != simulation.distribution_probabilities
+            ):
+                raise ValueError("Calibrated and uncalibrated simulations don't match")
+            bins = _get_distribution_bins(uncalibrated_simulation.distribution_values)
+        flat_probabilities = [
+            p for token_ps in simulation.distribution_probabilities for p in token_ps
+        ]
+        return cls(
+            tokens=simulation.tokens,
+            expected_activations=simulation.expected_activations,
+            activation_scale=simulation.activation_scale,
+            bin_values=_get_bin_values(bins, simulation.distribution_values),
+            packed_distribution_lengths=_encode_array(
+                np.array([len(token_bins) for token_bins in bins], dtype=np.uint8)
+            ),
+            packed_distribution_bins=_encode_array(
+                np.array([b for token_bins in bins for b in token_bins], dtype=np.uint8)
+            ),
+            packed_distribution_probabilities=_encode_array(
+                np.array(flat_probabilities, dtype=np.float32)
+            ),
+            uncalibrated_expected_activations=(
+                None
+                if uncalibrated_simulation is None
+                else uncalibrated_simulation.expected_activations
+            ),
+            uncalibrated_activation_scale=(
+                None
+                if uncalibrated_simulation is None
+                else uncalibrated_simulation.activation_scale
+            ),
+            uncalibrated_bin_values=(
+                None
+                if uncalibrated_simulation is None
+                else _get_bin_values(bins, uncalibrated_simulation.distribution_values)
+            ),
+        )
+
+    def _split_by_token(self, values: np.ndarray) -> list[list[float]]:
+        lengths = _decode_array(self.packed_distribution_lengths, np.uint8)
+        return (
+            [
+                token_values.tolist()
+                for token_values in np.split(values, np.cumsum(lengths, dtype=np.int64)[:-1])
+            ]
+            if len(lengths) > 0
+            else []
+        )
+
+    def _get_distribution_values(self, bin_values: list[Optional[float]]) -> list[list[float]]:
+        bins = _decode_array(self.packed_distribution_bins, np.uint8)
+        value_array = np.array([np.nan if v is None else v for v in bin_values], dtype=np.float64)
+        return self._split_by_token(value_array[bins])
+
+    @property
+    def distribution_values(self) -> list[list[float]]:
+        return self._get_distribution_values(self.bin_values)
+
+    @property
+    def distribution_probabilities(self) -> list[list[float]]:
+        return self._split_by_token(
+            _decode_array(self.packed_distribution_probabilities, np.float32).astype(np.float64)
+        )
+
+    @property
+    def uncalibrated_simulation(self) -> Optional[SequenceSimulation]:
+        if self.uncalibrated_expected_activations is None:
+            return None
+        assert self.uncalibrated_activation_scale is not None
+        assert self.uncalibrated_bin_values is not None
+        return SequenceSimulation(
+            tokens=self.tokens,
+            expected_activations=self.uncalibrated_expected_activations,
+            activation_scale=self.uncalibrated_activation_scale,
+            distribution_values=self._get_distribution_values(self.uncalibrated_bin_values),
+            distribution_probabilities=self.distribution_probabilities,
+        )
+
+    def to_sequence_simulation(self) -> SequenceSimulation:
+        return SequenceSimulation(
+            tokens=self.tokens,
+            expected_activations=self.expected_activations,
+            activation_scale=self.activation_scale,
+            distribution_values=self.distribution_values,
+            distribution_probabilities=self.distribution_probabilities,
+            uncalibrated_simulation=self.uncalibrated_simulation,
+        )
+
+
 @register_dataclass
 @dataclass
 class ScoredSequenceSimulation(FastDataclass):
@@ -75,7 +239,7 @@ class ScoredSequenceSimulation(FastDataclass):
     SequenceSimulation result with a score (for that sequence only) and ground truth activations.
     """
 
-    simulation: SequenceSimulation
+    simulation: Union[SequenceSimulation, CompactSequenceSimulation]
     """The result of a simulation of neuron activations."""
     true_activations: List[float]
     """Ground truth activations on the sequence (not normalized)"""
@@ -93,6 +257,35 @@ class ScoredSequenceSimulation(FastDataclass):
     """
 
 
+@register_dataclass
+@dataclass
+class LinearCalibration(FastDataclass):
+    """
+    Fitted parameters of a linear calibration, which maps an uncalibrated activation x to
+    slope * x + intercept.
+    """
+
+    slope: float
+    intercept: float
+
+
+@register_dataclass
+@dataclass
+class PercentileMatchingCalibration(FastDataclass):
+    """
+    Fitted parameters of a percentile matching calibration, which maps uncalibrated activations to
+    true activations by interpolating between the two sorted tables.
+    """
+
+    uncalibrated_activations: list[float]
+    """Sorted uncalibrated activations on the calibration set."""
+    true_activations: list[float]
+    """Sorted true activations on the calibration set."""
+
+
+CalibrationParameters = Union[LinearCalibration, PercentileMatchingCalibration]
+
+
 @register_dataclass
 @dataclass
 class ScoredSimulation(FastDataclass):
@@ -113,6 +306,11 @@ class ScoredSimulation(FastDataclass):
     Score based on absolute difference between real and simulated activations.
     absolute_dev_explained_score = 1 - mean(abs(real-predicted))/ mean(abs(real)).
     """
+    calibration: Optional[CalibrationParameters] = None
+    """
+    Fitted calibration used to produce the simulations, if any. Can be passed to
+    CalibratedNeuronSimulator.from_calibration to re-score without re-running calibration.
+    """
 
     def get_preferred_score(self) -> Optional[float]:
         """
@@ -150,10 +348,33 @@ class NeuronSimulationResults(FastDataclass):
     scored_explanations: list[ScoredExplanation]
 
 
+def compact_neuron_simulation_results(
+    neuron_simulation_results: NeuronSimulationResults,
+) -> NeuronSimulationResults:
+    """
+    Replace every SequenceSimulation in the results with a CompactSequenceSimulation, in place.
+    Simulations that can't be compacted are left as they are. Returns the results for convenience.
+    """
+    for scored_explanation in neuron_simulation_results.scored_explanations:
+        scored_simulation = scored_explanation.scored_simulation
+        for scored_sequence_simulation in scored_simulation.scored_sequence_simulations:
+            simulation = scored_sequence_simulation.simulation
+            if isinstance(simulation, SequenceSimulation):
+                try:
+                    scored_sequence_simulation.simulation = (
+                        CompactSequenceSimulation.from_sequence_simulation(simulation)
+                    )
+                except ValueError:
+                    pass
+    return neuron_simulation_results
+
+
 def load_neuron_explanations(
     explanations_path: str, layer_index: Union[str, int], neuron_index: Union[str, int]
 ) -> Optional[NeuronSimulationResults]:
     """Load scored explanations for the specified neuron."""
+    import blobfile as bf
+
     file = bf.join(explanations_path, str(layer_index), f"{neuron_index}.jsonl")
     if not bf.exists(file):
         return None
@@ -163,19 +384,44 @@ def load_neuron_explanations(
     return None
 
 
-@bbb.ensure_session
+@ensure_session
 async def load_neuron_explanations_async(
     explanations_path: str, layer_index: Union[str, int], neuron_index: Union[str, int]
 ) -> Optional[NeuronSimulationResults]:
     """Load scored explanations for the specified neuron, asynchronously."""
+    import blobfile as bf
+
     return await read_explanation_file(
         bf.join(explanations_path, str(layer_index), f"{neuron_index}.jsonl")
     )
 
 
-@bbb.ensure_session
+def load_neuron_explanations_from_archive(
+    archive_path: str, layer_index: Union[str, int], neuron_index: Union[str, int]
+) -> Optional[NeuronSimulationResults]:
+    """
+    Like load_neuron_explanations, but reads from a sharded archive of explanations (see
+    neuron_explainer.sharded_archive), fetching only the neuron's byte range.
+    """
+    raw_contents = get_sharded_archive(archive_path).read(int(layer_index), int(neuron_index))
+    return loads(raw_contents) if raw_contents is not None else None
+
+
+async def load_neuron_explanations_from_archive_async(
+    archive_path: str, layer_index: Union[str, int], neuron_index: Union[str, int]
+) -> Optional[NeuronSimulationResults]:
+    """Async version of load_neuron_explanations_from_archive."""
+    raw_contents = await get_sharded_archive(archive_path).read_async(
+        int(layer_index), int(neuron_index)
+    )
+    return loads(raw_contents) if raw_contents is not None else None
+
+
+@ensure_session
 async def read_file(filename: str) -> Optional[str]:
     """Read the contents of the given file as a string, asynchronously."""
+    import boostedblob as bbb
+
     try:
         raw_contents = await bbb.read.read_single(filename)
     except FileNotFoundError:
@@ -189,14 +435,14 @@ async def read_file(filename: str) -> Optional[str]:
     return lines[0]
 
 
-@bbb.ensure_session
+@ensure_session
 async def read_explanation_file(explanation_filename: str) -> Optional[NeuronSimulationResults]:
     """Load scored explanations from the given filename, asynchronously."""
     line = await read_file(explanation_filename)
     return loads(line) if line is not None else None
 
 
-@bbb.ensure_session
+@ensure_session
 async def read_json_file(filename: str) -> Optional[dict]:
     """Read the contents of the given file as a JSON object, asynchronously."""
     line = await read_file(filename)
@@ -208,13 +454,16 @@ def get_numerical_subdirs(dataset_path: str) -> list[str]:
 
     Used to get all layer directories in an explanation directory.
     """
+    import blobfile as bf
+
+    # scandir says which entries are directories, which avoids a request per entry.
     return [
         str(x)
         for x in sorted(
             [
-                int(x)
-                for x in bf.listdir(dataset_path)
-                if bf.isdir(bf.join(dataset_path, x)) and x.isnumeric()
+                int(entry.name)
+                for entry in bf.scandir(dataset_path)
+                if entry.is_dir and entry.name.isnumeric()
             ]
         )
     ]
@@ -224,6 +473,8 @@ def get_sorted_neuron_indices_from_explanations(
     explanations_path: str, layer: Union[str, int]
 ) -> list[int]:
     """Return the indices of all neurons in this layer, in ascending order."""
+    import blobfile as bf
+
     layer_dir = bf.join(explanations_path, str(layer))
     return sorted(
         [int(f.split(".")[0]) for f in bf.listdir(layer_dir) if f.split(".")[0].isnumeric()]
@@ -3,8 +3,6 @@ from __future__ import annotations
 from enum import Enum
 from typing import TypedDict, Union
 
-import tiktoken
-
 HarmonyMessage = TypedDict(
     "HarmonyMessage",
     {
@@ -56,6 +54,9 @@ class PromptBuilder:
         self._messages.append(HarmonyMessage(role=role, content=message))
 
     def prompt_length_in_tokens(self, prompt_format: PromptFormat) -> int:
+        # Imported here since importing tiktoken is relatively slow.
+        import tiktoken
+
         # TODO(sbills): Make the model/encoding configurable. This implementation assumes GPT-4.
         encoding = tiktoken.get_encoding("cl100k_base")
         if prompt_format == PromptFormat.HARMONY_V4:
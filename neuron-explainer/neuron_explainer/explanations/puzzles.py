@@ -1,6 +1,8 @@
 import json
 import os
 from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
 
 from neuron_explainer.activations.activations import ActivationRecord
 
@@ -42,9 +44,20 @@ def convert_puzzle_dict_to_puzzle(puzzle_dict: dict) -> Puzzle:
     )
 
 
-PUZZLES_BY_NAME: dict[str, Puzzle] = dict()
-script_dir = os.path.dirname(os.path.abspath(__file__))
-with open(os.path.join(script_dir, "puzzles.json"), "r") as f:
-    puzzle_dicts = json.loads(f.read())
-    for name in puzzle_dicts.keys():
-        PUZZLES_BY_NAME[name] = convert_puzzle_dict_to_puzzle(puzzle_dicts[name])
+@lru_cache(maxsize=None)
+def load_puzzles() -> dict[str, Puzzle]:
+    """Load all puzzles from puzzles.json, keyed by name. The result is cached."""
+    puzzles_by_name: dict[str, Puzzle] = dict()
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(script_dir, "puzzles.json"), "r") as f:
+        puzzle_dicts = json.loads(f.read())
+        for name in puzzle_dicts.keys():
+            puzzles_by_name[name] = convert_puzzle_dict_to_puzzle(puzzle_dicts[name])
+    return puzzles_by_name
+
+
+def __getattr__(name: str) -> Any:
+    # PUZZLES_BY_NAME is loaded on first access rather than at import time.
+    if name == "PUZZLES_BY_NAME":
+        return load_puzzles()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
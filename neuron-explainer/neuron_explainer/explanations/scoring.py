@@ -2,20 +2,38 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from typing import Any, Callable, Coroutine, Sequence
+import math
+import random
+from dataclasses import dataclass, field
+from statistics import NormalDist
+from typing import Any, AsyncIterator, Callable, Coroutine, Optional, Sequence
 
 import numpy as np
-from neuron_explainer.activations.activations import ActivationRecord
+from neuron_explainer.activations.activations import ActivationRecord, NeuronId
 from neuron_explainer.explanations.calibrated_simulator import (
     CalibratedNeuronSimulator,
+    CalibrationCache,
     LinearCalibratedNeuronSimulator,
 )
+from neuron_explainer.api_client import SIMULATION_REQUEST_CLASS, ApiClient
 from neuron_explainer.explanations.explanations import (
+    CalibrationParameters,
+    ScoredExplanation,
     ScoredSequenceSimulation,
     ScoredSimulation,
     SequenceSimulation,
 )
-from neuron_explainer.explanations.simulator import ExplanationNeuronSimulator, NeuronSimulator
+from neuron_explainer.explanations.few_shot_examples import FewShotExampleSet
+from neuron_explainer.explanations.prompt_builder import PromptFormat
+from neuron_explainer.explanations.simulator import (
+    ExplanationNeuronSimulator,
+    NeuronSimulator,
+    SimulationStore,
+)
+from neuron_explainer.fast_dataclasses import FastDataclass, register_dataclass
+from neuron_explainer.tracing import traced
+
+logger = logging.getLogger(__name__)
 
 
 def flatten_list(list_of_lists: Sequence[Sequence[Any]]) -> list[Any]:
@@ -41,58 +59,375 @@ def rsquared_score_from_sequences(
     real_activations: Sequence[float] | np.ndarray,
     predicted_activations: Sequence[float] | np.ndarray,
 ) -> float:
-    return float(
-        1
-        - np.mean(np.square(np.array(real_activations) - np.array(predicted_activations)))
-        / np.mean(np.square(np.array(real_activations)))
-    )
+    real = np.asarray(real_activations, dtype=np.float64)
+    predicted = np.asarray(predicted_activations, dtype=np.float64)
+    return float(1 - np.mean(np.square(real - predicted)) / np.mean(np.square(real)))
 
 
 def absolute_dev_explained_score_from_sequences(
     real_activations: Sequence[float] | np.ndarray,
     predicted_activations: Sequence[float] | np.ndarray,
 ) -> float:
-    return float(
-        1
-        - np.mean(np.abs(np.array(real_activations) - np.array(predicted_activations)))
-        / np.mean(np.abs(np.array(real_activations)))
+    real = np.asarray(real_activations, dtype=np.float64)
+    predicted = np.asarray(predicted_activations, dtype=np.float64)
+    return float(1 - np.mean(np.abs(real - predicted)) / np.mean(np.abs(real)))
+
+
+@dataclass
+class BatchedScores:
+    """
+    Scores for one or more explanations of the same neuron on a batch of sequences, as computed by
+    score_sequences_batched. Per-sequence arrays have shape (num_explanations, num_sequences);
+    aggregate arrays have shape (num_explanations,). Undefined scores are NaN.
+    """
+
+    ev_correlation_scores: np.ndarray
+    rsquared_scores: np.ndarray
+    absolute_dev_explained_scores: np.ndarray
+    aggregate_ev_correlation_scores: np.ndarray
+    """Correlation over all activations from all sequences at once, as in ScoredSimulation."""
+    aggregate_rsquared_scores: np.ndarray
+    aggregate_absolute_dev_explained_scores: np.ndarray
+
+
+def _flatten_sequences(
+    sequences: Sequence[Sequence[float]] | np.ndarray, lengths: Optional[np.ndarray]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Flatten ragged or padded sequences into one array. Return the flattened values and the length
+    of each sequence.
+    """
+    if isinstance(sequences, np.ndarray):
+        assert sequences.ndim == 2, sequences.shape
+        if lengths is None:
+            lengths = np.full(sequences.shape[0], sequences.shape[1])
+        mask = np.arange(sequences.shape[1])[None, :] < lengths[:, None]
+        return sequences[mask].astype(np.float64), lengths
+    sequence_lengths = np.array([len(sequence) for sequence in sequences], dtype=np.int64)
+    if lengths is not None:
+        assert np.array_equal(sequence_lengths, lengths), "lengths don't match ragged sequences"
+    return (
+        np.fromiter(
+            (value for sequence in sequences for value in sequence),
+            dtype=np.float64,
+            count=int(sequence_lengths.sum()),
+        ),
+        sequence_lengths,
     )
 
 
+def score_sequences_batched(
+    real_activations: Sequence[Sequence[float]] | np.ndarray,
+    predicted_activations: Sequence[Sequence[Sequence[float]]] | np.ndarray,
+    lengths: Optional[Sequence[int]] = None,
+) -> BatchedScores:
+    """
+    Compute correlation, R^2 and absolute deviation explained scores for many sequences and
+    explanations at once, both per sequence and in aggregate.
+
+    Args:
+        real_activations: true activations for each sequence, either ragged (a list of lists) or
+            padded (an array of shape (num_sequences, max_length)).
+        predicted_activations: predicted activations for each explanation and sequence, either
+            ragged or padded (an array of shape (num_explanations, num_sequences, max_length)).
+        lengths: the length of each sequence. Required for padded inputs unless no padding was used.
+    """
+    length_array = None if lengths is None else np.asarray(lengths, dtype=np.int64)
+    real, length_array = _flatten_sequences(real_activations, length_array)
+    predicted = np.stack(
+        [
+            _flatten_sequences(predicted_for_explanation, length_array)[0]
+            for predicted_for_explanation in predicted_activations
+        ]
+    )
+    num_explanations, num_sequences = predicted.shape[0], len(length_array)
+    # Maps each flattened value to the (explanation, sequence) segment it belongs to.
+    segment_ids = (
+        np.repeat(np.arange(num_sequences), length_array)[None, :]
+        + num_sequences * np.arange(num_explanations)[:, None]
+    )
+
+    def segment_sums(values: np.ndarray) -> np.ndarray:
+        values = np.broadcast_to(values, predicted.shape)
+        return np.bincount(
+            segment_ids.ravel(),
+            weights=values.ravel(),
+            minlength=num_explanations * num_sequences,
+        ).reshape(num_explanations, num_sequences)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Centered moments, per sequence and over all sequences.
+        real_centered = real - (segment_sums(real) / length_array)[:, segment_ids[0]]
+        predicted_centered = predicted - (segment_sums(predicted) / length_array)[:, segment_ids[0]]
+        all_real_centered = real - real.mean()
+        all_predicted_centered = predicted - predicted.mean(axis=1, keepdims=True)
+
+        def correlation(
+            covariance: np.ndarray, real_variance: np.ndarray, predicted_variance: np.ndarray
+        ) -> np.ndarray:
+            return np.clip(covariance / np.sqrt(real_variance * predicted_variance), -1, 1)
+
+        squared_error = np.square(real - predicted)
+        absolute_error = np.abs(real - predicted)
+        return BatchedScores(
+            ev_correlation_scores=correlation(
+                segment_sums(real_centered * predicted_centered),
+                segment_sums(np.square(real_centered)),
+                segment_sums(np.square(predicted_centered)),
+            ),
+            rsquared_scores=1 - segment_sums(squared_error) / segment_sums(np.square(real)),
+            absolute_dev_explained_scores=(
+                1 - segment_sums(absolute_error) / segment_sums(np.abs(real))
+            ),
+            aggregate_ev_correlation_scores=correlation(
+                (all_real_centered * all_predicted_centered).sum(axis=1),
+                np.square(all_real_centered).sum(),
+                np.square(all_predicted_centered).sum(axis=1),
+            ),
+            aggregate_rsquared_scores=1 - squared_error.sum(axis=1) / np.square(real).sum(),
+            aggregate_absolute_dev_explained_scores=(
+                1 - absolute_error.sum(axis=1) / np.abs(real).sum()
+            ),
+        )
+
+
+def score_simulations_batched(
+    activation_records: Sequence[ActivationRecord],
+    simulations_by_explanation: Sequence[Sequence[SequenceSimulation]],
+) -> list[ScoredSimulation]:
+    """
+    Score already-produced simulations of several explanations on the same activation records,
+    returning one ScoredSimulation per explanation.
+    """
+    if len(simulations_by_explanation) == 0:
+        return []
+    batched_scores = score_sequences_batched(
+        [activation_record.activations for activation_record in activation_records],
+        [
+            [simulation.expected_activations for simulation in simulations]
+            for simulations in simulations_by_explanation
+        ],
+    )
+    has_activations = any(
+        len(activation_record.activations) > 0 for activation_record in activation_records
+    )
+    scored_simulations = []
+    for i, simulations in enumerate(simulations_by_explanation):
+        scored_simulations.append(
+            ScoredSimulation(
+                scored_sequence_simulations=[
+                    ScoredSequenceSimulation(
+                        simulation=simulation,
+                        true_activations=activation_record.activations,
+                        ev_correlation_score=float(batched_scores.ev_correlation_scores[i, j]),
+                        rsquared_score=float(batched_scores.rsquared_scores[i, j]),
+                        absolute_dev_explained_score=float(
+                            batched_scores.absolute_dev_explained_scores[i, j]
+                        ),
+                    )
+                    for j, (activation_record, simulation) in enumerate(
+                        zip(activation_records, simulations)
+                    )
+                ],
+                ev_correlation_score=(
+                    float(batched_scores.aggregate_ev_correlation_scores[i])
+                    if has_activations
+                    else None
+                ),
+                rsquared_score=float(batched_scores.aggregate_rsquared_scores[i]),
+                absolute_dev_explained_score=float(
+                    batched_scores.aggregate_absolute_dev_explained_scores[i]
+                ),
+            )
+        )
+    return scored_simulations
+
+
 async def make_explanation_simulator(
     explanation: str,
     calibration_activation_records: Sequence[ActivationRecord],
     model_name: str,
     calibrated_simulator_class: type[CalibratedNeuronSimulator] = LinearCalibratedNeuronSimulator,
+    simulation_store: Optional[SimulationStore] = None,
+    calibration_cache: Optional[CalibrationCache] = None,
+    neuron_id: Optional[NeuronId] = None,
 ) -> CalibratedNeuronSimulator:
     """
     Make a simulator that uses an explanation to predict activations and calibrates it on the given
-    activation records.
+    activation records. The caller owns the simulator and should call its aclose() when done.
+
+    Pass the same simulation_store when making several simulators for one explanation (e.g. to
+    compare calibration methods) so that each sequence is only simulated once. If calibration_cache
+    and neuron_id are set, previously fitted calibration parameters are reused when available.
     """
     simulator = ExplanationNeuronSimulator(model_name, explanation)
-    calibrated_simulator = calibrated_simulator_class(simulator)
-    await calibrated_simulator.calibrate(calibration_activation_records)
+    calibrated_simulator = calibrated_simulator_class(simulator, simulation_store=simulation_store)
+    try:
+        await _calibrate(
+            calibrated_simulator, calibration_activation_records, calibration_cache, neuron_id
+        )
+    except BaseException:
+        await calibrated_simulator.aclose()
+        raise
     return calibrated_simulator
 
 
-async def _simulate_and_score_sequence(
-    simulator: NeuronSimulator, activations: ActivationRecord
-) -> ScoredSequenceSimulation:
-    """Score an explanation of a neuron by how well it predicts activations on a sentence."""
-    simulation = await simulator.simulate(activations.tokens)
+async def _calibrate(
+    calibrated_simulator: CalibratedNeuronSimulator,
+    calibration_activation_records: Sequence[ActivationRecord],
+    calibration_cache: Optional[CalibrationCache],
+    neuron_id: Optional[NeuronId],
+) -> None:
+    if calibration_cache is None:
+        await calibrated_simulator.calibrate(calibration_activation_records)
+    else:
+        assert neuron_id is not None, "neuron_id is required when using a calibration cache"
+        await calibration_cache.calibrate(
+            calibrated_simulator, neuron_id, calibration_activation_records
+        )
+
+
+def _get_calibration(simulator: NeuronSimulator) -> Optional[CalibrationParameters]:
+    if isinstance(simulator, CalibratedNeuronSimulator):
+        return simulator.get_calibration()
+    return None
+
+
+async def _simulate_sequence(
+    simulator: NeuronSimulator,
+    activations: ActivationRecord,
+    simulation_store: Optional[SimulationStore] = None,
+) -> SequenceSimulation:
+    if simulation_store is not None:
+        simulation = await simulation_store.simulate(simulator, activations.tokens)
+    else:
+        simulation = await simulator.simulate(activations.tokens)
     logging.debug(simulation)
-    rsquared_score = score_from_simulation(activations, simulation, rsquared_score_from_sequences)
-    absolute_dev_explained_score = score_from_simulation(
-        activations, simulation, absolute_dev_explained_score_from_sequences
-    )
-    scored_sequence_simulation = ScoredSequenceSimulation(
-        simulation=simulation,
-        true_activations=activations.activations,
-        ev_correlation_score=score_from_simulation(activations, simulation, correlation_score),
-        rsquared_score=rsquared_score,
-        absolute_dev_explained_score=absolute_dev_explained_score,
+    return simulation
+
+
+@register_dataclass
+@dataclass
+class ScoreAccumulator(FastDataclass):
+    """
+    Online accumulator for the aggregate scores of a simulation over many sequences. Sequences can
+    be added as they are scored, scores can be read at any time, and accumulators built on separate
+    shards of the data can be merged (including after serializing them).
+
+    Tracks running means and co-moments, combined with the pairwise update of Chan et al., so the
+    correlation is computed over all activations from all sequences at once, as in
+    ScoredSimulation.
+    """
+
+    num_values: int = 0
+    real_mean: float = 0.0
+    predicted_mean: float = 0.0
+    real_m2: float = 0.0
+    """Sum of squared deviations of the real activations from their mean."""
+    predicted_m2: float = 0.0
+    """Sum of squared deviations of the predicted activations from their mean."""
+    co_moment: float = 0.0
+    """Sum of products of the real and predicted activations' deviations from their means."""
+    sum_squared_real: float = 0.0
+    sum_squared_error: float = 0.0
+    sum_absolute_real: float = 0.0
+    sum_absolute_error: float = 0.0
+    scored_sequence_simulations: Optional[list[ScoredSequenceSimulation]] = field(
+        default_factory=list
     )
-    return scored_sequence_simulation
+    """The sequences added so far, or None if they aren't being kept (e.g. to save memory)."""
+
+    def add(self, scored_sequence_simulation: ScoredSequenceSimulation) -> None:
+        self.add_activations(
+            scored_sequence_simulation.true_activations or [],
+            scored_sequence_simulation.simulation.expected_activations,
+        )
+        if self.scored_sequence_simulations is not None:
+            self.scored_sequence_simulations.append(scored_sequence_simulation)
+
+    def add_activations(
+        self,
+        real_activations: Sequence[float] | np.ndarray,
+        predicted_activations: Sequence[float] | np.ndarray,
+    ) -> None:
+        """Add one sequence's activations without keeping a ScoredSequenceSimulation for it."""
+        real = np.asarray(real_activations, dtype=np.float64)
+        predicted = np.asarray(predicted_activations, dtype=np.float64)
+        assert real.shape == predicted.shape, (real.shape, predicted.shape)
+        if len(real) == 0:
+            return
+        real_centered = real - real.mean()
+        predicted_centered = predicted - predicted.mean()
+        self._merge_moments(
+            ScoreAccumulator(
+                num_values=len(real),
+                real_mean=float(real.mean()),
+                predicted_mean=float(predicted.mean()),
+                real_m2=float(np.dot(real_centered, real_centered)),
+                predicted_m2=float(np.dot(predicted_centered, predicted_centered)),
+                co_moment=float(np.dot(real_centered, predicted_centered)),
+                sum_squared_real=float(np.dot(real, real)),
+                sum_squared_error=float(np.sum(np.square(real - predicted))),
+                sum_absolute_real=float(np.sum(np.abs(real))),
+                sum_absolute_error=float(np.sum(np.abs(real - predicted))),
+                scored_sequence_simulations=None,
+            )
+        )
+
+    def merge(self, other: ScoreAccumulator) -> None:
+        """Add everything accumulated by other (e.g. on another shard) to this accumulator."""
+        self._merge_moments(other)
+        if self.scored_sequence_simulations is not None:
+            if other.scored_sequence_simulations is None:
+                self.scored_sequence_simulations = None
+            else:
+                self.scored_sequence_simulations.extend(other.scored_sequence_simulations)
+
+    def _merge_moments(self, other: ScoreAccumulator) -> None:
+        if other.num_values == 0:
+            return
+        num_values = self.num_values + other.num_values
+        weight = self.num_values * other.num_values / num_values
+        real_delta = other.real_mean - self.real_mean
+        predicted_delta = other.predicted_mean - self.predicted_mean
+        self.real_m2 += other.real_m2 + real_delta**2 * weight
+        self.predicted_m2 += other.predicted_m2 + predicted_delta**2 * weight
+        self.co_moment += other.co_moment + real_delta * predicted_delta * weight
+        self.real_mean += real_delta * other.num_values / num_values
+        self.predicted_mean += predicted_delta * other.num_values / num_values
+        self.num_values = num_values
+        self.sum_squared_real += other.sum_squared_real
+        self.sum_squared_error += other.sum_squared_error
+        self.sum_absolute_real += other.sum_absolute_real
+        self.sum_absolute_error += other.sum_absolute_error
+
+    @property
+    def ev_correlation_score(self) -> Optional[float]:
+        """None if no activations have been added; NaN if either side has zero variance."""
+        if self.num_values == 0:
+            return None
+        with np.errstate(divide="ignore", invalid="ignore"):
+            correlation = np.float64(self.co_moment) / np.sqrt(self.real_m2 * self.predicted_m2)
+        return float(np.clip(correlation, -1, 1))
+
+    @property
+    def rsquared_score(self) -> float:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return float(1 - np.float64(self.sum_squared_error) / self.sum_squared_real)
+
+    @property
+    def absolute_dev_explained_score(self) -> float:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return float(1 - np.float64(self.sum_absolute_error) / self.sum_absolute_real)
+
+    def get_scored_simulation(self) -> ScoredSimulation:
+        """Return a ScoredSimulation with the scores accumulated so far."""
+        return ScoredSimulation(
+            scored_sequence_simulations=list(self.scored_sequence_simulations or []),
+            ev_correlation_score=self.ev_correlation_score,
+            rsquared_score=self.rsquared_score,
+            absolute_dev_explained_score=self.absolute_dev_explained_score,
+        )
 
 
 def aggregate_scored_sequence_simulations(
@@ -103,53 +438,345 @@ def aggregate_scored_sequence_simulations(
     scores, since we want to calculate the correlation over all activations from all sequences at
     once rather than simply averaging per-sequence correlations.
     """
-    all_true_activations: list[float] = []
-    all_expected_values: list[float] = []
+    accumulator = ScoreAccumulator()
     for scored_sequence_simulation in scored_sequence_simulations:
-        all_true_activations.extend(scored_sequence_simulation.true_activations or [])
-        all_expected_values.extend(scored_sequence_simulation.simulation.expected_activations)
-    ev_correlation_score = (
-        correlation_score(all_true_activations, all_expected_values)
-        if len(all_true_activations) > 0
-        else None
-    )
-    rsquared_score = rsquared_score_from_sequences(all_true_activations, all_expected_values)
-    absolute_dev_explained_score = absolute_dev_explained_score_from_sequences(
-        all_true_activations, all_expected_values
-    )
-
-    return ScoredSimulation(
-        scored_sequence_simulations=scored_sequence_simulations,
-        ev_correlation_score=ev_correlation_score,
-        rsquared_score=rsquared_score,
-        absolute_dev_explained_score=absolute_dev_explained_score,
-    )
+        accumulator.add(scored_sequence_simulation)
+    return accumulator.get_scored_simulation()
 
 
+@traced()
 async def simulate_and_score(
     simulator: NeuronSimulator,
     activation_records: Sequence[ActivationRecord],
+    simulation_store: Optional[SimulationStore] = None,
 ) -> ScoredSimulation:
     """
     Score an explanation of a neuron by how well it predicts activations on the given text
     sequences.
+
+    Calibrated simulators consult their own simulation store, if any. simulation_store is only
+    needed to reuse simulations from an uncalibrated simulator.
     """
-    scored_sequence_simulations = await asyncio.gather(
+    simulations = await asyncio.gather(
         *[
-            _simulate_and_score_sequence(
-                simulator,
-                activation_record,
-            )
+            _simulate_sequence(simulator, activation_record, simulation_store=simulation_store)
             for activation_record in activation_records
         ]
     )
-    return aggregate_scored_sequence_simulations(scored_sequence_simulations)
+    # Score all sequences in one batched call once every simulation is available.
+    (scored_simulation,) = score_simulations_batched(activation_records, [simulations])
+    scored_simulation.calibration = _get_calibration(simulator)
+    return scored_simulation
+
+
+@dataclass
+class SequenceScoringResult:
+    """The outcome of simulating and scoring one sequence, from simulate_and_score_as_completed."""
+
+    index: int
+    """Index of the sequence in the activation records passed to simulate_and_score_as_completed."""
+    scored_sequence_simulation: Optional[ScoredSequenceSimulation] = None
+    """The scored simulation, or None if simulation failed or timed out."""
+    error: Optional[Exception] = None
+    """The exception raised while simulating, e.g. asyncio.TimeoutError. None on success."""
+
+
+async def simulate_and_score_as_completed(
+    simulator: NeuronSimulator,
+    activation_records: Sequence[ActivationRecord],
+    simulation_store: Optional[SimulationStore] = None,
+    sequence_timeout_s: Optional[float] = None,
+    timeout_s: Optional[float] = None,
+    accumulator: Optional[ScoreAccumulator] = None,
+) -> AsyncIterator[SequenceScoringResult]:
+    """
+    Streaming version of simulate_and_score: simulate all sequences concurrently and yield a
+    SequenceScoringResult for each one as soon as it finishes, so that one slow request doesn't
+    hold up the others.
+
+    Failures don't stop the stream; they are yielded with the error set. Sequences that take longer
+    than sequence_timeout_s, or that are still running timeout_s after the first call, are cancelled
+    and yielded with an asyncio.TimeoutError. Closing the generator early (e.g. breaking out of the
+    loop and calling aclose()) cancels all sequences that are still running.
+
+    If an accumulator is passed, each successfully scored sequence is added to it, so that
+    accumulator.get_scored_simulation() gives a partial aggregate at any point.
+    """
+
+    async def simulate_sequence(activation_record: ActivationRecord) -> SequenceSimulation:
+        return await asyncio.wait_for(
+            _simulate_sequence(simulator, activation_record, simulation_store=simulation_store),
+            timeout=sequence_timeout_s,
+        )
+
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout_s is None else loop.time() + timeout_s
+    indices_by_task = {
+        asyncio.ensure_future(simulate_sequence(activation_record)): i
+        for i, activation_record in enumerate(activation_records)
+    }
+    pending = set(indices_by_task)
+    try:
+        while len(pending) > 0:
+            remaining_s = None if deadline is None else max(0.0, deadline - loop.time())
+            done, pending = await asyncio.wait(
+                pending, timeout=remaining_s, return_when=asyncio.FIRST_COMPLETED
+            )
+            if len(done) == 0:
+                # The overall timeout expired.
+                timed_out = sorted(pending, key=indices_by_task.__getitem__)
+                for task in timed_out:
+                    task.cancel()
+                await asyncio.gather(*timed_out, return_exceptions=True)
+                pending = set()
+                for task in timed_out:
+                    yield SequenceScoringResult(
+                        index=indices_by_task[task], error=asyncio.TimeoutError()
+                    )
+                return
+            done_tasks = sorted(done, key=indices_by_task.__getitem__)
+            succeeded_tasks = [
+                task for task in done_tasks if not task.cancelled() and task.exception() is None
+            ]
+            scored_sequence_simulations_by_task: dict[asyncio.Future, ScoredSequenceSimulation] = {}
+            if len(succeeded_tasks) > 0:
+                # All sequences that finished together are scored in one batched call.
+                (scored_simulation,) = score_simulations_batched(
+                    [activation_records[indices_by_task[task]] for task in succeeded_tasks],
+                    [[task.result() for task in succeeded_tasks]],
+                )
+                scored_sequence_simulations_by_task = dict(
+                    zip(succeeded_tasks, scored_simulation.scored_sequence_simulations)
+                )
+            for task in done_tasks:
+                index = indices_by_task[task]
+                if task not in scored_sequence_simulations_by_task:
+                    try:
+                        task.result()
+                    except Exception as e:
+                        logger.warning(f"Simulating sequence {index} failed: {e!r}")
+                        yield SequenceScoringResult(index=index, error=e)
+                        continue
+                scored_sequence_simulation = scored_sequence_simulations_by_task[task]
+                if accumulator is not None:
+                    accumulator.add(scored_sequence_simulation)
+                yield SequenceScoringResult(
+                    index=index, scored_sequence_simulation=scored_sequence_simulation
+                )
+    finally:
+        for task in pending:
+            task.cancel()
+        if len(pending) > 0:
+            await asyncio.gather(*pending, return_exceptions=True)
 
 
 async def make_simulator_and_score(
     make_simulator: Coroutine[None, None, NeuronSimulator],
     activation_records: Sequence[ActivationRecord],
 ) -> ScoredSimulation:
-    """Chain together creating the simulator and using it to score activation records."""
+    """
+    Chain together creating the simulator and using it to score activation records. The simulator
+    is closed afterwards.
+    """
     simulator = await make_simulator
-    return await simulate_and_score(simulator, activation_records)
+    try:
+        return await simulate_and_score(simulator, activation_records)
+    finally:
+        await simulator.aclose()
+
+
+async def simulate_and_score_explanations(
+    explanations: Sequence[str],
+    calibration_activation_records: Sequence[ActivationRecord],
+    activation_records: Sequence[ActivationRecord],
+    model_name: str,
+    calibrated_simulator_class: type[CalibratedNeuronSimulator] = LinearCalibratedNeuronSimulator,
+    max_concurrent: Optional[int] = 10,
+    few_shot_example_set: FewShotExampleSet = FewShotExampleSet.ORIGINAL,
+    prompt_format: PromptFormat = PromptFormat.INSTRUCTION_FOLLOWING,
+    simulation_store: Optional[SimulationStore] = None,
+    calibration_cache: Optional[CalibrationCache] = None,
+    neuron_id: Optional[NeuronId] = None,
+) -> list[ScoredExplanation]:
+    """
+    Score several candidate explanations of the same neuron (e.g. the samples returned by
+    generate_explanations), returning one ScoredExplanation per explanation, in order.
+
+    All simulators share one pooled API client, so max_concurrent bounds the total number of
+    concurrent requests. Duplicate explanations are only simulated once. If calibration_cache and
+    neuron_id are set, previously fitted calibration parameters are reused when available.
+    """
+    api_client = ApiClient(
+        model_name=model_name,
+        max_concurrent=max_concurrent,
+        request_class=SIMULATION_REQUEST_CLASS,
+    )
+    if simulation_store is None:
+        simulation_store = SimulationStore()
+    calibrated_simulators = [
+        calibrated_simulator_class(
+            ExplanationNeuronSimulator(
+                model_name,
+                explanation,
+                few_shot_example_set=few_shot_example_set,
+                prompt_format=prompt_format,
+                api_client=api_client,
+            ),
+            simulation_store=simulation_store,
+        )
+        for explanation in explanations
+    ]
+    try:
+        await asyncio.gather(
+            *[
+                _calibrate(
+                    calibrated_simulator,
+                    calibration_activation_records,
+                    calibration_cache,
+                    neuron_id,
+                )
+                for calibrated_simulator in calibrated_simulators
+            ]
+        )
+        simulations_by_explanation = await asyncio.gather(
+            *[
+                asyncio.gather(
+                    *[
+                        calibrated_simulator.simulate(activation_record.tokens)
+                        for activation_record in activation_records
+                    ]
+                )
+                for calibrated_simulator in calibrated_simulators
+            ]
+        )
+    finally:
+        await api_client.aclose()
+    scored_simulations = score_simulations_batched(activation_records, simulations_by_explanation)
+    for scored_simulation, calibrated_simulator in zip(scored_simulations, calibrated_simulators):
+        scored_simulation.calibration = calibrated_simulator.get_calibration()
+    return [
+        ScoredExplanation(explanation=explanation, scored_simulation=scored_simulation)
+        for explanation, scored_simulation in zip(explanations, scored_simulations)
+    ]
+
+
+def correlation_confidence_interval(
+    correlation: float, num_samples: int, confidence: float = 0.95
+) -> tuple[float, float]:
+    """
+    Return an approximate confidence interval for a correlation coefficient, using the Fisher
+    z-transformation. Returns (-1, 1) when there are too few samples or the correlation is NaN.
+
+    Activations of nearby tokens are not independent, so treating each token as a sample makes the
+    interval somewhat optimistic.
+    """
+    if num_samples <= 3 or math.isnan(correlation):
+        return -1.0, 1.0
+    z = math.atanh(max(min(correlation, 1 - 1e-12), -1 + 1e-12))
+    half_width = NormalDist().inv_cdf(0.5 + confidence / 2) / math.sqrt(num_samples - 3)
+    return math.tanh(z - half_width), math.tanh(z + half_width)
+
+
+@dataclass
+class SuccessiveHalvingResult:
+    """Result of successive_halving_simulate_and_score, with one entry per candidate."""
+
+    scored_simulations: list[ScoredSimulation]
+    """Scores on the records each candidate was evaluated on before being eliminated (or not)."""
+    ev_correlation_confidence_intervals: list[tuple[float, float]]
+    """Confidence intervals for each candidate's ev_correlation_score."""
+    best_index: int
+    """Index of the candidate with the highest score among those that were never eliminated."""
+
+    @property
+    def num_records_evaluated(self) -> list[int]:
+        return [
+            len(scored_simulation.scored_sequence_simulations)
+            for scored_simulation in self.scored_simulations
+        ]
+
+
+async def successive_halving_simulate_and_score(
+    simulators: Sequence[NeuronSimulator],
+    activation_records: Sequence[ActivationRecord],
+    initial_num_records: int = 4,
+    keep_fraction: float = 0.5,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> SuccessiveHalvingResult:
+    """
+    Select the best of several candidate simulators (typically one per explanation) without scoring
+    every candidate on every record.
+
+    All candidates are scored on a random subset of initial_num_records records. In each subsequent
+    round the number of records doubles, and only the top keep_fraction of the remaining candidates
+    are scored on the new records. Candidates whose confidence interval lies entirely below the
+    leader's are also dropped. Rounds continue until one candidate remains or the records run out.
+
+    Candidates are compared by ev_correlation_score, which doesn't depend on linear calibration, so
+    UncalibratedNeuronSimulator can be used to avoid spending API calls on calibration.
+    """
+    assert len(simulators) > 0
+    assert initial_num_records > 0, initial_num_records
+    assert 0 < keep_fraction < 1, keep_fraction
+    # The records are usually ordered top-activating records first, then random ones, so evaluate
+    # them in a random order to make each round's records representative of the whole set.
+    shuffled_records = list(activation_records)
+    random.Random(seed).shuffle(shuffled_records)
+
+    accumulators = [ScoreAccumulator() for _ in simulators]
+    scored_simulations: list[Optional[ScoredSimulation]] = [None for _ in simulators]
+    intervals: list[tuple[float, float]] = [(-1.0, 1.0) for _ in simulators]
+    remaining = list(range(len(simulators)))
+    num_records_scored = 0
+    num_records_target = min(initial_num_records, len(shuffled_records))
+    while True:
+        new_records = shuffled_records[num_records_scored:num_records_target]
+        new_scored_simulations = await asyncio.gather(
+            *[simulate_and_score(simulators[i], new_records) for i in remaining]
+        )
+        for i, new_scored_simulation in zip(remaining, new_scored_simulations):
+            for scored_sequence_simulation in new_scored_simulation.scored_sequence_simulations:
+                accumulators[i].add(scored_sequence_simulation)
+            scored_simulations[i] = accumulators[i].get_scored_simulation()
+            intervals[i] = correlation_confidence_interval(
+                _score_or_nan(scored_simulations[i]), accumulators[i].num_values, confidence
+            )
+        num_records_scored = num_records_target
+
+        remaining.sort(key=lambda i: _ranking_score(scored_simulations[i]), reverse=True)
+        if len(remaining) == 1 or num_records_scored == len(shuffled_records):
+            break
+        leader_lower_bound = intervals[remaining[0]][0]
+        remaining = [
+            i
+            for i in remaining[: max(1, math.ceil(len(remaining) * keep_fraction))]
+            if intervals[i][1] >= leader_lower_bound
+        ]
+        if len(remaining) == 1:
+            break
+        num_records_target = min(2 * num_records_scored, len(shuffled_records))
+        if num_records_target == num_records_scored:
+            # No new records to score, so another round can't change the result.
+            break
+
+    return SuccessiveHalvingResult(
+        scored_simulations=[
+            scored_simulation
+            for scored_simulation in scored_simulations
+            if scored_simulation is not None
+        ],
+        ev_correlation_confidence_intervals=intervals,
+        best_index=remaining[0],
+    )
+
+
+def _score_or_nan(scored_simulation: Optional[ScoredSimulation]) -> float:
+    score = None if scored_simulation is None else scored_simulation.get_preferred_score()
+    return math.nan if score is None else score
+
+
+def _ranking_score(scored_simulation: Optional[ScoredSimulation]) -> float:
+    """Like _score_or_nan, but undefined scores rank below all others."""
+    score = _score_or_nan(scored_simulation)
+    return -math.inf if math.isnan(score) else score
@@ -3,10 +3,12 @@
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
 from abc import ABC, abstractmethod
 from collections import OrderedDict
 from enum import Enum
+from functools import lru_cache
 from typing import Any, Optional, Sequence, Union
 
 import numpy as np
@@ -17,7 +19,7 @@ from neuron_explainer.activations.activation_records import (
     normalize_activations,
 )
 from neuron_explainer.activations.activations import ActivationRecord
-from neuron_explainer.api_client import ApiClient
+from neuron_explainer.api_client import SIMULATION_REQUEST_CLASS, ApiClient
 from neuron_explainer.explanations.explainer import EXPLANATION_PREFIX
 from neuron_explainer.explanations.explanations import ActivationScale, SequenceSimulation
 from neuron_explainer.explanations.few_shot_examples import FewShotExampleSet
@@ -27,6 +29,7 @@ from neuron_explainer.explanations.prompt_builder import (
     PromptFormat,
     Role,
 )
+from neuron_explainer.tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -183,6 +186,7 @@ def was_token_split(current_token: str, response_tokens: Sequence[str], start_in
     return token_was_split
 
 
+@traced()
 def parse_simulation_response(
     response: dict[str, Any],
     prompt_format: PromptFormat,
@@ -289,6 +293,27 @@ def parse_simulation_response(
     )
 
 
+# Formatting is cached since the same few-shot examples and sequences are formatted once per
+# explanation when scoring many explanations for the same neuron.
+@lru_cache(maxsize=None)
+def _format_few_shot_activation_records_for_simulation(
+    few_shot_example_set: FewShotExampleSet,
+) -> list[str]:
+    return [
+        format_activation_records(
+            example.activation_records,
+            calculate_max_activation(example.activation_records),
+            start_indices=example.first_revealed_activation_indices,
+        )
+        for example in few_shot_example_set.get_examples()
+    ]
+
+
+@lru_cache(maxsize=4096)
+def _format_sequence_for_simulation(tokens: tuple[str, ...]) -> str:
+    return format_sequences_for_simulation([tokens])
+
+
 class NeuronSimulator(ABC):
     """Abstract base class for simulating neuron behavior."""
 
@@ -297,6 +322,84 @@ class NeuronSimulator(ABC):
         """Simulate the behavior of a neuron based on an explanation."""
         ...
 
+    def get_simulation_cache_key(self) -> Optional[str]:
+        """
+        Return a string identifying the explanation and every configuration option that affects
+        this simulator's output, or None if its simulations should not be reused.
+        """
+        return None
+
+    async def aclose(self) -> None:
+        """
+        Release resources held by the simulator, e.g. an API client it created for itself. Whoever
+        creates a simulator should call this when done with it.
+        """
+        pass
+
+
+def _make_explanation_simulation_cache_key(
+    simulator: Union[
+        ExplanationNeuronSimulator,
+        ExplanationTokenByTokenSimulator,
+        LogprobFreeExplanationTokenSimulator,
+    ]
+) -> str:
+    return json.dumps(
+        {
+            "simulator": type(simulator).__name__,
+            "model_name": simulator.api_client.model_name,
+            "explanation": simulator.explanation,
+            "few_shot_example_set": simulator.few_shot_example_set.value,
+            "prompt_format": simulator.prompt_format.value,
+        },
+        sort_keys=True,
+    )
+
+
+class SimulationStore:
+    """
+    In-memory store of simulation results keyed by (explanation, simulator config, tokens), used to
+    avoid re-simulating the same sequences, e.g. when comparing several calibration methods for one
+    explanation. Concurrent requests for the same key share a single simulation.
+    """
+
+    def __init__(self) -> None:
+        self._simulations: dict[tuple[str, tuple[str, ...]], SequenceSimulation] = {}
+        self._in_flight: dict[tuple[str, tuple[str, ...]], asyncio.Task] = {}
+        self.num_simulations = 0
+        """The number of simulations actually performed (i.e. store misses)."""
+
+    def add(
+        self, simulator: NeuronSimulator, tokens: Sequence[str], simulation: SequenceSimulation
+    ) -> None:
+        """Store a simulation that was produced outside of the store."""
+        cache_key = simulator.get_simulation_cache_key()
+        if cache_key is not None:
+            self._simulations[(cache_key, tuple(tokens))] = simulation
+
+    async def simulate(
+        self, simulator: NeuronSimulator, tokens: Sequence[str]
+    ) -> SequenceSimulation:
+        """Return a stored simulation of the tokens if there is one, otherwise simulate them."""
+        cache_key = simulator.get_simulation_cache_key()
+        if cache_key is None:
+            return await simulator.simulate(tokens)
+        key = (cache_key, tuple(tokens))
+        if key in self._simulations:
+            return self._simulations[key]
+        if key not in self._in_flight:
+            self.num_simulations += 1
+            self._in_flight[key] = asyncio.ensure_future(simulator.simulate(tokens))
+        task = self._in_flight[key]
+        try:
+            # Shield the shared task so that cancelling one caller doesn't cancel the others.
+            simulation = await asyncio.shield(task)
+        finally:
+            if task.done() and self._in_flight.get(key) is task:
+                del self._in_flight[key]
+        self._simulations[key] = simulation
+        return simulation
+
 
 class ExplanationNeuronSimulator(NeuronSimulator):
     """
@@ -314,14 +417,34 @@ class ExplanationNeuronSimulator(NeuronSimulator):
         few_shot_example_set: FewShotExampleSet = FewShotExampleSet.ORIGINAL,
         prompt_format: PromptFormat = PromptFormat.INSTRUCTION_FOLLOWING,
         cache: bool = False,
+        # If set, requests are made with this client (e.g. one shared by several simulators) and
+        # max_concurrent and cache are ignored.
+        api_client: Optional[ApiClient] = None,
     ):
-        self.api_client = ApiClient(
-            model_name=model_name, max_concurrent=max_concurrent, cache=cache
-        )
+        if api_client is not None:
+            assert api_client.model_name == model_name, (api_client.model_name, model_name)
+            self.api_client = api_client
+        else:
+            self.api_client = ApiClient(
+                model_name=model_name,
+                max_concurrent=max_concurrent,
+                cache=cache,
+                request_class=SIMULATION_REQUEST_CLASS,
+            )
+        # Shared clients are closed by their owner, not by this simulator.
+        self._owns_api_client = api_client is None
         self.explanation = explanation
         self.few_shot_example_set = few_shot_example_set
         self.prompt_format = prompt_format
 
+    def get_simulation_cache_key(self) -> Optional[str]:
+        return _make_explanation_simulation_cache_key(self)
+
+    async def aclose(self) -> None:
+        if self._owns_api_client:
+            await self.api_client.aclose()
+
+    @traced()
     async def simulate(
         self,
         tokens: Sequence[str],
@@ -367,17 +490,17 @@ The activation format is token<tab>activation, activations go from 0 to 10, "unk
         )
 
         few_shot_examples = self.few_shot_example_set.get_examples()
-        for i, example in enumerate(few_shot_examples):
+        all_formatted_activation_records = _format_few_shot_activation_records_for_simulation(
+            self.few_shot_example_set
+        )
+        for i, (example, formatted_activation_records) in enumerate(
+            zip(few_shot_examples, all_formatted_activation_records)
+        ):
             prompt_builder.add_message(
                 Role.USER,
                 f"\n\nNeuron {i + 1}\nExplanation of neuron {i + 1} behavior: {EXPLANATION_PREFIX} "
                 f"{example.explanation}",
             )
-            formatted_activation_records = format_activation_records(
-                example.activation_records,
-                calculate_max_activation(example.activation_records),
-                start_indices=example.first_revealed_activation_indices,
-            )
             prompt_builder.add_message(
                 Role.ASSISTANT, f"\nActivations: {formatted_activation_records}\n"
             )
@@ -389,7 +512,7 @@ The activation format is token<tab>activation, activations go from 0 to 10, "unk
             f"{self.explanation.strip()}",
         )
         prompt_builder.add_message(
-            Role.ASSISTANT, f"\nActivations: {format_sequences_for_simulation([tokens])}"
+            Role.ASSISTANT, f"\nActivations: {_format_sequence_for_simulation(tuple(tokens))}"
         )
         return prompt_builder.build(self.prompt_format)
 
@@ -411,17 +534,37 @@ class ExplanationTokenByTokenSimulator(NeuronSimulator):
         few_shot_example_set: FewShotExampleSet = FewShotExampleSet.NEWER,
         prompt_format: PromptFormat = PromptFormat.INSTRUCTION_FOLLOWING,
         cache: bool = False,
+        # If set, requests are made with this client (e.g. one shared by several simulators) and
+        # max_concurrent and cache are ignored.
+        api_client: Optional[ApiClient] = None,
     ):
         assert (
             few_shot_example_set != FewShotExampleSet.ORIGINAL
         ), "This simulator doesn't support the ORIGINAL few-shot example set."
-        self.api_client = ApiClient(
-            model_name=model_name, max_concurrent=max_concurrent, cache=cache
-        )
+        if api_client is not None:
+            assert api_client.model_name == model_name, (api_client.model_name, model_name)
+            self.api_client = api_client
+        else:
+            self.api_client = ApiClient(
+                model_name=model_name,
+                max_concurrent=max_concurrent,
+                cache=cache,
+                request_class=SIMULATION_REQUEST_CLASS,
+            )
+        # Shared clients are closed by their owner, not by this simulator.
+        self._owns_api_client = api_client is None
         self.explanation = explanation
         self.few_shot_example_set = few_shot_example_set
         self.prompt_format = prompt_format
 
+    def get_simulation_cache_key(self) -> Optional[str]:
+        return _make_explanation_simulation_cache_key(self)
+
+    async def aclose(self) -> None:
+        if self._owns_api_client:
+            await self.api_client.aclose()
+
+    @traced()
     async def simulate(
         self,
         tokens: Sequence[str],
@@ -698,17 +841,37 @@ class LogprobFreeExplanationTokenSimulator(NeuronSimulator):
         few_shot_example_set: FewShotExampleSet = FewShotExampleSet.NEWER,
         prompt_format: PromptFormat = PromptFormat.HARMONY_V4,
         cache: bool = False,
+        # If set, requests are made with this client (e.g. one shared by several simulators) and
+        # max_concurrent and cache are ignored.
+        api_client: Optional[ApiClient] = None,
     ):
         assert (
             few_shot_example_set != FewShotExampleSet.ORIGINAL
         ), "This simulator doesn't support the ORIGINAL few-shot example set."
-        self.api_client = ApiClient(
-            model_name=model_name, max_concurrent=max_concurrent, cache=cache
-        )
+        if api_client is not None:
+            assert api_client.model_name == model_name, (api_client.model_name, model_name)
+            self.api_client = api_client
+        else:
+            self.api_client = ApiClient(
+                model_name=model_name,
+                max_concurrent=max_concurrent,
+                cache=cache,
+                request_class=SIMULATION_REQUEST_CLASS,
+            )
+        # Shared clients are closed by their owner, not by this simulator.
+        self._owns_api_client = api_client is None
         self.explanation = explanation
         self.few_shot_example_set = few_shot_example_set
         self.prompt_format = prompt_format
 
+    def get_simulation_cache_key(self) -> Optional[str]:
+        return _make_explanation_simulation_cache_key(self)
+
+    async def aclose(self) -> None:
+        if self._owns_api_client:
+            await self.api_client.aclose()
+
+    @traced()
     async def simulate(
         self,
         tokens: Sequence[str],
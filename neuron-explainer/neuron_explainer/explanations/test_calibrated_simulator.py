@@ -0,0 +1,116 @@
+import asyncio
+from typing import Optional, Sequence
+
+import numpy as np
+import pytest
+
+from neuron_explainer.activations.activations import ActivationRecord, NeuronId
+from neuron_explainer.explanations.calibrated_simulator import (
+    CalibrationCache,
+    LinearCalibratedNeuronSimulator,
+    PercentileMatchingCalibratedNeuronSimulator,
+    UncalibratedNeuronSimulator,
+)
+from neuron_explainer.explanations.explanations import ActivationScale, SequenceSimulation
+from neuron_explainer.explanations.simulator import NeuronSimulator
+
+
+class TokenLengthSimulator(NeuronSimulator):
+    """Predicts each token's length, with a distribution over the length and the length + 1."""
+
+    def __init__(self) -> None:
+        self.num_calls = 0
+
+    def get_simulation_cache_key(self) -> Optional[str]:
+        return "token_length"
+
+    async def simulate(self, tokens: Sequence[str]) -> SequenceSimulation:
+        self.num_calls += 1
+        return SequenceSimulation(
+            tokens=list(tokens),
+            expected_activations=[len(token) + 0.5 for token in tokens],
+            activation_scale=ActivationScale.SIMULATED_NORMALIZED_ACTIVATIONS,
+            distribution_values=[[float(len(token)), len(token) + 1.0] for token in tokens],
+            distribution_probabilities=[[0.5, 0.5] for _ in tokens],
+        )
+
+
+CALIBRATION_RECORDS = [
+    ActivationRecord(tokens=["a", "bb", "ccc", "dddd"], activations=[0.1, 0.9, 1.4, 2.2]),
+    ActivationRecord(tokens=["eeeee", "f"], activations=[2.4, 0.0]),
+]
+
+
+def test_linear_calibration_matches_least_squares() -> None:
+    simulator = LinearCalibratedNeuronSimulator(TokenLengthSimulator())
+    asyncio.run(simulator.calibrate(CALIBRATION_RECORDS))
+    true_activations = [a for record in CALIBRATION_RECORDS for a in record.activations]
+    uncalibrated_activations = [
+        len(token) + 0.5 for record in CALIBRATION_RECORDS for token in record.tokens
+    ]
+    slope, intercept = np.polyfit(uncalibrated_activations, true_activations, 1)
+    assert simulator.slope == pytest.approx(slope)
+    assert simulator.intercept == pytest.approx(intercept)
+
+
+@pytest.mark.parametrize(
+    "calibrated_simulator_class",
+    [LinearCalibratedNeuronSimulator, PercentileMatchingCalibratedNeuronSimulator],
+)
+def test_simulate_calibrates_all_values(calibrated_simulator_class: type) -> None:
+    simulator = calibrated_simulator_class(TokenLengthSimulator())
+    asyncio.run(simulator.calibrate(CALIBRATION_RECORDS))
+    simulation = asyncio.run(simulator.simulate(["gg", "h", "iiiiiii"]))
+    uncalibrated_simulation = simulation.uncalibrated_simulation
+    assert uncalibrated_simulation is not None
+    assert simulation.expected_activations == pytest.approx(
+        simulator.apply_calibration(uncalibrated_simulation.expected_activations)
+    )
+    for values, uncalibrated_values in zip(
+        simulation.distribution_values, uncalibrated_simulation.distribution_values
+    ):
+        assert values == pytest.approx(simulator.apply_calibration(uncalibrated_values))
+
+
+@pytest.mark.parametrize(
+    "calibrated_simulator_class",
+    [
+        LinearCalibratedNeuronSimulator,
+        PercentileMatchingCalibratedNeuronSimulator,
+        UncalibratedNeuronSimulator,
+    ],
+)
+def test_calibration_cache_reuses_calibration(calibrated_simulator_class: type) -> None:
+    neuron_id = NeuronId(layer_index=1, neuron_index=2)
+    simulator = calibrated_simulator_class(TokenLengthSimulator())
+    cache = CalibrationCache()
+    assert not asyncio.run(cache.calibrate(simulator, neuron_id, CALIBRATION_RECORDS))
+    # Round trip through serialization, as when the cache is reused in a later run.
+    restored_cache = CalibrationCache.loads(cache.dumps())
+    assert len(restored_cache) == 1
+
+    uncalibrated_simulator = TokenLengthSimulator()
+    cached_simulator = calibrated_simulator_class(uncalibrated_simulator)
+    assert asyncio.run(restored_cache.calibrate(cached_simulator, neuron_id, CALIBRATION_RECORDS))
+    assert uncalibrated_simulator.num_calls == 0
+    assert cached_simulator.get_calibration() == simulator.get_calibration()
+    tokens = ["gg", "h", "iiiiiii"]
+    expected_simulation = asyncio.run(simulator.simulate(tokens))
+    assert asyncio.run(cached_simulator.simulate(tokens)).expected_activations == pytest.approx(
+        expected_simulation.expected_activations
+    )
+
+    # A different neuron misses the cache.
+    other_neuron_id = NeuronId(layer_index=1, neuron_index=3)
+    assert not asyncio.run(
+        restored_cache.calibrate(cached_simulator, other_neuron_id, CALIBRATION_RECORDS)
+    )
+
+
+def test_from_calibration_rejects_mismatched_parameters() -> None:
+    simulator = LinearCalibratedNeuronSimulator(TokenLengthSimulator())
+    asyncio.run(simulator.calibrate(CALIBRATION_RECORDS))
+    with pytest.raises(ValueError):
+        PercentileMatchingCalibratedNeuronSimulator.from_calibration(
+            TokenLengthSimulator(), simulator.get_calibration()
+        )
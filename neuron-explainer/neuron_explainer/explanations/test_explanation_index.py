@@ -0,0 +1,109 @@
+import asyncio
+import os
+from pathlib import Path
+from typing import Optional
+
+import pytest
+from boostedblob.globals import config
+
+from neuron_explainer.activations.activations import NeuronId
+from neuron_explainer.explanations.explanation_index import (
+    ExplanationIndex,
+    build_explanation_index,
+)
+from neuron_explainer.explanations.explanations import (
+    NeuronSimulationResults,
+    ScoredExplanation,
+    ScoredSimulation,
+)
+from neuron_explainer.fast_dataclasses import dumps
+
+
+def _make_results(
+    layer_index: int, neuron_index: int, explanations_and_scores: list[tuple[str, Optional[float]]]
+) -> NeuronSimulationResults:
+    return NeuronSimulationResults(
+        neuron_id=NeuronId(layer_index=layer_index, neuron_index=neuron_index),
+        scored_explanations=[
+            ScoredExplanation(
+                explanation=explanation,
+                scored_simulation=ScoredSimulation(
+                    scored_sequence_simulations=[], ev_correlation_score=score
+                ),
+            )
+            for explanation, score in explanations_and_scores
+        ],
+    )
+
+
+def _make_index() -> ExplanationIndex:
+    return ExplanationIndex.from_neuron_simulation_results(
+        [
+            _make_results(1, 0, [("the word 'dog'", 0.7), ("animals", 0.2)]),
+            _make_results(0, 3, [("Dogs and cats", 0.9)]),
+            _make_results(0, 1, [("dog, in French", None)]),
+            _make_results(2, 5, [("the number 7", 0.65)]),
+        ]
+    )
+
+
+def test_explanation_index_query() -> None:
+    index = _make_index()
+    assert len(index) == 5
+
+    results = index.query(text="dog", min_score=0.6)
+    assert [(r.neuron_id.layer_index, r.neuron_id.neuron_index) for r in results] == [(1, 0)]
+    assert results[0].explanation == "the word 'dog'"
+    assert results[0].scores["ev_correlation_score"] is not None
+    assert results[0].scores["rsquared_score"] is None
+
+    # Unscored explanations only match without a score range, and come last.
+    assert [r.explanation for r in index.query(text="Dog")] == [
+        "the word 'dog'",
+        "dog, in French",
+    ]
+    assert [r.explanation for r in index.query(text="the", layer_indices=[2])] == ["the number 7"]
+    assert [r.explanation for r in index.query(min_score=0.6, limit=2)] == [
+        "Dogs and cats",
+        "the word 'dog'",
+    ]
+    assert index.query(text="dog cat") == []
+    assert index.query(text="unicorn") == []
+
+
+def test_explanation_index_round_trip() -> None:
+    index = _make_index()
+    restored_index = ExplanationIndex.loads(index.dumps())
+    assert restored_index.explanations == index.explanations
+    assert restored_index.words == index.words
+    assert restored_index.query(text="dogs cats") == index.query(text="dogs cats")
+    assert restored_index.query(min_score=0.5) == index.query(min_score=0.5)
+
+
+def test_build_explanation_index(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    all_results = [
+        _make_results(1, 0, [("the word 'dog'", 0.7), ("animals", 0.2)]),
+        _make_results(0, 3, [("Dogs and cats", 0.9)]),
+        _make_results(0, 1, [("dog, in French", None)]),
+    ]
+    for results in all_results:
+        layer_dir = os.path.join(tmp_path, str(results.neuron_id.layer_index))
+        os.makedirs(layer_dir, exist_ok=True)
+        with open(os.path.join(layer_dir, f"{results.neuron_id.neuron_index}.jsonl"), "wb") as f:
+            f.write(dumps(results) + b"\n")
+    num_closed_sessions = 0
+    close_session = config._close_session
+
+    async def count_closed_sessions() -> None:
+        nonlocal num_closed_sessions
+        num_closed_sessions += 1
+        await close_session()
+
+    # All reads share one session, rather than the first read to finish closing it.
+    monkeypatch.setattr(config, "_close_session", count_closed_sessions)
+    index = asyncio.run(build_explanation_index(str(tmp_path)))
+    assert num_closed_sessions == 1
+    expected_index = ExplanationIndex.from_neuron_simulation_results(all_results)
+    assert index.explanations == expected_index.explanations
+    assert index.query(min_score=0.0) == expected_index.query(min_score=0.0)
+    assert index.query(text="dog") == expected_index.query(text="dog")
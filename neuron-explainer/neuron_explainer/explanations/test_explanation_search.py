@@ -0,0 +1,157 @@
+import asyncio
+
+import httpx
+import numpy as np
+import orjson
+import pytest
+from neuron_explainer.api_client import ApiClient
+from neuron_explainer.explanations.explanation_index import ExplanationIndex
+from neuron_explainer.explanations.explanation_search import (
+    ApiEmbedder,
+    ExplanationSearchIndex,
+    HashingEmbedder,
+    IvfIndex,
+)
+from neuron_explainer.explanations.test_explanation_index import _make_results
+
+
+def _make_search_index() -> ExplanationSearchIndex:
+    explanation_index = ExplanationIndex.from_neuron_simulation_results(
+        [
+            _make_results(0, 0, [("dogs and other pets", 0.5)]),
+            _make_results(0, 1, [("the word 'dog' and the word 'puppy'", 0.4)]),
+            _make_results(0, 2, [("numbers in a list", 0.3)]),
+            _make_results(1, 0, [("references to dogs barking", 0.6)]),
+            _make_results(1, 1, [("closing parentheses", 0.2)]),
+        ]
+    )
+    return asyncio.run(
+        ExplanationSearchIndex.build(explanation_index, embedder=HashingEmbedder(), num_lists=2)
+    )
+
+
+def _search(
+    search_index: ExplanationSearchIndex, query: str, method: str, limit: int = 20
+) -> list[tuple[int, int]]:
+    results = asyncio.run(search_index.search(query, method=method, limit=limit, num_probes=2))
+    return [(r.entry.neuron_id.layer_index, r.entry.neuron_id.neuron_index) for r in results]
+
+
+def test_explanation_search() -> None:
+    search_index = _make_search_index()
+    # Words are matched exactly, so "dogs" doesn't match "dog".
+    assert _search(search_index, "dogs", "bm25") == [(0, 0), (1, 0)]
+    assert _search(search_index, "Parentheses!", "bm25") == [(1, 1)]
+    assert _search(search_index, "unicorns", "bm25") == []
+    # Searching with all probes is exact, so the query's own text is the nearest neighbour.
+    assert _search(search_index, "numbers in a list", "embedding", limit=1) == [(0, 2)]
+    hybrid_results = _search(search_index, "dogs barking", "hybrid", limit=3)
+    assert hybrid_results[0] == (1, 0)
+    assert len(hybrid_results) == 3
+
+
+def test_explanation_search_round_trip() -> None:
+    search_index = _make_search_index()
+    restored_search_index = ExplanationSearchIndex.loads(search_index.dumps())
+    assert restored_search_index.embedder is not None
+    assert restored_search_index.embedder.name == "hashing:512"
+    for method in ["bm25", "embedding", "hybrid"]:
+        assert _search(restored_search_index, "dog", method) == _search(search_index, "dog", method)
+
+
+def test_ivf_index_finds_nearest_neighbours() -> None:
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(1000, 16)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    ivf_index = IvfIndex.build(embeddings, num_lists=10)
+    recalled = 0
+    for query_embedding in embeddings[:50]:
+        exact_rows = np.argsort(-(embeddings @ query_embedding))[:10]
+        rows, _ = ivf_index.search(query_embedding, limit=10, num_probes=3)
+        recalled += len(set(rows.tolist()) & set(exact_rows.tolist()))
+    assert recalled / 500 > 0.6
+
+
+def test_api_embedder_batches_requests(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    requests = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        body = orjson.loads(request.content)
+        requests.append((request.url.path, body["input"]))
+        # Results may come back in any order.
+        data = [
+            {"index": i, "embedding": [float(len(text)), 0.0]}
+            for i, text in enumerate(body["input"])
+        ]
+        return httpx.Response(200, json={"data": data[::-1]})
+
+    embedder = ApiEmbedder(
+        model_name="fake-embedding-model",
+        batch_size=2,
+        api_client=ApiClient(
+            model_name="fake-embedding-model", http_transport=httpx.MockTransport(handle)
+        ),
+    )
+    embeddings = asyncio.run(embedder.embed(["a", "bb", "ccc"]))
+    assert sorted(requests) == [("/v1/embeddings", ["a", "bb"]), ("/v1/embeddings", ["ccc"])]
+    assert embeddings.shape == (3, 2)
+    assert np.allclose(embeddings, [[1.0, 0.0]] * 3)
+
+
+def test_api_embedder_limits_concurrent_batches(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    num_in_flight = 0
+    max_in_flight = 0
+
+    async def handle(request: httpx.Request) -> httpx.Response:
+        nonlocal num_in_flight, max_in_flight
+        num_in_flight += 1
+        max_in_flight = max(max_in_flight, num_in_flight)
+        await asyncio.sleep(0.01)
+        num_in_flight -= 1
+        body = orjson.loads(request.content)
+        return httpx.Response(
+            200, json={"data": [{"index": 0, "embedding": [1.0, 0.0]} for _ in body["input"]]}
+        )
+
+    shared_client = ApiClient(
+        model_name="fake-embedding-model", http_transport=httpx.MockTransport(handle)
+    )
+    embedder = ApiEmbedder(batch_size=1, api_client=shared_client, max_concurrent_batches=2)
+
+    async def embed_and_close() -> np.ndarray:
+        embeddings = await embedder.embed([str(i) for i in range(6)])
+        await embedder.aclose()
+        # The embedder doesn't close a client it was given.
+        http_client = shared_client._http_client
+        assert http_client is not None and not http_client.is_closed
+        await shared_client.aclose()
+        return embeddings
+
+    assert asyncio.run(embed_and_close()).shape == (6, 2)
+    assert max_in_flight == 2
+
+
+def test_api_embedder_closes_its_own_client() -> None:
+    embedder = ApiEmbedder()
+
+    async def open_and_close() -> httpx.AsyncClient:
+        http_client = embedder.api_client._get_http_client()
+        await embedder.aclose()
+        return http_client
+
+    assert asyncio.run(open_and_close()).is_closed
+
+
+def test_explanation_search_over_no_explanations() -> None:
+    explanation_index = ExplanationIndex.from_neuron_simulation_results([])
+    search_index = asyncio.run(
+        ExplanationSearchIndex.build(explanation_index, embedder=HashingEmbedder())
+    )
+    for method in ["bm25", "embedding", "hybrid"]:
+        assert _search(search_index, "dogs", method) == []
+    rows, similarities = IvfIndex.build(np.zeros((0, 4), dtype=np.float32)).search(
+        np.ones(4, dtype=np.float32), limit=10
+    )
+    assert len(rows) == len(similarities) == 0
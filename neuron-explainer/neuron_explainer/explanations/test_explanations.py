@@ -0,0 +1,59 @@
+import pytest
+
+from neuron_explainer.explanations.explanations import (
+    ActivationScale,
+    CompactSequenceSimulation,
+    SequenceSimulation,
+)
+from neuron_explainer.fast_dataclasses import dumps, loads
+
+
+def test_compact_sequence_simulation_round_trip() -> None:
+    uncalibrated_simulation = SequenceSimulation(
+        tokens=["a", "b", "c"],
+        expected_activations=[0.7, 0.0, 9.1],
+        activation_scale=ActivationScale.SIMULATED_NORMALIZED_ACTIVATIONS,
+        distribution_values=[[1.0, 0.0], [], [10.0, 9.0, 3.0]],
+        distribution_probabilities=[[0.7, 0.3], [], [0.5, 0.3, 0.2]],
+    )
+    simulation = SequenceSimulation(
+        tokens=uncalibrated_simulation.tokens,
+        expected_activations=[0.35, 0.0, 4.55],
+        activation_scale=ActivationScale.NEURON_ACTIVATIONS,
+        distribution_values=[[0.5, 0.0], [], [5.0, 4.5, 1.5]],
+        distribution_probabilities=uncalibrated_simulation.distribution_probabilities,
+        uncalibrated_simulation=uncalibrated_simulation,
+    )
+
+    compact_simulation = loads(
+        dumps(CompactSequenceSimulation.from_sequence_simulation(simulation))
+    )
+    assert isinstance(compact_simulation, CompactSequenceSimulation)
+    assert compact_simulation.distribution_values == simulation.distribution_values
+    for actual, expected in zip(
+        compact_simulation.distribution_probabilities, simulation.distribution_probabilities
+    ):
+        assert actual == pytest.approx(expected)
+    restored_uncalibrated_simulation = compact_simulation.uncalibrated_simulation
+    assert restored_uncalibrated_simulation is not None
+    assert (
+        restored_uncalibrated_simulation.distribution_values
+        == uncalibrated_simulation.distribution_values
+    )
+    assert (
+        restored_uncalibrated_simulation.expected_activations
+        == uncalibrated_simulation.expected_activations
+    )
+    assert compact_simulation.to_sequence_simulation().tokens == simulation.tokens
+
+
+def test_compact_sequence_simulation_rejects_non_bin_values() -> None:
+    simulation = SequenceSimulation(
+        tokens=["a"],
+        expected_activations=[0.5],
+        activation_scale=ActivationScale.NEURON_ACTIVATIONS,
+        distribution_values=[[0.5]],
+        distribution_probabilities=[[1.0]],
+    )
+    with pytest.raises(ValueError):
+        CompactSequenceSimulation.from_sequence_simulation(simulation)
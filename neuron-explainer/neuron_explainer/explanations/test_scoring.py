@@ -0,0 +1,312 @@
+import asyncio
+from typing import Sequence
+
+import numpy as np
+import pytest
+
+from neuron_explainer.activations.activations import ActivationRecord
+from neuron_explainer.explanations.explanations import ActivationScale, SequenceSimulation
+from neuron_explainer.explanations import scoring
+from neuron_explainer.explanations.scoring import (
+    ScoreAccumulator,
+    SequenceScoringResult,
+    absolute_dev_explained_score_from_sequences,
+    aggregate_scored_sequence_simulations,
+    correlation_score,
+    rsquared_score_from_sequences,
+    score_sequences_batched,
+    simulate_and_score,
+    simulate_and_score_as_completed,
+    successive_halving_simulate_and_score,
+)
+from neuron_explainer.explanations.simulator import NeuronSimulator
+from neuron_explainer.fast_dataclasses import dumps, loads
+
+
+def _make_sequences() -> tuple[list[list[float]], list[list[list[float]]]]:
+    rng = np.random.default_rng(0)
+    lengths = [5, 1, 8, 3]
+    real = [list(rng.exponential(size=length)) for length in lengths]
+    predicted = [
+        [list(rng.integers(0, 10, size=length).astype(float)) for length in lengths]
+        for _ in range(3)
+    ]
+    return real, predicted
+
+
+# np.corrcoef warns about the length-1 sequence, for which correlation is undefined.
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_score_sequences_batched_matches_unbatched_scores() -> None:
+    real, predicted = _make_sequences()
+    batched_scores = score_sequences_batched(real, predicted)
+    for i, predicted_for_explanation in enumerate(predicted):
+        for j, (real_sequence, predicted_sequence) in enumerate(
+            zip(real, predicted_for_explanation)
+        ):
+            np.testing.assert_allclose(
+                batched_scores.ev_correlation_scores[i, j],
+                correlation_score(real_sequence, predicted_sequence),
+            )
+            assert batched_scores.rsquared_scores[i, j] == pytest.approx(
+                rsquared_score_from_sequences(real_sequence, predicted_sequence)
+            )
+            assert batched_scores.absolute_dev_explained_scores[i, j] == pytest.approx(
+                absolute_dev_explained_score_from_sequences(real_sequence, predicted_sequence)
+            )
+        all_real = [x for sequence in real for x in sequence]
+        all_predicted = [x for sequence in predicted_for_explanation for x in sequence]
+        assert batched_scores.aggregate_ev_correlation_scores[i] == pytest.approx(
+            correlation_score(all_real, all_predicted)
+        )
+        assert batched_scores.aggregate_rsquared_scores[i] == pytest.approx(
+            rsquared_score_from_sequences(all_real, all_predicted)
+        )
+        assert batched_scores.aggregate_absolute_dev_explained_scores[i] == pytest.approx(
+            absolute_dev_explained_score_from_sequences(all_real, all_predicted)
+        )
+
+
+def test_score_sequences_batched_padded_matches_ragged() -> None:
+    real, predicted = _make_sequences()
+    lengths = [len(sequence) for sequence in real]
+    padded_real = np.zeros((len(real), max(lengths)))
+    padded_predicted = np.zeros((len(predicted), len(real), max(lengths)))
+    for j, length in enumerate(lengths):
+        padded_real[j, :length] = real[j]
+        for i in range(len(predicted)):
+            padded_predicted[i, j, :length] = predicted[i][j]
+    ragged_scores = score_sequences_batched(real, predicted)
+    padded_scores = score_sequences_batched(padded_real, padded_predicted, lengths=lengths)
+    for field_name in ragged_scores.__dataclass_fields__:
+        np.testing.assert_allclose(
+            getattr(padded_scores, field_name), getattr(ragged_scores, field_name)
+        )
+
+
+def test_score_accumulator_shards_match_batched_aggregate() -> None:
+    real, predicted = _make_sequences()
+    batched_scores = score_sequences_batched(real, predicted[:1])
+    shards = [ScoreAccumulator(), ScoreAccumulator()]
+    for j, (real_sequence, predicted_sequence) in enumerate(zip(real, predicted[0])):
+        shards[j % 2].add_activations(real_sequence, predicted_sequence)
+    accumulator = loads(dumps(shards[0]))
+    assert isinstance(accumulator, ScoreAccumulator)
+    accumulator.merge(loads(dumps(shards[1])))
+    assert accumulator.num_values == sum(len(sequence) for sequence in real)
+    assert accumulator.ev_correlation_score == pytest.approx(
+        batched_scores.aggregate_ev_correlation_scores[0]
+    )
+    assert accumulator.rsquared_score == pytest.approx(batched_scores.aggregate_rsquared_scores[0])
+    assert accumulator.absolute_dev_explained_score == pytest.approx(
+        batched_scores.aggregate_absolute_dev_explained_scores[0]
+    )
+    assert ScoreAccumulator().ev_correlation_score is None
+
+
+class NoisySimulator(NeuronSimulator):
+    """Predicts the true activations (looked up by tokens) plus Gaussian noise."""
+
+    def __init__(
+        self, true_activations_by_tokens: dict[tuple[str, ...], list[float]], noise: float
+    ):
+        self.true_activations_by_tokens = true_activations_by_tokens
+        self.noise = noise
+        self.rng = np.random.default_rng(int(noise * 100))
+        self.num_calls = 0
+
+    async def simulate(self, tokens: Sequence[str]) -> SequenceSimulation:
+        self.num_calls += 1
+        true_activations = np.array(self.true_activations_by_tokens[tuple(tokens)])
+        expected_activations = true_activations + self.rng.normal(
+            scale=self.noise, size=len(tokens)
+        )
+        return SequenceSimulation(
+            tokens=list(tokens),
+            expected_activations=expected_activations.tolist(),
+            activation_scale=ActivationScale.SIMULATED_NORMALIZED_ACTIVATIONS,
+            distribution_values=[],
+            distribution_probabilities=[],
+        )
+
+
+def test_successive_halving_finds_best_simulator_with_fewer_calls() -> None:
+    rng = np.random.default_rng(0)
+    activation_records = [
+        ActivationRecord(
+            tokens=[f"{i}_{j}" for j in range(16)],
+            activations=rng.exponential(size=16).tolist(),
+        )
+        for i in range(32)
+    ]
+    true_activations_by_tokens = {
+        tuple(record.tokens): record.activations for record in activation_records
+    }
+    noise_levels = [5.0, 3.0, 0.1, 4.0, 2.0, 6.0, 8.0, 1.5]
+    simulators = [NoisySimulator(true_activations_by_tokens, noise) for noise in noise_levels]
+    result = asyncio.run(
+        successive_halving_simulate_and_score(simulators, activation_records, initial_num_records=4)
+    )
+    assert result.best_index == 2
+    lower_bound, upper_bound = result.ev_correlation_confidence_intervals[2]
+    assert lower_bound < result.scored_simulations[2].ev_correlation_score < upper_bound
+    total_calls = sum(simulator.num_calls for simulator in simulators)
+    assert total_calls < len(simulators) * len(activation_records) / 2
+    assert result.num_records_evaluated[2] >= result.num_records_evaluated[6]
+
+
+def test_successive_halving_requires_initial_records() -> None:
+    simulators = [NoisySimulator({}, noise) for noise in [1.0, 2.0]]
+    with pytest.raises(AssertionError):
+        asyncio.run(
+            successive_halving_simulate_and_score(
+                simulators,
+                [ActivationRecord(tokens=["a"], activations=[1.0])],
+                initial_num_records=0,
+            )
+        )
+
+
+def test_simulate_and_score_scores_all_sequences_in_one_batch(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    rng = np.random.default_rng(0)
+    activation_records = [
+        ActivationRecord(
+            tokens=[f"{i}_{j}" for j in range(i + 2)],
+            activations=rng.exponential(size=i + 2).tolist(),
+        )
+        for i in range(6)
+    ]
+    true_activations_by_tokens = {
+        tuple(record.tokens): record.activations for record in activation_records
+    }
+    num_batches = 0
+
+    def count_batches(*args, **kwargs):  # type: ignore
+        nonlocal num_batches
+        num_batches += 1
+        return score_sequences_batched(*args, **kwargs)
+
+    monkeypatch.setattr(scoring, "score_sequences_batched", count_batches)
+    scored_simulation = asyncio.run(
+        simulate_and_score(NoisySimulator(true_activations_by_tokens, 1.0), activation_records)
+    )
+    assert num_batches == 1
+    expected = aggregate_scored_sequence_simulations(scored_simulation.scored_sequence_simulations)
+    assert scored_simulation.ev_correlation_score == pytest.approx(expected.ev_correlation_score)
+    assert scored_simulation.rsquared_score == pytest.approx(expected.rsquared_score)
+    for scored_sequence_simulation in scored_simulation.scored_sequence_simulations:
+        assert scored_sequence_simulation.ev_correlation_score == pytest.approx(
+            correlation_score(
+                scored_sequence_simulation.true_activations,
+                scored_sequence_simulation.simulation.expected_activations,
+            )
+        )
+
+
+class DelayedSimulator(NeuronSimulator):
+    """Predicts the true activations after a per-sequence delay, keyed by the first token."""
+
+    def __init__(self, delays_s: dict[str, float]):
+        self.delays_s = delays_s
+        self.num_cancelled = 0
+
+    async def simulate(self, tokens: Sequence[str]) -> SequenceSimulation:
+        try:
+            await asyncio.sleep(self.delays_s[tokens[0]])
+        except asyncio.CancelledError:
+            self.num_cancelled += 1
+            raise
+        return SequenceSimulation(
+            tokens=list(tokens),
+            expected_activations=[float(len(token)) for token in tokens],
+            activation_scale=ActivationScale.SIMULATED_NORMALIZED_ACTIVATIONS,
+            distribution_values=[],
+            distribution_probabilities=[],
+        )
+
+
+DELAYED_ACTIVATION_RECORDS = [
+    ActivationRecord(tokens=["slow", "a"], activations=[1.0, 0.0]),
+    ActivationRecord(tokens=["hang", "bb"], activations=[3.0, 2.0]),
+    ActivationRecord(tokens=["fast", "ccc"], activations=[1.0, 3.0]),
+]
+
+
+def test_simulate_and_score_as_completed_yields_in_completion_order() -> None:
+    simulator = DelayedSimulator({"fast": 0.0, "slow": 0.05, "hang": 60.0})
+    accumulator = ScoreAccumulator()
+
+    async def collect() -> list[SequenceScoringResult]:
+        return [
+            result
+            async for result in simulate_and_score_as_completed(
+                simulator,
+                DELAYED_ACTIVATION_RECORDS,
+                sequence_timeout_s=0.5,
+                accumulator=accumulator,
+            )
+        ]
+
+    results = asyncio.run(collect())
+    assert [result.index for result in results] == [2, 0, 1]
+    assert results[0].scored_sequence_simulation is not None
+    assert isinstance(results[2].error, asyncio.TimeoutError)
+    assert simulator.num_cancelled == 1
+    assert accumulator.num_values == 4
+    assert len(accumulator.get_scored_simulation().scored_sequence_simulations) == 2
+
+
+def test_simulate_and_score_as_completed_cancels_on_close() -> None:
+    simulator = DelayedSimulator({"fast": 0.0, "slow": 60.0, "hang": 60.0})
+
+    async def first_result() -> SequenceScoringResult:
+        results = simulate_and_score_as_completed(simulator, DELAYED_ACTIVATION_RECORDS)
+        result = await results.__anext__()
+        await results.aclose()
+        return result
+
+    assert asyncio.run(first_result()).index == 2
+    assert simulator.num_cancelled == 2
+
+
+def test_simulate_and_score_as_completed_batches_sequences_that_finish_together(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    simulator = DelayedSimulator({"fast": 0.0, "slow": 0.05})
+    activation_records = [
+        ActivationRecord(tokens=["fast", "a" * (i + 5)], activations=[0.0, float(i + 1)])
+        for i in range(5)
+    ] + [ActivationRecord(tokens=["slow", "bb"], activations=[2.0, 0.0])]
+    num_batches = 0
+
+    def count_batches(*args, **kwargs):  # type: ignore
+        nonlocal num_batches
+        num_batches += 1
+        return score_sequences_batched(*args, **kwargs)
+
+    monkeypatch.setattr(scoring, "score_sequences_batched", count_batches)
+
+    async def collect() -> list[SequenceScoringResult]:
+        return [
+            result
+            async for result in simulate_and_score_as_completed(simulator, activation_records)
+        ]
+
+    results = asyncio.run(collect())
+    assert [result.index for result in results] == [0, 1, 2, 3, 4, 5]
+    # The fast sequences finish together and are scored in one call, then the slow one.
+    assert num_batches == 2
+    for result in results:
+        scored_sequence_simulation = result.scored_sequence_simulation
+        assert scored_sequence_simulation is not None
+        assert (
+            scored_sequence_simulation.true_activations
+            == activation_records[result.index].activations
+        )
+        assert scored_sequence_simulation.ev_correlation_score == pytest.approx(
+            correlation_score(
+                scored_sequence_simulation.true_activations,
+                scored_sequence_simulation.simulation.expected_activations,
+            )
+        )
@@ -1,8 +1,14 @@
+import asyncio
+from typing import Optional, Sequence
+
+from neuron_explainer.explanations.explanations import ActivationScale, SequenceSimulation
 from neuron_explainer.explanations.few_shot_examples import FewShotExampleSet
 from neuron_explainer.explanations.prompt_builder import HarmonyMessage, PromptFormat, Role
 from neuron_explainer.explanations.simulator import (
     ExplanationNeuronSimulator,
     ExplanationTokenByTokenSimulator,
+    NeuronSimulator,
+    SimulationStore,
 )
 
 
@@ -267,3 +273,42 @@ Last token activation, considering the token in the context in which it appeared
         assert actual_message["role"] == expected_message["role"]
         assert actual_message["content"] == expected_message["content"]
     assert prompt == expected_prompt
+
+
+class CountingSimulator(NeuronSimulator):
+    def __init__(self, explanation: str):
+        self.explanation = explanation
+        self.num_calls = 0
+
+    async def simulate(self, tokens: Sequence[str]) -> SequenceSimulation:
+        self.num_calls += 1
+        await asyncio.sleep(0)
+        return SequenceSimulation(
+            tokens=list(tokens),
+            expected_activations=[float(len(token)) for token in tokens],
+            activation_scale=ActivationScale.SIMULATED_NORMALIZED_ACTIVATIONS,
+            distribution_values=[[float(len(token))] for token in tokens],
+            distribution_probabilities=[[1.0] for _ in tokens],
+        )
+
+    def get_simulation_cache_key(self) -> Optional[str]:
+        return self.explanation
+
+
+def test_simulation_store_reuses_simulations() -> None:
+    async def run() -> None:
+        store = SimulationStore()
+        simulator = CountingSimulator("vowels")
+        other_simulator = CountingSimulator("consonants")
+        first, second = await asyncio.gather(
+            store.simulate(simulator, ["a", "bc"]), store.simulate(simulator, ["a", "bc"])
+        )
+        assert first is second
+        await store.simulate(simulator, ["a", "bc"])
+        await store.simulate(simulator, ["d"])
+        await store.simulate(other_simulator, ["d"])
+        assert simulator.num_calls == 2
+        assert other_simulator.num_calls == 1
+        assert store.num_simulations == 3
+
+    asyncio.run(run())
@@ -0,0 +1,70 @@
+# Benchmark for the time it takes to import the main neuron_explainer modules. Worker processes are
+# spawned frequently, so import cost matters for short jobs. Each import is timed in a fresh
+# interpreter, without OPENAI_API_KEY set.
+#
+# Usage: python -m neuron_explainer.import_time [--num-trials N] [module ...]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+DEFAULT_MODULES = [
+    "neuron_explainer.explanations.scoring",
+    "neuron_explainer.explanations.explainer",
+    "neuron_explainer.activations.activations",
+]
+
+# Modules that are slow to import and should only be loaded when they're actually used.
+DEFERRED_MODULES = ["sklearn", "boostedblob", "blobfile", "httpx", "tiktoken"]
+
+_TIMING_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ",".join(sorted(m for m in {deferred_modules!r} if m in sys.modules)))
+"""
+
+
+def measure_import_time(module: str) -> tuple[float, list[str]]:
+    """
+    Import the given module in a fresh interpreter. Returns the import time in seconds and the
+    deferred modules that were loaded as a side effect.
+    """
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            _TIMING_SCRIPT.format(module=module, deferred_modules=DEFERRED_MODULES),
+        ],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    loaded_modules = output[1].split(",") if len(output) > 1 else []
+    return float(output[0]), loaded_modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark neuron_explainer import time.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--num-trials", type=int, default=5)
+    args = parser.parse_args()
+    for module in args.modules:
+        times_s = []
+        for _ in range(args.num_trials):
+            time_s, loaded_modules = measure_import_time(module)
+            times_s.append(time_s)
+        print(
+            f"{module}: median {statistics.median(times_s) * 1000:.1f} ms, "
+            f"min {min(times_s) * 1000:.1f} ms over {args.num_trials} trials"
+            + (f" (loaded {', '.join(loaded_modules)})" if loaded_modules else "")
+        )
+
+
+if __name__ == "__main__":
+    main()
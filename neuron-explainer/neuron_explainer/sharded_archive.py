@@ -0,0 +1,356 @@
+# Sharded archives of per-neuron files, e.g. collated activations ({layer}/{neuron}.json) or
+# explanations ({layer}/{neuron}.jsonl). Hundreds of thousands of tiny files are slow to read from
+# an object store; an archive packs each layer into a few large shards, so that bulk scans read a
+# few large objects and random access to one neuron is a single ranged read.
+#
+# An archive has this layout:
+#
+#   {archive_path}/{layer}/index.json                   {"compression": ..., "shards": [names],
+#                                                        "entries": [[neuron, shard, offset,
+#                                                                     length], ...]}
+#   {archive_path}/{layer}/shard-{generation}-00000.bin  Concatenated records.
+#
+# Each record is compressed on its own, so reading one neuron only needs its byte range.
+#
+# Each compaction of a layer writes shards under a new generation name, publishes them by replacing
+# index.json, and only then deletes the previous generation's shards. A reader holding an old index
+# therefore never reads new shard bytes at old offsets; if the old shards are already gone, it
+# reloads the index and retries.
+#
+# To compact a dataset:
+#
+#   python -m neuron_explainer.sharded_archive <source_path> <archive_path> --extension .json
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+import uuid
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import AsyncIterator, Optional, Sequence
+
+import orjson
+from neuron_explainer.azure import ensure_session
+from neuron_explainer.dataset_catalog import DatasetCatalog
+
+INDEX_FILENAME = "index.json"
+COMPRESSIONS = ("zlib", "none")
+
+
+def _join(*parts: object) -> str:
+    return "/".join([str(parts[0]).rstrip("/")] + [str(part) for part in parts[1:]])
+
+
+def _compress(data: bytes, compression: str, level: int) -> bytes:
+    return zlib.compress(data, level) if compression == "zlib" else data
+
+
+def _decompress(data: bytes, compression: str) -> bytes:
+    return zlib.decompress(data) if compression == "zlib" else data
+
+
+@dataclass
+class LayerIndex:
+    compression: str
+    shards: list[str]
+    locations: dict[int, tuple[int, int, int]]
+    """(shard, offset, length) of each neuron's record."""
+
+    @classmethod
+    def loads(cls, serialized: bytes) -> LayerIndex:
+        index = orjson.loads(serialized)
+        return cls(
+            compression=index["compression"],
+            shards=index["shards"],
+            locations={
+                neuron_index: (shard, offset, length)
+                for neuron_index, shard, offset, length in index["entries"]
+            },
+        )
+
+    def dumps(self) -> bytes:
+        return orjson.dumps(
+            {
+                "compression": self.compression,
+                "shards": self.shards,
+                "entries": [
+                    [neuron_index, *location]
+                    for neuron_index, location in sorted(self.locations.items())
+                ],
+            }
+        )
+
+
+@dataclass
+class _CachedLayerIndex:
+    layer: LayerIndex
+    version: tuple[float, int]
+    """(mtime, size) of the index file when it was read."""
+    checked_at_s: float
+    """time.monotonic() when version was last compared with the index file."""
+
+
+class ShardedArchive:
+    """
+    Reads records from an archive written by compact_dataset. Layer indexes are cached, and checked
+    against the index file's modification time and size at most every index_check_interval_s
+    seconds, so that a re-compacted layer is picked up. With index_check_interval_s=None, cached
+    indexes are only dropped by invalidate(), or when the shards they point at have been deleted by
+    a later compaction.
+    """
+
+    def __init__(self, archive_path: str, index_check_interval_s: Optional[float] = 60.0):
+        self.archive_path = archive_path
+        self.index_check_interval_s = index_check_interval_s
+        self._layer_indexes: dict[int, _CachedLayerIndex] = {}
+
+    def invalidate(self, layer_index: Optional[int] = None) -> None:
+        """Drop the cached index for a layer, or for all layers by default."""
+        if layer_index is None:
+            self._layer_indexes.clear()
+        else:
+            self._layer_indexes.pop(int(layer_index), None)
+
+    def _get_cached_layer_index(self, layer_index: int) -> Optional[_CachedLayerIndex]:
+        """Return the cached index for a layer, or None if it needs to be (re)read or checked."""
+        cached = self._layer_indexes.get(layer_index)
+        if cached is None or self.index_check_interval_s is None:
+            return cached
+        if time.monotonic() - cached.checked_at_s < self.index_check_interval_s:
+            return cached
+        return None
+
+    def _get_layer_index(self, layer_index: int) -> LayerIndex:
+        import blobfile as bf
+
+        cached = self._get_cached_layer_index(layer_index)
+        if cached is not None:
+            return cached.layer
+        path = _join(self.archive_path, layer_index, INDEX_FILENAME)
+        stat = bf.stat(path)
+        version = (stat.mtime, stat.size)
+        cached = self._layer_indexes.get(layer_index)
+        if cached is None or cached.version != version:
+            with bf.BlobFile(path, "rb") as f:
+                layer = LayerIndex.loads(f.read())
+            cached = _CachedLayerIndex(layer=layer, version=version, checked_at_s=0.0)
+            self._layer_indexes[layer_index] = cached
+        cached.checked_at_s = time.monotonic()
+        return cached.layer
+
+    @ensure_session
+    async def _get_layer_index_async(self, layer_index: int) -> LayerIndex:
+        import boostedblob as bbb
+
+        cached = self._get_cached_layer_index(layer_index)
+        if cached is not None:
+            return cached.layer
+        path = _join(self.archive_path, layer_index, INDEX_FILENAME)
+        stat = await bbb.stat(path)
+        version = (stat.mtime, stat.size)
+        cached = self._layer_indexes.get(layer_index)
+        if cached is None or cached.version != version:
+            layer = LayerIndex.loads(await bbb.read.read_single(path))
+            cached = _CachedLayerIndex(layer=layer, version=version, checked_at_s=0.0)
+            self._layer_indexes[layer_index] = cached
+        cached.checked_at_s = time.monotonic()
+        return cached.layer
+
+    def read(self, layer_index: int, neuron_index: int) -> Optional[bytes]:
+        """Return the contents of a neuron's file, or None if it isn't in the archive."""
+        try:
+            return self._read(layer_index, neuron_index)
+        except FileNotFoundError:
+            # The layer was re-compacted and the shards in the cached index were deleted.
+            self.invalidate(layer_index)
+            return self._read(layer_index, neuron_index)
+
+    def _read(self, layer_index: int, neuron_index: int) -> Optional[bytes]:
+        import blobfile as bf
+
+        layer = self._get_layer_index(int(layer_index))
+        location = layer.locations.get(int(neuron_index))
+        if location is None:
+            return None
+        shard, offset, length = location
+        with bf.BlobFile(_join(self.archive_path, layer_index, layer.shards[shard]), "rb") as f:
+            f.seek(offset)
+            return _decompress(f.read(length), layer.compression)
+
+    @ensure_session
+    async def read_async(self, layer_index: int, neuron_index: int) -> Optional[bytes]:
+        """Async version of read."""
+        try:
+            return await self._read_async(layer_index, neuron_index)
+        except FileNotFoundError:
+            self.invalidate(layer_index)
+            return await self._read_async(layer_index, neuron_index)
+
+    async def _read_async(self, layer_index: int, neuron_index: int) -> Optional[bytes]:
+        import boostedblob as bbb
+
+        layer = await self._get_layer_index_async(int(layer_index))
+        location = layer.locations.get(int(neuron_index))
+        if location is None:
+            return None
+        shard, offset, length = location
+        data = await bbb.read.read_byte_range(
+            _join(self.archive_path, layer_index, layer.shards[shard]), (offset, offset + length)
+        )
+        return _decompress(data, layer.compression)
+
+    @ensure_session
+    async def iterate_layer_async(self, layer_index: int) -> AsyncIterator[tuple[int, bytes]]:
+        """
+        Yield (neuron_index, contents) for every neuron in a layer, reading whole shards. Raises
+        FileNotFoundError if the layer is re-compacted during the iteration.
+        """
+        import boostedblob as bbb
+
+        layer = await self._get_layer_index_async(int(layer_index))
+        neuron_indices_by_shard: list[list[int]] = [[] for _ in layer.shards]
+        for neuron_index, (shard, _, _) in sorted(layer.locations.items()):
+            neuron_indices_by_shard[shard].append(neuron_index)
+        for shard, shard_name in enumerate(layer.shards):
+            data = await bbb.read.read_single(_join(self.archive_path, layer_index, shard_name))
+            for neuron_index in neuron_indices_by_shard[shard]:
+                _, offset, length = layer.locations[neuron_index]
+                yield neuron_index, _decompress(data[offset : offset + length], layer.compression)
+
+
+@lru_cache(maxsize=None)
+def get_sharded_archive(archive_path: str) -> ShardedArchive:
+    """
+    Return a shared ShardedArchive for the path, so that layer indexes are read once and then only
+    checked for changes. Call invalidate() on it to drop cached indexes right away.
+    """
+    return ShardedArchive(archive_path)
+
+
+@ensure_session
+async def compact_layer(
+    source_path: str,
+    archive_path: str,
+    layer_index: int,
+    neuron_indices: Sequence[int],
+    extension: str,
+    max_shard_bytes: int = 256 * 1024 * 1024,
+    compression: str = "zlib",
+    compression_level: int = 6,
+    max_concurrency: int = 64,
+) -> LayerIndex:
+    """
+    Pack the files {source_path}/{layer_index}/{neuron_index}{extension} into shards. Files are read
+    max_concurrency at a time and shards are written as soon as they're full, so memory use is
+    bounded by max_shard_bytes plus the size of max_concurrency files.
+
+    If the layer was compacted before, the new shards get new names, and the previous shards are
+    deleted after the new index is written.
+    """
+    import boostedblob as bbb
+
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression {compression}, expected one of {COMPRESSIONS}")
+    index_path = _join(archive_path, layer_index, INDEX_FILENAME)
+    try:
+        previous_shards = LayerIndex.loads(await bbb.read.read_single(index_path)).shards
+    except FileNotFoundError:
+        previous_shards = []
+    generation = uuid.uuid4().hex[:12]
+    layer = LayerIndex(compression=compression, shards=[], locations={})
+    shard_data = bytearray()
+    shard_locations: dict[int, tuple[int, int]] = {}
+
+    async def write_shard() -> None:
+        shard_name = f"shard-{generation}-{len(layer.shards):05d}.bin"
+        await bbb.write.write_single(
+            _join(archive_path, layer_index, shard_name), bytes(shard_data), overwrite=True
+        )
+        for neuron_index, (offset, length) in shard_locations.items():
+            layer.locations[neuron_index] = (len(layer.shards), offset, length)
+        layer.shards.append(shard_name)
+        shard_data.clear()
+        shard_locations.clear()
+
+    async def read_and_compress(neuron_index: int) -> bytes:
+        data = await bbb.read.read_single(
+            _join(source_path, layer_index, f"{neuron_index}{extension}")
+        )
+        return await asyncio.to_thread(_compress, data, compression, compression_level)
+
+    for start in range(0, len(neuron_indices), max_concurrency):
+        chunk = neuron_indices[start : start + max_concurrency]
+        records = await asyncio.gather(*[read_and_compress(neuron_index) for neuron_index in chunk])
+        for neuron_index, record in zip(chunk, records):
+            if len(shard_data) > 0 and len(shard_data) + len(record) > max_shard_bytes:
+                await write_shard()
+            shard_locations[neuron_index] = (len(shard_data), len(record))
+            shard_data.extend(record)
+    if len(shard_data) > 0:
+        await write_shard()
+    # The index is written after the shards, so readers never see an index pointing at missing
+    # shards, and the previous shards are only deleted once no new reader can pick them up.
+    await bbb.write.write_single(index_path, layer.dumps(), overwrite=True)
+    # Readers in this process see the new index right away, not only at their next check.
+    get_sharded_archive(archive_path).invalidate(layer_index)
+
+    async def remove_previous_shard(shard_name: str) -> None:
+        try:
+            await bbb.remove(_join(archive_path, layer_index, shard_name))
+        except FileNotFoundError:
+            pass
+
+    await asyncio.gather(
+        *[
+            remove_previous_shard(shard_name)
+            for shard_name in previous_shards
+            if shard_name not in layer.shards
+        ]
+    )
+    return layer
+
+
+async def compact_dataset(
+    source_path: str,
+    archive_path: str,
+    extension: str,
+    layer_indices: Optional[Sequence[int]] = None,
+    **kwargs: object,
+) -> None:
+    """Compact every layer of a dataset (by default) into an archive. See compact_layer."""
+    catalog = DatasetCatalog(source_path, cache_dir=None)
+    if layer_indices is None:
+        layer_indices = await catalog.get_sorted_layers()
+    for layer_index in layer_indices:
+        neuron_indices = await catalog.get_sorted_neuron_indices(layer_index)
+        await compact_layer(
+            source_path, archive_path, layer_index, neuron_indices, extension, **kwargs  # type: ignore
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pack per-neuron files into sharded archives.")
+    parser.add_argument("source_path")
+    parser.add_argument("archive_path")
+    parser.add_argument("--extension", required=True, help='e.g. ".json" or ".jsonl"')
+    parser.add_argument("--layers", type=int, nargs="*", default=None)
+    parser.add_argument("--max_shard_bytes", type=int, default=256 * 1024 * 1024)
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="zlib")
+    args = parser.parse_args()
+    asyncio.run(
+        compact_dataset(
+            args.source_path,
+            args.archive_path,
+            args.extension,
+            args.layers,
+            max_shard_bytes=args.max_shard_bytes,
+            compression=args.compression,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import asyncio
+import sys
+import threading
+import time
+from typing import Any, Optional
+
+import httpx
+import pytest
+
+from neuron_explainer.api_client import (
+    ApiClient,
+    CircuitBreaker,
+    HedgingPolicy,
+    RequestScheduler,
+    RetryPolicy,
+    classify_api_error,
+)
+from neuron_explainer.tracing import trace_attributes
+
+
+class FakeApiClient(ApiClient):
+    """Returns canned responses after a delay taken from a list, one per HTTP request."""
+
+    def __init__(self, delays_s: list[float], **kwargs: Any):
+        super().__init__(model_name="fake-model", **kwargs)
+        self.delays_s = delays_s
+        self.num_sent = 0
+        self.num_cancelled = 0
+        self.num_in_flight = 0
+        self.max_in_flight = 0
+
+    async def _send_request(
+        self, url: str, json: dict[str, Any], timeout_seconds: Optional[int]
+    ) -> httpx.Response:
+        delay_s = self.delays_s[self.num_sent]
+        self.num_sent += 1
+        self.num_in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.num_in_flight)
+        try:
+            await asyncio.sleep(delay_s)
+        except asyncio.CancelledError:
+            self.num_cancelled += 1
+            raise
+        finally:
+            self.num_in_flight -= 1
+        self._latencies_s.append(delay_s)
+        return httpx.Response(200, json={"delay_s": delay_s}, request=httpx.Request("POST", url))
+
+
+def test_slow_request_is_hedged() -> None:
+    client = FakeApiClient(
+        [0.001] * 20 + [60.0, 0.001], hedging_policy=HedgingPolicy(min_latency_samples=20)
+    )
+
+    async def make_requests() -> list[dict[str, Any]]:
+        return [await client.make_request(prompt="x") for _ in range(21)]
+
+    responses = asyncio.run(make_requests())
+    assert responses[-1] == {"delay_s": 0.001}
+    assert client.num_hedged_requests == 1
+    assert client.num_cancelled == 1
+
+
+def test_hedging_respects_budget() -> None:
+    client = FakeApiClient(
+        [0.001] * 20 + [0.05, 0.05, 0.05],
+        hedging_policy=HedgingPolicy(min_latency_samples=20, max_hedged_fraction=0.0),
+    )
+
+    async def make_requests() -> None:
+        for _ in range(21):
+            await client.make_request(prompt="x")
+
+    asyncio.run(make_requests())
+    assert client.num_hedged_requests == 0
+    assert client.num_sent == 21
+
+
+def test_hedged_request_respects_max_concurrent() -> None:
+    client = FakeApiClient(
+        [0.001] * 20 + [0.2, 0.001],
+        max_concurrent=1,
+        hedging_policy=HedgingPolicy(min_latency_samples=20),
+    )
+
+    async def make_requests() -> None:
+        for _ in range(21):
+            await client.make_request(prompt="x")
+
+    asyncio.run(make_requests())
+    assert client.num_hedged_requests == 1
+    # The hedge waits for the original request's slot instead of exceeding the limit.
+    assert client.max_in_flight == 1
+
+
+def test_queued_request_is_not_hedged() -> None:
+    request_scheduler = RequestScheduler(max_concurrent=1)
+    client = FakeApiClient(
+        [0.001],
+        hedging_policy=HedgingPolicy(min_latency_samples=20),
+        request_scheduler=request_scheduler,
+    )
+    client._latencies_s.extend([0.05] * 20)
+    other_client = FakeApiClient([0.2], request_scheduler=request_scheduler)
+
+    async def make_requests() -> None:
+        # The other client holds the only slot, so the request waits for about 0.2s before being
+        # sent, much longer than the 0.05s hedging threshold.
+        other_request = asyncio.ensure_future(other_client.make_request(prompt="x"))
+        await asyncio.sleep(0.01)
+        await client.make_request(prompt="x")
+        await other_request
+
+    asyncio.run(make_requests())
+    assert client.num_hedged_requests == 0
+    assert client.num_sent == 1
+
+
+def test_saturated_client_does_not_hold_shared_slots() -> None:
+    request_scheduler = RequestScheduler(max_concurrent=2)
+    saturated_client = FakeApiClient(
+        [0.3] * 3, max_concurrent=1, request_scheduler=request_scheduler
+    )
+    other_client = FakeApiClient([0.001], request_scheduler=request_scheduler)
+
+    async def make_requests() -> float:
+        saturated_requests = [
+            asyncio.ensure_future(saturated_client.make_request(prompt="x")) for _ in range(3)
+        ]
+        await asyncio.sleep(0.01)
+        start_time_s = time.monotonic()
+        await other_client.make_request(prompt="x")
+        elapsed_s = time.monotonic() - start_time_s
+        await asyncio.gather(*saturated_requests)
+        return elapsed_s
+
+    # The saturated client only holds one shared slot at a time, so the other client gets the
+    # second one right away instead of waiting for the saturated client's requests to finish.
+    assert asyncio.run(make_requests()) < 0.2
+
+
+def _make_status_error(
+    status_code: int, content: bytes = b"", headers: Optional[dict[str, str]] = None
+) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://example.com/v1/completions")
+    response = httpx.Response(status_code, content=content, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+def test_classify_api_error() -> None:
+    classification = classify_api_error(_make_status_error(503, headers={"Retry-After": "3"}))
+    assert classification.retry
+    assert classification.backend_failure
+    assert classification.retry_after_s == 3.0
+    rate_limited = classify_api_error(_make_status_error(429, headers={"retry-after-ms": "500"}))
+    assert rate_limited.retry and not rate_limited.backend_failure
+    assert rate_limited.retry_after_s == 0.5
+    # Error bodies that aren't JSON shouldn't cause another exception.
+    assert not classify_api_error(_make_status_error(400, content=b"<html>")).retry
+    assert not classify_api_error(ValueError("bug")).retry
+
+
+def test_retry_policy_gives_up_at_deadline() -> None:
+    num_calls = 0
+
+    async def always_unavailable() -> None:
+        nonlocal num_calls
+        num_calls += 1
+        raise _make_status_error(503, headers={"Retry-After": "60"})
+
+    retry_policy = RetryPolicy(deadline_s=1.0, circuit_breaker=None)
+    start_time_s = time.monotonic()
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(retry_policy.call(always_unavailable))
+    assert num_calls == 1
+    assert time.monotonic() - start_time_s < 1.0
+
+
+def test_circuit_breaker_pauses_requests_until_probe_succeeds() -> None:
+    circuit_breaker = CircuitBreaker(failure_threshold=2, cooldown_s=0.05, poll_interval_s=0.01)
+    circuit_breaker.record_failure()
+    assert not circuit_breaker.is_open
+    circuit_breaker.record_failure()
+    assert circuit_breaker.is_open
+
+    async def wait_for_probe() -> list[bool]:
+        async def wait_then_succeed(delay_s: float) -> bool:
+            await asyncio.sleep(delay_s)
+            is_probe = await circuit_breaker.wait_until_closed()
+            if is_probe:
+                await asyncio.sleep(0.02)
+                circuit_breaker.record_success()
+            return is_probe
+
+        return await asyncio.gather(*[wait_then_succeed(i * 0.001) for i in range(5)])
+
+    assert sorted(asyncio.run(wait_for_probe())) == [False] * 4 + [True]
+    assert not circuit_breaker.is_open
+
+
+def test_request_scheduler_prioritizes_explanations() -> None:
+    request_scheduler = RequestScheduler(max_concurrent=1, class_weights={"explanation": 4.0})
+    order: list[str] = []
+
+    async def make_request(request_class: str, neuron_index: int) -> None:
+        with trace_attributes(layer_index=0, neuron_index=neuron_index):
+            async with request_scheduler.slot(request_class):
+                order.append(f"{request_class}:{neuron_index}")
+                await asyncio.sleep(0.001)
+
+    async def make_requests() -> None:
+        # Neuron 0 queues many simulations before the other requests arrive.
+        await asyncio.gather(
+            *[make_request("simulation", 0) for _ in range(10)],
+            *[make_request("simulation", 1) for _ in range(2)],
+            *[make_request("explanation", 2) for _ in range(4)],
+        )
+
+    asyncio.run(make_requests())
+    assert request_scheduler.num_waiting == 0
+    # After the first simulation takes the free slot, explanations get 4 of every 5 slots, and
+    # neuron 1's simulations aren't stuck behind all of neuron 0's.
+    assert order[:5] == ["simulation:0"] + ["explanation:2"] * 4
+    assert order.index("simulation:1") < 8
+
+
+def _make_mock_client(**kwargs: Any) -> ApiClient:
+    return ApiClient(
+        model_name="fake-model",
+        http_transport=httpx.MockTransport(lambda request: httpx.Response(200, json={})),
+        **kwargs,
+    )
+
+
+def test_http_client_from_another_loop_is_closed(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    client = _make_mock_client()
+    # The first client is created on a loop that keeps running in another thread.
+    other_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=other_loop.run_forever)
+    thread.start()
+    try:
+        asyncio.run_coroutine_threadsafe(client.make_request(prompt="x"), other_loop).result()
+        old_http_client = client._http_client
+        assert old_http_client is not None
+
+        async def make_request_and_wait() -> None:
+            await client.make_request(prompt="x")
+            for _ in range(100):
+                if old_http_client.is_closed:
+                    break
+                await asyncio.sleep(0.01)
+
+        asyncio.run(make_request_and_wait())
+        assert old_http_client.is_closed
+        assert client._http_client is not old_http_client
+    finally:
+        other_loop.call_soon_threadsafe(other_loop.stop)
+        thread.join()
+        other_loop.close()
+
+    # A client from a loop that has finished is abandoned, and aclose() on a new loop doesn't fail.
+    asyncio.run(client.aclose())
+    assert client._http_client is None
+
+
+def test_simulators_and_explainers_close_only_their_own_clients() -> None:
+    from neuron_explainer.explanations.calibrated_simulator import UncalibratedNeuronSimulator
+    from neuron_explainer.explanations.explainer import TokenActivationPairExplainer
+    from neuron_explainer.explanations.simulator import ExplanationNeuronSimulator
+
+    shared_client = _make_mock_client()
+    shared_simulator = ExplanationNeuronSimulator("fake-model", "x", api_client=shared_client)
+    owning_simulator = UncalibratedNeuronSimulator(ExplanationNeuronSimulator("fake-model", "x"))
+    explainer = TokenActivationPairExplainer("gpt-4")
+
+    async def open_and_close() -> list[httpx.AsyncClient]:
+        http_clients = [
+            shared_client._get_http_client(),
+            owning_simulator.uncalibrated_simulator.api_client._get_http_client(),  # type: ignore
+            explainer.client._get_http_client(),
+        ]
+        await shared_simulator.aclose()
+        await owning_simulator.aclose()
+        await explainer.aclose()
+        return http_clients
+
+    shared_http_client, owned_http_client, explainer_http_client = asyncio.run(open_and_close())
+    assert not shared_http_client.is_closed
+    assert owned_http_client.is_closed
+    assert explainer_http_client.is_closed
+
+
+def test_http_client_connection_pool_is_not_capped() -> None:
+    async def get_max_connections(client: ApiClient) -> int:
+        http_client = client._get_http_client()
+        max_connections = http_client._transport._pool._max_connections  # type: ignore
+        await client.aclose()
+        return max_connections
+
+    # httpx allows 100 connections by default, which would cap max_concurrent.
+    for max_concurrent in [None, 500]:
+        client = ApiClient(model_name="fake-model", max_concurrent=max_concurrent)
+        # httpcore represents an unlimited pool as sys.maxsize.
+        assert asyncio.run(get_max_connections(client)) == sys.maxsize
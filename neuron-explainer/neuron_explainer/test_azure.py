@@ -0,0 +1,23 @@
+import asyncio
+import os
+import tempfile
+
+from neuron_explainer.activations.activations import NeuronId
+from neuron_explainer.explanations.explanations import (
+    NeuronSimulationResults,
+    load_neuron_explanations_async,
+)
+from neuron_explainer.fast_dataclasses import dumps
+
+
+def test_ensure_session_loader_reads_local_file() -> None:
+    # load_neuron_explanations_async and read_file are both wrapped with ensure_session.
+    results = NeuronSimulationResults(
+        neuron_id=NeuronId(layer_index=0, neuron_index=1), scored_explanations=[]
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.makedirs(os.path.join(tmp_dir, "0"))
+        with open(os.path.join(tmp_dir, "0", "1.jsonl"), "wb") as f:
+            f.write(dumps(results) + b"\n")
+        assert asyncio.run(load_neuron_explanations_async(tmp_dir, 0, 1)) == results
+        assert asyncio.run(load_neuron_explanations_async(tmp_dir, "0", "2")) is None
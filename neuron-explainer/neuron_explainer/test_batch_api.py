@@ -0,0 +1,42 @@
+import asyncio
+from typing import Any
+
+import pytest
+
+from neuron_explainer.api_client import RetryPolicy
+from neuron_explainer.batch_api import BatchApiClient, BatchConfig, LocalBatchServer
+
+
+def _echo_completion(endpoint: str, body: dict[str, Any]) -> dict[str, Any]:
+    return {"choices": [{"text": body["prompt"].upper()}], "endpoint": endpoint}
+
+
+def test_batch_api_client_resolves_requests_from_one_batch(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    server = LocalBatchServer(_echo_completion, num_polls_until_complete=2)
+    api_client = BatchApiClient(
+        model_name="fake-model",
+        batch_config=BatchConfig(max_batch_size=3, max_wait_s=0.01, poll_interval_s=0.001),
+        retry_policy=RetryPolicy(circuit_breaker=None),
+        http_transport=server.transport,
+    )
+
+    async def make_requests() -> list[dict[str, Any]]:
+        try:
+            return await asyncio.gather(
+                *[api_client.make_request(prompt=prompt) for prompt in ["a", "b", "c", "d"]]
+            )
+        finally:
+            await api_client.aclose()
+
+    responses = asyncio.run(make_requests())
+    assert [response["choices"][0]["text"] for response in responses] == ["A", "B", "C", "D"]
+    assert responses[0]["endpoint"] == "/v1/completions"
+    # The first three requests fill a batch; the last one is submitted after max_wait_s.
+    assert api_client.num_batches_submitted == 2
+    assert len(server.batches) == 2
+
+
+def test_batch_api_client_default_retry_policy_outlasts_completion_window() -> None:
+    # Requests from batches that expire after the 24h completion window must still be retried.
+    assert BatchApiClient(model_name="fake-model").retry_policy.deadline_s is None
@@ -0,0 +1,45 @@
+import asyncio
+import os
+import tempfile
+
+from neuron_explainer.dataset_catalog import DatasetCatalog
+
+
+def _make_dataset(root: str, neuron_indices_by_layer: dict[int, list[int]]) -> None:
+    for layer_index, neuron_indices in neuron_indices_by_layer.items():
+        os.makedirs(os.path.join(root, str(layer_index)), exist_ok=True)
+        for neuron_index in neuron_indices:
+            open(os.path.join(root, str(layer_index), f"{neuron_index}.jsonl"), "w").close()
+
+
+def test_dataset_catalog_lists_and_caches() -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = os.path.join(tmp_dir, "dataset")
+        cache_dir = os.path.join(tmp_dir, "cache")
+        _make_dataset(root, {10: [2, 0, 11], 2: [5]})
+        # Non-numeric entries are ignored.
+        os.makedirs(os.path.join(root, "metadata"))
+        open(os.path.join(root, "3"), "w").close()
+
+        async def query(catalog: DatasetCatalog) -> tuple:
+            return (
+                await catalog.get_sorted_layers(),
+                await catalog.get_sorted_neuron_indices(10),
+                await catalog.neuron_exists("2", "5"),
+                await catalog.neuron_exists(2, 6),
+            )
+
+        assert asyncio.run(query(DatasetCatalog(root, cache_dir=cache_dir))) == (
+            [2, 10],
+            [0, 2, 11],
+            True,
+            False,
+        )
+
+        # A new catalog uses the cached manifest, so it doesn't see the new neuron until it expires.
+        _make_dataset(root, {2: [6]})
+        assert asyncio.run(DatasetCatalog(root, cache_dir=cache_dir).neuron_exists(2, 6)) is False
+        assert (
+            asyncio.run(DatasetCatalog(root, cache_dir=cache_dir, ttl_s=0).neuron_exists(2, 6))
+            is True
+        )
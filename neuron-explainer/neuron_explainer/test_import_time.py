@@ -0,0 +1,7 @@
+from neuron_explainer.import_time import measure_import_time
+
+
+def test_scoring_import_is_lazy() -> None:
+    # Importing should work without OPENAI_API_KEY and shouldn't load slow optional dependencies.
+    _, loaded_modules = measure_import_time("neuron_explainer.explanations.scoring")
+    assert loaded_modules == []
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import tempfile
+
+from neuron_explainer.activations.activations import (
+    ActivationRecord,
+    NeuronId,
+    NeuronRecord,
+    load_neuron_from_archive,
+    load_neuron_from_archive_async,
+)
+from neuron_explainer.explanations.explanations import (
+    NeuronSimulationResults,
+    load_neuron_explanations_from_archive,
+)
+from neuron_explainer.fast_dataclasses import dumps
+from neuron_explainer.sharded_archive import (
+    ShardedArchive,
+    compact_dataset,
+    get_sharded_archive,
+)
+
+
+def _write_files(root: str, contents_by_neuron: dict[tuple[int, int], bytes], ext: str) -> None:
+    for (layer_index, neuron_index), contents in contents_by_neuron.items():
+        os.makedirs(os.path.join(root, str(layer_index)), exist_ok=True)
+        with open(os.path.join(root, str(layer_index), f"{neuron_index}{ext}"), "wb") as f:
+            f.write(contents)
+
+
+def test_sharded_archive_round_trip() -> None:
+    contents_by_neuron = {
+        (layer_index, neuron_index): f"{layer_index}:{neuron_index}:".encode() * (neuron_index + 1)
+        for layer_index in [0, 3]
+        for neuron_index in range(20)
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = os.path.join(tmp_dir, "source")
+        _write_files(source_path, contents_by_neuron, ".jsonl")
+        for compression in ["zlib", "none"]:
+            archive_path = os.path.join(tmp_dir, compression)
+            # A small shard size and concurrency make the archive span several shards and chunks.
+            asyncio.run(
+                compact_dataset(
+                    source_path,
+                    archive_path,
+                    ".jsonl",
+                    max_shard_bytes=100,
+                    compression=compression,
+                    max_concurrency=3,
+                )
+            )
+            assert len(os.listdir(os.path.join(archive_path, "3"))) > 2
+            archive = ShardedArchive(archive_path)
+            for (layer_index, neuron_index), contents in contents_by_neuron.items():
+                assert archive.read(layer_index, neuron_index) == contents
+                assert asyncio.run(archive.read_async(layer_index, neuron_index)) == contents
+            assert archive.read(0, 20) is None
+            assert asyncio.run(archive.read_async(3, 20)) is None
+
+            async def read_layer() -> list[tuple[int, bytes]]:
+                return [item async for item in archive.iterate_layer_async(3)]
+
+            assert asyncio.run(read_layer()) == [
+                (neuron_index, contents_by_neuron[(3, neuron_index)]) for neuron_index in range(20)
+            ]
+
+
+def test_load_from_archive() -> None:
+    neuron_record = NeuronRecord(
+        neuron_id=NeuronId(layer_index=1, neuron_index=2),
+        random_sample=[ActivationRecord(tokens=["a", "b"], activations=[0.0, 1.5])],
+    )
+    results = NeuronSimulationResults(
+        neuron_id=NeuronId(layer_index=1, neuron_index=2), scored_explanations=[]
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _write_files(os.path.join(tmp_dir, "activations"), {(1, 2): dumps(neuron_record)}, ".json")
+        _write_files(
+            os.path.join(tmp_dir, "explanations"), {(1, 2): dumps(results) + b"\n"}, ".jsonl"
+        )
+        for name, extension in [("activations", ".json"), ("explanations", ".jsonl")]:
+            asyncio.run(
+                compact_dataset(
+                    os.path.join(tmp_dir, name), os.path.join(tmp_dir, f"{name}-archive"), extension
+                )
+            )
+
+        activations_archive = os.path.join(tmp_dir, "activations-archive")
+        # Compare serialized records, since NaN statistics don't compare equal.
+        assert dumps(load_neuron_from_archive(activations_archive, 1, 2)) == dumps(neuron_record)
+        assert dumps(
+            asyncio.run(load_neuron_from_archive_async(activations_archive, "1", "2"))
+        ) == dumps(neuron_record)
+        explanations_archive = os.path.join(tmp_dir, "explanations-archive")
+        assert load_neuron_explanations_from_archive(explanations_archive, 1, 2) == results
+        assert load_neuron_explanations_from_archive(explanations_archive, 1, 3) is None
+
+
+def test_recompacted_layer_is_reread() -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = os.path.join(tmp_dir, "source")
+        archive_path = os.path.join(tmp_dir, "archive")
+
+        def compact(contents_by_neuron: dict[tuple[int, int], bytes]) -> None:
+            _write_files(source_path, contents_by_neuron, ".jsonl")
+            asyncio.run(compact_dataset(source_path, archive_path, ".jsonl", compression="none"))
+
+        compact({(0, 0): b"old", (0, 1): b"old"})
+        shared_archive = get_sharded_archive(archive_path)
+        checked_archive = ShardedArchive(archive_path, index_check_interval_s=0.0)
+        unchecked_archive = ShardedArchive(archive_path, index_check_interval_s=None)
+        for archive in [shared_archive, checked_archive, unchecked_archive]:
+            assert archive.read(0, 1) == b"old"
+            assert asyncio.run(archive.read_async(0, 1)) == b"old"
+
+        # The new records have different lengths, so stale offsets would return the wrong bytes.
+        compact({(0, 0): b"new contents", (0, 1): b"newer contents"})
+        # Compacting in this process invalidates the shared archive's indexes.
+        assert shared_archive.read(0, 1) == b"newer contents"
+        assert checked_archive.read(0, 1) == b"newer contents"
+        assert asyncio.run(checked_archive.read_async(0, 0)) == b"new contents"
+        # The old shards were deleted, so the unchecked archive reloads the index too.
+        assert unchecked_archive.read(0, 1) == b"newer contents"
+        assert asyncio.run(unchecked_archive.read_async(0, 0)) == b"new contents"
+
+
+def test_recompaction_keeps_old_index_readers_consistent() -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = os.path.join(tmp_dir, "source")
+        archive_path = os.path.join(tmp_dir, "archive")
+
+        def compact(contents_by_neuron: dict[tuple[int, int], bytes]) -> list[str]:
+            _write_files(source_path, contents_by_neuron, ".jsonl")
+            asyncio.run(
+                compact_dataset(
+                    source_path, archive_path, ".jsonl", max_shard_bytes=20, compression="zlib"
+                )
+            )
+            return sorted(os.listdir(os.path.join(archive_path, "0")))
+
+        old_files = compact({(0, neuron_index): b"old" * 10 for neuron_index in range(5)})
+        # These archives keep the first index until they find its shards are gone.
+        old_archive = ShardedArchive(archive_path, index_check_interval_s=None)
+        old_async_archive = ShardedArchive(archive_path, index_check_interval_s=None)
+        assert old_archive.read(0, 3) == b"old" * 10
+        assert asyncio.run(old_async_archive.read_async(0, 3)) == b"old" * 10
+
+        new_contents_by_neuron = {
+            (0, neuron_index): f"new {neuron_index}".encode() * (neuron_index + 1)
+            for neuron_index in range(5)
+        }
+        new_files = compact(new_contents_by_neuron)
+        # The new shards don't reuse any old shard names, and the old shards are gone.
+        assert "index.json" in new_files
+        assert set(old_files) & set(new_files) == {"index.json"}
+        assert len(new_files) > 2
+        # Reading stale offsets out of new shards would return wrong bytes or fail to decompress.
+        for (layer_index, neuron_index), contents in new_contents_by_neuron.items():
+            assert old_archive.read(layer_index, neuron_index) == contents
+            assert asyncio.run(old_async_archive.read_async(layer_index, neuron_index)) == contents
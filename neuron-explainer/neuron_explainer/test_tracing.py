@@ -0,0 +1,90 @@
+import asyncio
+import gc
+from typing import Iterator
+
+import pytest
+
+from neuron_explainer.tracing import (
+    SpanRecorder,
+    get_trace_attributes,
+    set_tracer,
+    span,
+    trace_attributes,
+    traced,
+)
+
+
+@pytest.fixture
+def recorder() -> Iterator[SpanRecorder]:
+    recorder = SpanRecorder()
+    set_tracer(recorder)
+    try:
+        yield recorder
+    finally:
+        set_tracer(None)
+
+
+def test_spans_are_nested_and_carry_attributes(recorder: SpanRecorder) -> None:
+    @traced()
+    def add(a: int, b: int) -> int:
+        return a + b
+
+    @traced("fail")
+    async def fail() -> None:
+        raise ValueError()
+
+    with trace_attributes(layer_index=0, neuron_index=1):
+        assert get_trace_attributes() == {"layer_index": 0, "neuron_index": 1}
+        with span("outer", step="a"):
+            assert add(1, 2) == 3
+        with pytest.raises(ValueError):
+            asyncio.run(fail())
+    assert get_trace_attributes() == {}
+
+    outer, inner, failed = recorder.spans
+    assert (outer.name, outer.parent_span_id) == ("outer", None)
+    assert outer.attributes == {"layer_index": 0, "neuron_index": 1, "step": "a"}
+    assert inner.name.endswith("add")
+    assert inner.parent_span_id == outer.span_id
+    assert failed.name == "fail"
+    assert failed.attributes["error"] == "ValueError"
+    assert all(recorded_span.end_time_s is not None for recorded_span in recorder.spans)
+
+    assert set(recorder.total_duration_by_name(neuron_index=1)) == {outer.name, inner.name, "fail"}
+    assert recorder.total_duration_by_name(neuron_index=2) == {}
+    trace_events = recorder.to_chrome_trace()["traceEvents"]
+    assert [event["ph"] for event in trace_events] == ["M", "X", "X", "X"]
+    assert trace_events[0]["args"] == {"name": "0:1"}
+
+    recorder.clear()
+    assert recorder.spans == []
+
+
+def test_disabled_tracing_records_nothing() -> None:
+    recorder = SpanRecorder()
+
+    @traced()
+    def identity(x: int) -> int:
+        return x
+
+    with span("unrecorded"):
+        assert identity(1) == 1
+    assert recorder.spans == []
+
+
+def test_each_task_gets_its_own_lane(recorder: SpanRecorder) -> None:
+    async def record_span() -> None:
+        with span("task"):
+            await asyncio.sleep(0)
+
+    async def run_tasks_sequentially() -> None:
+        # Each task is freed before the next is created, so id(task) is likely to be reused.
+        for _ in range(10):
+            await asyncio.create_task(record_span())
+            gc.collect()
+
+    with span("outside"):
+        pass
+    asyncio.run(run_tasks_sequentially())
+    lanes = [recorded_span.lane for recorded_span in recorder.spans]
+    assert len(set(lanes)) == len(lanes)
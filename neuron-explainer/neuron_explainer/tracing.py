@@ -0,0 +1,265 @@
+# Optional tracing hooks for the explanation and scoring pipeline. Tracing is disabled by default;
+# call set_tracer() with a SpanRecorder (built in) or an OpenTelemetryTracer to enable it.
+#
+# Example usage:
+#
+#   recorder = SpanRecorder()
+#   set_tracer(recorder)
+#   with trace_attributes(layer_index=0, neuron_index=816):
+#       await simulate_and_score(simulator, activation_records)
+#   with open("trace.json", "w") as f:
+#       json.dump(recorder.to_chrome_trace(), f)  # Load in chrome://tracing or Perfetto.
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import itertools
+import time
+import weakref
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable, ContextManager, Iterator, Optional
+
+# Attributes attached to every span started in the current context, e.g. the ID of the neuron being
+# explained or scored. Context variables are copied into asyncio tasks, so attributes set around a
+# call to asyncio.gather apply to all of the gathered coroutines.
+_context_attributes: contextvars.ContextVar[dict[str, Any]] = contextvars.ContextVar(
+    "_context_attributes", default={}
+)
+
+
+class Tracer(ABC):
+    """Abstract base class for tracing backends."""
+
+    @abstractmethod
+    def span(self, name: str, attributes: dict[str, Any]) -> ContextManager[None]:
+        """Return a context manager that records a span covering the body of the with block."""
+        ...
+
+
+@dataclass
+class Span:
+    """A timed operation recorded by SpanRecorder."""
+
+    name: str
+    span_id: int
+    parent_span_id: Optional[int]
+    start_time_s: float
+    """Start time, from time.perf_counter()."""
+    end_time_s: Optional[float] = None
+    """End time, from time.perf_counter(). None if the span has not finished yet."""
+    attributes: dict[str, Any] = field(default_factory=dict)
+    lane: int = 0
+    """Identifies the asyncio task that the span ran in. Spans outside of a task share a lane."""
+
+    @property
+    def duration_s(self) -> float:
+        assert self.end_time_s is not None, f"Span {self.name} has not finished"
+        return self.end_time_s - self.start_time_s
+
+
+class SpanRecorder(Tracer):
+    """
+    Lightweight built-in tracer that keeps all spans in memory. Intended for profiling individual
+    runs rather than for long-lived production processes.
+    """
+
+    def __init__(self) -> None:
+        self.spans: list[Span] = []
+        self._span_ids = itertools.count()
+        self._current_span_id: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+            "_current_span_id", default=None
+        )
+        self._reset_lanes()
+
+    def _reset_lanes(self) -> None:
+        self._lane_ids = itertools.count()
+        # Keyed by the task itself rather than id(task), which can be reused once a task is freed.
+        self._task_lanes: weakref.WeakKeyDictionary[asyncio.Task, int] = weakref.WeakKeyDictionary()
+        self._non_task_lane: Optional[int] = None
+
+    def _get_lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is None:
+            if self._non_task_lane is None:
+                self._non_task_lane = next(self._lane_ids)
+            return self._non_task_lane
+        lane = self._task_lanes.get(task)
+        if lane is None:
+            lane = self._task_lanes[task] = next(self._lane_ids)
+        return lane
+
+    @contextlib.contextmanager
+    def span(self, name: str, attributes: dict[str, Any]) -> Iterator[None]:
+        recorded_span = Span(
+            name=name,
+            span_id=next(self._span_ids),
+            parent_span_id=self._current_span_id.get(),
+            start_time_s=time.perf_counter(),
+            attributes=attributes,
+            lane=self._get_lane(),
+        )
+        self.spans.append(recorded_span)
+        token = self._current_span_id.set(recorded_span.span_id)
+        try:
+            yield
+        except BaseException as e:
+            recorded_span.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            recorded_span.end_time_s = time.perf_counter()
+            self._current_span_id.reset(token)
+
+    def clear(self) -> None:
+        self.spans = []
+        self._reset_lanes()
+
+    def total_duration_by_name(self, **attribute_filter: Any) -> dict[str, float]:
+        """
+        Return the summed wall-clock duration of finished spans, grouped by span name. Only spans
+        whose attributes match all of the given key/value pairs are included, e.g.
+        total_duration_by_name(neuron_index=816).
+        """
+        durations: dict[str, float] = {}
+        for recorded_span in self.spans:
+            if recorded_span.end_time_s is None:
+                continue
+            if any(recorded_span.attributes.get(k) != v for k, v in attribute_filter.items()):
+                continue
+            durations[recorded_span.name] = (
+                durations.get(recorded_span.name, 0.0) + recorded_span.duration_s
+            )
+        return durations
+
+    def to_chrome_trace(self, group_by: tuple[str, ...] = ("layer_index", "neuron_index")) -> dict:
+        """
+        Export finished spans in the Chrome trace event format, viewable as a flame chart in
+        chrome://tracing or Perfetto. Spans are grouped into one "process" per distinct value of the
+        group_by attributes (by default, one per neuron), with one "thread" per asyncio task.
+        """
+        if len(self.spans) == 0:
+            return {"traceEvents": []}
+        origin_s = min(recorded_span.start_time_s for recorded_span in self.spans)
+        process_ids: dict[str, int] = {}
+        events: list[dict[str, Any]] = []
+        for recorded_span in self.spans:
+            if recorded_span.end_time_s is None:
+                continue
+            group_name = ":".join(str(recorded_span.attributes.get(key, "?")) for key in group_by)
+            if group_name not in process_ids:
+                process_ids[group_name] = len(process_ids)
+                events.append(
+                    {
+                        "name": "process_name",
+                        "ph": "M",
+                        "pid": process_ids[group_name],
+                        "args": {"name": group_name},
+                    }
+                )
+            events.append(
+                {
+                    "name": recorded_span.name,
+                    "ph": "X",
+                    "ts": (recorded_span.start_time_s - origin_s) * 1e6,
+                    "dur": recorded_span.duration_s * 1e6,
+                    "pid": process_ids[group_name],
+                    "tid": recorded_span.lane,
+                    "args": {k: str(v) for k, v in recorded_span.attributes.items()},
+                }
+            )
+        return {"traceEvents": events}
+
+
+class OpenTelemetryTracer(Tracer):
+    """Forward spans to OpenTelemetry. Requires the opentelemetry-api package."""
+
+    def __init__(self, instrumentation_name: str = "neuron_explainer") -> None:
+        from opentelemetry import trace
+
+        self._tracer = trace.get_tracer(instrumentation_name)
+
+    def span(self, name: str, attributes: dict[str, Any]) -> ContextManager[None]:
+        return self._tracer.start_as_current_span(
+            name,
+            # OpenTelemetry only accepts primitive attribute values.
+            attributes={
+                k: v if isinstance(v, (bool, int, float, str)) else str(v)
+                for k, v in attributes.items()
+            },
+        )
+
+
+_tracer: Optional[Tracer] = None
+
+
+def set_tracer(tracer: Optional[Tracer]) -> None:
+    """Set the process-wide tracer. Pass None to disable tracing."""
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+@contextlib.contextmanager
+def trace_attributes(**attributes: Any) -> Iterator[None]:
+    """Attach the given attributes to all spans started within the with block."""
+    token = _context_attributes.set({**_context_attributes.get(), **attributes})
+    try:
+        yield
+    finally:
+        _context_attributes.reset(token)
+
+
+def get_trace_attributes() -> dict[str, Any]:
+    """Return the attributes set by trace_attributes in the current context."""
+    return _context_attributes.get()
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """Record a span around the body of the with block, if tracing is enabled."""
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+    with tracer.span(name, {**_context_attributes.get(), **attributes}):
+        yield
+
+
+def traced(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """
+    Returns a decorator which records a span around each call to the wrapped function (sync or
+    async). The span name defaults to the function's qualified name.
+    """
+
+    def decorate(f: Callable) -> Callable:
+        span_name = name or f.__qualname__
+        if asyncio.iscoroutinefunction(f):
+
+            @wraps(f)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                if _tracer is None:
+                    return await f(*args, **kwargs)
+                with span(span_name):
+                    return await f(*args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(f)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _tracer is None:
+                return f(*args, **kwargs)
+            with span(span_name):
+                return f(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
@@ -7,7 +7,6 @@ setup(
     author="OpenAI",
     install_requires=[
         "httpx>=0.22",
-        "scikit-learn",
         "boostedblob>=0.13.0",
         "tiktoken",
         "blobfile",
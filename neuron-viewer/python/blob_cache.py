@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+import orjson
+
+
+class BlobCache:
+    """
+    Two-level LRU cache of fetched blobs, keyed by URL: recently used blobs are kept in memory (up
+    to max_memory_bytes), backed by an on-disk cache in cache_dir (up to max_disk_bytes) that
+    survives restarts. Concurrent requests for the same URL share a single upstream fetch.
+
+    Parsed JSON for the most recently used blobs is also kept, so that endpoints which slice large
+    files don't need to parse them on every request.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[bytes]],
+        cache_dir: Optional[str] = None,
+        max_memory_bytes: int = 512 * 1024 * 1024,
+        max_disk_bytes: int = 4 * 1024 * 1024 * 1024,
+        max_parsed_entries: int = 64,
+    ):
+        self._fetch = fetch
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.max_parsed_entries = max_parsed_entries
+        self._blobs: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._parsed: OrderedDict[tuple[str, Callable], Any] = OrderedDict()
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self._disk_sizes: dict[str, int] = {}
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            for entry in os.scandir(cache_dir):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    self._disk_sizes[entry.name] = entry.stat().st_size
+        self.num_upstream_fetches = 0
+
+    async def get(self, url: str) -> bytes:
+        if url in self._blobs:
+            self._blobs.move_to_end(url)
+            return self._blobs[url]
+        if url not in self._in_flight:
+            self._in_flight[url] = asyncio.ensure_future(self._load(url))
+        task = self._in_flight[url]
+        try:
+            # Shield the shared task so that one client disconnecting doesn't cancel the others.
+            return await asyncio.shield(task)
+        finally:
+            if task.done() and self._in_flight.get(url) is task:
+                del self._in_flight[url]
+
+    async def get_json(self, url: str, loads: Callable[[bytes], Any] = orjson.loads) -> Any:
+        """
+        Return the parsed contents of a blob. Pass e.g. fast_dataclasses.loads to parse into
+        dataclasses. Callers must not modify the returned object, since it's shared.
+        """
+        key = (url, loads)
+        if key in self._parsed:
+            self._parsed.move_to_end(key)
+            return self._parsed[key]
+        blob = await self.get(url)
+        # Parsing large files takes a while, so keep it off the event loop.
+        parsed = await asyncio.to_thread(loads, blob)
+        self._parsed[key] = parsed
+        while len(self._parsed) > self.max_parsed_entries:
+            self._parsed.popitem(last=False)
+        return parsed
+
+    async def _load(self, url: str) -> bytes:
+        blob = await self._read_from_disk(url)
+        if blob is None:
+            self.num_upstream_fetches += 1
+            blob = await self._fetch(url)
+            await self._write_to_disk(url, blob)
+        self._add_to_memory(url, blob)
+        return blob
+
+    def _add_to_memory(self, url: str, blob: bytes) -> None:
+        if len(blob) > self.max_memory_bytes:
+            return
+        self._blobs[url] = blob
+        self._memory_bytes += len(blob)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted_blob = self._blobs.popitem(last=False)
+            self._memory_bytes -= len(evicted_blob)
+
+    @staticmethod
+    def _filename(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    async def _read_from_disk(self, url: str) -> Optional[bytes]:
+        if self.cache_dir is None or self._filename(url) not in self._disk_sizes:
+            return None
+        path = os.path.join(self.cache_dir, self._filename(url))
+
+        def read() -> Optional[bytes]:
+            try:
+                with open(path, "rb") as f:
+                    blob = f.read()
+            except FileNotFoundError:
+                return None
+            # The modification time tracks recency of use, for LRU eviction.
+            os.utime(path)
+            return blob
+
+        return await asyncio.to_thread(read)
+
+    async def _write_to_disk(self, url: str, blob: bytes) -> None:
+        if self.cache_dir is None or len(blob) > self.max_disk_bytes:
+            return
+        cache_dir = self.cache_dir
+        filename = self._filename(url)
+
+        def write() -> None:
+            # Write to a temporary file first so that readers never see a partial blob.
+            tmp_path = os.path.join(cache_dir, filename + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, os.path.join(cache_dir, filename))
+
+        await asyncio.to_thread(write)
+        self._disk_sizes[filename] = len(blob)
+        if sum(self._disk_sizes.values()) > self.max_disk_bytes:
+            # The thread only sees a snapshot of the sizes, and _disk_sizes is only modified on the
+            # event loop.
+            evicted_filenames = await asyncio.to_thread(
+                self._evict_from_disk, dict(self._disk_sizes)
+            )
+            for evicted_filename in evicted_filenames:
+                self._disk_sizes.pop(evicted_filename, None)
+
+    def _evict_from_disk(self, disk_sizes: dict[str, int]) -> list[str]:
+        """Delete the least recently used files until the rest fit, returning their filenames."""
+        assert self.cache_dir is not None
+        paths_by_filename = {
+            filename: os.path.join(self.cache_dir, filename) for filename in disk_sizes
+        }
+        # Least recently used first.
+        filenames = sorted(
+            paths_by_filename,
+            key=lambda filename: (
+                os.path.getmtime(paths_by_filename[filename])
+                if os.path.exists(paths_by_filename[filename])
+                else 0.0
+            ),
+        )
+        total_bytes = sum(disk_sizes.values())
+        evicted_filenames = []
+        for filename in filenames:
+            if total_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(paths_by_filename[filename])
+            except FileNotFoundError:
+                pass
+            total_bytes -= disk_sizes[filename]
+            evicted_filenames.append(filename)
+        return evicted_filenames
@@ -1,46 +1,566 @@
 # %%
+# Async backend for running the neuron viewer locally. Fetched blobs are cached in memory and on
+# disk, responses carry ETags and are gzipped, and /load_neuron_bundle returns everything the neuron
+# page needs in one round trip.
+import asyncio
+import hashlib
 import logging
+import os
+from typing import Any, Awaitable, Callable, Optional
 
-from flask import Flask, request
-from flask_cors import CORS
+import aiohttp
+import orjson
+from aiohttp import web
+from blob_cache import BlobCache
+from neuron_explainer.activations.activations import ActivationRecord, NeuronRecord
+from neuron_explainer.activations.token_neuron_index import TokenNeuronIndex
+from neuron_explainer.azure import standardize_azure_url
+from neuron_explainer.explanations.explanation_index import ExplanationIndex
+from neuron_explainer.explanations.explanation_search import ExplanationSearchIndex
+from neuron_explainer.fast_dataclasses import loads
 
-import json
+# These match the paths in src/interpAPI.ts.
+DATA_PATH = "https://openaipublic.blob.core.windows.net/neuron-explainer/data"
+NEURON_RECORDS_PATH = f"{DATA_PATH}/collated-activations"
+EXPLANATIONS_PATH = f"{DATA_PATH}/explanations"
+WEIGHT_TOKENS_PATH = f"{DATA_PATH}/related-tokens/weight-based"
+ACTIVATION_TOKENS_PATH = f"{DATA_PATH}/related-tokens/activation-based"
+CONNECTIONS_PATH = f"{DATA_PATH}/related-neurons/weight-based"
 
-import urllib.request
+# Only public data is proxied, since fetched blobs are cached on disk.
+ALLOWED_URL_PREFIXES = ("https://openaipublic.blob.core.windows.net/",)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "neuron-viewer")
+# Responses smaller than this aren't worth compressing.
+MIN_COMPRESSION_BYTES = 1024
+
+# Number of records of each kind returned by default, matching what the viewer shows before "show
+# more" is clicked. Sections are "top", "random" and "quantile_{i}" for each quantile.
+DEFAULT_RECORD_SECTIONS = {
+    "top": {"offset": 0, "limit": 4},
+    "quantile_0": {"offset": 0, "limit": 1},
+    "quantile_1": {"offset": 0, "limit": 1},
+    "quantile_2": {"offset": 0, "limit": 1},
+    "quantile_3": {"offset": 0, "limit": 1},
+    "random": {"offset": 0, "limit": 2},
+}
+
+# Number of connected neurons returned in each direction by /load_neighbor_explanations.
+DEFAULT_NUM_NEIGHBORS = 10
+# Keys of the connections files for each direction.
+CONNECTION_WEIGHT_NAMES = {"input": "c_fc", "output": "c_proj"}
+# Maximum number of results returned by /query_explanations and /search_explanations.
+DEFAULT_QUERY_LIMIT = 100
+DEFAULT_SEARCH_LIMIT = 20
+# Maximum number of neurons returned per source by /load_token_neurons.
+DEFAULT_TOKEN_NEURONS_LIMIT = 20
+
+BLOB_CACHE = web.AppKey("blob_cache", BlobCache)
+HTTP_SESSION = web.AppKey("http_session", aiohttp.ClientSession)
+EXPLANATION_INDEX = web.AppKey("explanation_index", ExplanationIndex)
+EXPLANATION_SEARCH_INDEX = web.AppKey("explanation_search_index", ExplanationSearchIndex)
+TOKEN_NEURON_INDEX = web.AppKey("token_neuron_index", TokenNeuronIndex)
+
+
+class UpstreamError(Exception):
+    def __init__(self, status: int, url: str):
+        super().__init__(f"Fetching {url} failed with status {status}")
+        self.status = status
+
+
+def make_json_response(request: web.Request, body: bytes) -> web.Response:
+    """Make a JSON response with an ETag (answering 304 if it matches) and gzip compression."""
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    if etag in request.headers.get("If-None-Match", ""):
+        return web.Response(status=304, headers={"ETag": etag})
+    response = web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+    if len(body) >= MIN_COMPRESSION_BYTES:
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            response.enable_compression(web.ContentCoding.gzip)
+        else:
+            # Falls back to deflate if the client accepts it.
+            response.enable_compression()
+    return response
+
+
+def make_error_response(status: int, message: str) -> web.Response:
+    return web.Response(
+        status=status, body=orjson.dumps({"error": message}), content_type="application/json"
+    )
+
+
+async def get_args(request: web.Request) -> dict[str, Any]:
+    """Read arguments from the JSON body of a POST request or the query string of a GET request."""
+    if request.method == "POST" and request.can_read_body:
+        return await request.json(loads=orjson.loads)
+    return dict(request.query)
+
+
+def get_neuron_args(args: dict[str, Any]) -> tuple[int, int]:
+    return int(args["layer"]), int(args["neuron"])
+
+
+async def load_json_or_none(blob_cache: BlobCache, url: str) -> Optional[Any]:
+    """Load a JSON blob, returning None if it doesn't exist."""
+    try:
+        return await blob_cache.get_json(url)
+    except UpstreamError as e:
+        if e.status == 404:
+            return None
+        raise
+
+
+def load_neuron_record_blob(blob: bytes) -> NeuronRecord:
+    neuron_record = loads(blob)
+    if not isinstance(neuron_record, NeuronRecord):
+        raise ValueError("Stored data incompatible with current version of NeuronRecord dataclass.")
+    return neuron_record
+
+
+def get_record_sections(neuron_record: NeuronRecord) -> dict[str, list[ActivationRecord]]:
+    record_sections = {
+        "top": neuron_record.most_positive_activation_records,
+        "random": neuron_record.random_sample,
+    }
+    for i, records in enumerate(neuron_record.random_sample_by_quantile or []):
+        record_sections[f"quantile_{i}"] = records
+    return record_sections
+
+
+def normalize_activations_for_display(
+    activations: list[float], max_activation: float
+) -> list[float]:
+    """
+    Scale activations to [0, 1] using the neuron's max activation, treating negative activations as
+    0. This matches the normalization the viewer does itself when it loads neuron records directly.
+    """
+    if max_activation <= 0:
+        return [0.0 for _ in activations]
+    return [min(1.0, max(0.0, activation) / max_activation) for activation in activations]
+
+
+def slice_neuron_record(
+    neuron_record: NeuronRecord, sections: dict[str, dict[str, int]]
+) -> dict[str, Any]:
+    """
+    Return the requested page ({"offset": ..., "limit": ...}) of each requested section of
+    activation records, with activations normalized to [0, 1] using the neuron's max activation,
+    plus the neuron's summary statistics. Sections the neuron record doesn't have (e.g. quantiles,
+    for datasets collected without quantile tracking) are left out.
+    """
+    max_activation = neuron_record.max_activation
+    record_sections = get_record_sections(neuron_record)
+    sliced_sections = {}
+    for name, page in sections.items():
+        if name not in record_sections:
+            continue
+        records = record_sections[name]
+        offset = max(0, int(page.get("offset", 0)))
+        limit = max(0, int(page.get("limit", len(records))))
+        sliced_sections[name] = {
+            "total": len(records),
+            "offset": offset,
+            "records": [
+                {
+                    "tokens": record.tokens,
+                    "activations": record.activations,
+                    "normalized_activations": normalize_activations_for_display(
+                        record.activations, max_activation
+                    ),
+                }
+                for record in records[offset : offset + limit]
+            ],
+        }
+    return {
+        "neuron_id": neuron_record.neuron_id,
+        "max_activation": max_activation,
+        "mean": neuron_record.mean,
+        "variance": neuron_record.variance,
+        "skewness": neuron_record.skewness,
+        "kurtosis": neuron_record.kurtosis,
+        "quantile_boundaries": neuron_record.quantile_boundaries,
+        "sections": sliced_sections,
+    }
+
+
+async def load_sliced_neuron_record(
+    blob_cache: BlobCache,
+    layer_index: int,
+    neuron_index: int,
+    sections: dict[str, dict[str, int]] = DEFAULT_RECORD_SECTIONS,
+) -> Optional[dict[str, Any]]:
+    """Load the requested activation records for a neuron, or None if it has no neuron record."""
+    url = f"{NEURON_RECORDS_PATH}/{layer_index}/{neuron_index}.json"
+    try:
+        neuron_record = await blob_cache.get_json(url, loads=load_neuron_record_blob)
+    except UpstreamError as e:
+        if e.status == 404:
+            return None
+        raise
+    return slice_neuron_record(neuron_record, sections)
+
+
+def load_top_explanation_blob(blob: bytes) -> Optional[dict[str, Any]]:
+    """
+    Parse a NeuronSimulationResults blob into its best-scoring explanation, dropping the per-sequence
+    simulations, which make up almost all of the blob.
+    """
+    best = None
+    for scored_explanation in orjson.loads(blob).get("scored_explanations") or []:
+        scored_simulation = scored_explanation.get("scored_simulation") or {}
+        score = scored_simulation.get("ev_correlation_score")
+        if best is None or (score is not None and (best["score"] is None or score > best["score"])):
+            best = {"explanation": scored_explanation.get("explanation"), "score": score}
+    return best
+
+
+async def load_top_explanation(
+    blob_cache: BlobCache, layer_index: int, neuron_index: int
+) -> Optional[dict[str, Any]]:
+    url = f"{EXPLANATIONS_PATH}/{layer_index}/{neuron_index}.jsonl"
+    try:
+        return await blob_cache.get_json(url, loads=load_top_explanation_blob)
+    except UpstreamError as e:
+        if e.status == 404:
+            return None
+        raise
+
+
+def get_connected_neurons(
+    connections: dict[str, Any], num_neighbors: int
+) -> dict[str, list[tuple[int, int, float]]]:
+    """Return the top positively connected (layer, neuron, strength) in each direction."""
+    connected_neurons = {}
+    for direction, weight_name in CONNECTION_WEIGHT_NAMES.items():
+        connections_for_direction = connections.get(weight_name)
+        if connections_for_direction is None:
+            continue
+        neuron_strs = connections_for_direction["top_positive_neurons"][:num_neighbors]
+        weights = connections_for_direction["top_positive_weights"][:num_neighbors]
+        connected_neurons[direction] = []
+        for neuron_str, weight in zip(neuron_strs, weights):
+            layer_index, neuron_index = map(int, neuron_str.split("_"))
+            connected_neurons[direction].append((layer_index, neuron_index, weight))
+    return connected_neurons
+
+
+def make_app(
+    cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+    explanation_index_path: Optional[str] = None,
+    explanation_search_index_path: Optional[str] = None,
+    token_neuron_index_path: Optional[str] = None,
+    fetch: Optional[Callable[[str], Awaitable[bytes]]] = None,
+) -> web.Application:
+    """
+    explanation_index_path is an index built by neuron_explainer.explanations.explanation_index,
+    which is needed for /query_explanations. Similarly, explanation_search_index_path is built by
+    neuron_explainer.explanations.explanation_search and is needed for /search_explanations, and
+    token_neuron_index_path is built by neuron_explainer.activations.token_neuron_index and is
+    needed for /load_token_neurons.
+
+    fetch replaces the upstream HTTP fetch, e.g. in tests. It should raise UpstreamError for
+    missing blobs.
+    """
+    app = web.Application(middlewares=[cors_middleware, error_middleware])
+
+    async def fetch_from_upstream(url: str) -> bytes:
+        async with app[HTTP_SESSION].get(url) as response:
+            if response.status != 200:
+                raise UpstreamError(response.status, url)
+            return await response.read()
+
+    app[BLOB_CACHE] = BlobCache(fetch or fetch_from_upstream, cache_dir=cache_dir)
+
+    async def http_session_context(app: web.Application) -> Any:
+        # One pooled upstream session for the lifetime of the server.
+        async with aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=120),
+            connector=aiohttp.TCPConnector(limit=64),
+        ) as session:
+            app[HTTP_SESSION] = session
+            yield
+
+    app.cleanup_ctx.append(http_session_context)
+    if explanation_index_path is not None:
+
+        async def load_explanation_index(app: web.Application) -> None:
+            app[EXPLANATION_INDEX] = await asyncio.to_thread(
+                ExplanationIndex.load, explanation_index_path
+            )
+
+        app.on_startup.append(load_explanation_index)
+    if explanation_search_index_path is not None:
+
+        async def load_explanation_search_index(app: web.Application) -> None:
+            app[EXPLANATION_SEARCH_INDEX] = await asyncio.to_thread(
+                ExplanationSearchIndex.load, explanation_search_index_path
+            )
+
+        async def close_explanation_search_index(app: web.Application) -> None:
+            # Closes the API client of an embedder the index created for queries.
+            await app[EXPLANATION_SEARCH_INDEX].aclose()
+
+        app.on_startup.append(load_explanation_search_index)
+        app.on_cleanup.append(close_explanation_search_index)
+    if token_neuron_index_path is not None:
+        # The index is memory-mapped, so loading it is quick.
+        app[TOKEN_NEURON_INDEX] = TokenNeuronIndex(token_neuron_index_path)
+    app.router.add_route("*", "/load_az", load_az)
+    app.router.add_route("*", "/load_neuron_bundle", load_neuron_bundle)
+    app.router.add_route("*", "/load_neuron_records", load_neuron_records)
+    app.router.add_route("*", "/load_neighbor_explanations", load_neighbor_explanations)
+    app.router.add_route("*", "/query_explanations", query_explanations)
+    app.router.add_route("*", "/search_explanations", search_explanations)
+    app.router.add_route("*", "/load_token_neurons", load_token_neurons)
+    return app
+
+
+@web.middleware
+async def cors_middleware(request: web.Request, handler: Any) -> web.StreamResponse:
+    if request.method == "OPTIONS":
+        response: web.StreamResponse = web.Response()
+    else:
+        response = await handler(request)
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Allow-Headers"] = "Content-Type,Authorization,If-None-Match"
+    response.headers["Access-Control-Allow-Methods"] = "GET,PUT,POST,DELETE,OPTIONS"
+    response.headers["Access-Control-Expose-Headers"] = "ETag"
+    return response
+
+
+@web.middleware
+async def error_middleware(request: web.Request, handler: Any) -> web.StreamResponse:
+    try:
+        return await handler(request)
+    except UpstreamError as e:
+        return make_error_response(e.status if e.status >= 400 else 502, str(e))
+    except (KeyError, ValueError) as e:
+        return make_error_response(400, f"Invalid request: {e!r}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.exception("Upstream request failed")
+        return make_error_response(502, f"Upstream request failed: {e!r}")
+
+
+async def load_az(request: web.Request) -> web.Response:
+    """Return the contents of a blob, e.g. {"path": ".../collated-activations/0/0.json"}."""
+    args = await get_args(request)
+    url = standardize_azure_url(args["path"])
+    if not url.startswith(ALLOWED_URL_PREFIXES):
+        return make_error_response(403, f"Loading {url} is not allowed")
+    return make_json_response(request, await request.app[BLOB_CACHE].get(url))
+
+
+async def load_neuron_records(request: web.Request) -> web.Response:
+    """
+    Return pages of a neuron's activation records, e.g.
+    {"layer": 0, "neuron": 0, "sections": {"top": {"offset": 4, "limit": 10}}}. Without
+    "sections", returns the records the viewer shows by default. See slice_neuron_record.
+    """
+    args = await get_args(request)
+    layer_index, neuron_index = get_neuron_args(args)
+    sliced_neuron_record = await load_sliced_neuron_record(
+        request.app[BLOB_CACHE],
+        layer_index,
+        neuron_index,
+        args.get("sections", DEFAULT_RECORD_SECTIONS),
+    )
+    if sliced_neuron_record is None:
+        return make_error_response(404, f"No neuron record for {layer_index}:{neuron_index}")
+    return make_json_response(request, orjson.dumps(sliced_neuron_record))
+
+
+async def load_neuron_bundle(request: web.Request) -> web.Response:
+    """
+    Return the default activation records, explanations, top tokens and connections for one neuron,
+    e.g. {"layer": 0, "neuron": 0}. Data that doesn't exist for the neuron is returned as null.
+    """
+    layer_index, neuron_index = get_neuron_args(await get_args(request))
+    blob_cache = request.app[BLOB_CACHE]
+    suffix = f"{layer_index}/{neuron_index}"
+    (
+        activation_records,
+        explanations,
+        weight_tokens,
+        activation_tokens,
+        connections,
+    ) = await asyncio.gather(
+        load_sliced_neuron_record(blob_cache, layer_index, neuron_index),
+        load_json_or_none(blob_cache, f"{EXPLANATIONS_PATH}/{suffix}.jsonl"),
+        load_json_or_none(blob_cache, f"{WEIGHT_TOKENS_PATH}/{suffix}.json"),
+        load_json_or_none(blob_cache, f"{ACTIVATION_TOKENS_PATH}/{suffix}.json"),
+        load_json_or_none(blob_cache, f"{CONNECTIONS_PATH}/{suffix}.json"),
+    )
+    return make_json_response(
+        request,
+        orjson.dumps(
+            {
+                "activation_records": activation_records,
+                "explanations": explanations,
+                "top_tokens": {"weight": weight_tokens, "activation": activation_tokens},
+                "connections": connections,
+            }
+        ),
+    )
+
+
+async def load_neighbor_explanations(request: web.Request) -> web.Response:
+    """
+    Return the neurons most strongly connected to a neuron, with their best explanation and its
+    score, e.g. {"layer": 0, "neuron": 0, "num_neighbors": 10}. The response has "input" and
+    "output" lists of {"layer", "neuron", "strength", "explanation", "score"}, where explanation
+    and score are null for neurons without explanations.
+    """
+    args = await get_args(request)
+    layer_index, neuron_index = get_neuron_args(args)
+    num_neighbors = int(args.get("num_neighbors", DEFAULT_NUM_NEIGHBORS))
+    blob_cache = request.app[BLOB_CACHE]
+    connections = await load_json_or_none(
+        blob_cache, f"{CONNECTIONS_PATH}/{layer_index}/{neuron_index}.json"
+    )
+    if connections is None:
+        return make_error_response(404, f"No connections for {layer_index}:{neuron_index}")
+    neighbors = {
+        direction: [
+            {"layer": neighbor_layer_index, "neuron": neighbor_neuron_index, "strength": strength}
+            for neighbor_layer_index, neighbor_neuron_index, strength in connected_neurons
+        ]
+        for direction, connected_neurons in get_connected_neurons(
+            connections, num_neighbors
+        ).items()
+    }
+    # Explanations for all neighbors in both directions are loaded concurrently.
+    flat_neighbors = [neighbor for direction in neighbors.values() for neighbor in direction]
+    top_explanations = await asyncio.gather(
+        *[
+            load_top_explanation(blob_cache, neighbor["layer"], neighbor["neuron"])
+            for neighbor in flat_neighbors
+        ]
+    )
+    for neighbor, top_explanation in zip(flat_neighbors, top_explanations):
+        neighbor["explanation"] = top_explanation["explanation"] if top_explanation else None
+        neighbor["score"] = top_explanation["score"] if top_explanation else None
+    return make_json_response(request, orjson.dumps(neighbors))
+
+
+async def query_explanations(request: web.Request) -> web.Response:
+    """
+    Return explanations matching a query, sorted by descending score, e.g. {"text": "dog",
+    "min_score": 0.6, "max_score": 1.0, "score_name": "ev_correlation_score", "layers": [0, 1],
+    "limit": 100}. All arguments are optional. See ExplanationIndex.query.
+    """
+    if EXPLANATION_INDEX not in request.app:
+        return make_error_response(404, "No explanation index was loaded")
+    args = await get_args(request)
+    layer_indices = args.get("layers")
+    if isinstance(layer_indices, str):
+        layer_indices = layer_indices.split(",")
+    entries = request.app[EXPLANATION_INDEX].query(
+        text=args.get("text"),
+        min_score=float(args["min_score"]) if args.get("min_score") is not None else None,
+        max_score=float(args["max_score"]) if args.get("max_score") is not None else None,
+        score_name=args.get("score_name", "ev_correlation_score"),
+        layer_indices=(
+            [int(layer_index) for layer_index in layer_indices]
+            if layer_indices is not None
+            else None
+        ),
+        limit=int(args.get("limit", DEFAULT_QUERY_LIMIT)),
+    )
+    return make_json_response(
+        request,
+        orjson.dumps(
+            [
+                {
+                    "layer": entry.neuron_id.layer_index,
+                    "neuron": entry.neuron_id.neuron_index,
+                    "explanation": entry.explanation,
+                    "scores": entry.scores,
+                }
+                for entry in entries
+            ]
+        ),
+    )
+
+
+async def search_explanations(request: web.Request) -> web.Response:
+    """
+    Return the explanations most relevant to a query, e.g. {"query": "dogs", "method": "hybrid",
+    "limit": 20}. method is "bm25", "embedding" or "hybrid". See ExplanationSearchIndex.search.
+    """
+    if EXPLANATION_SEARCH_INDEX not in request.app:
+        return make_error_response(404, "No explanation search index was loaded")
+    args = await get_args(request)
+    results = await request.app[EXPLANATION_SEARCH_INDEX].search(
+        args["query"],
+        method=args.get("method", "hybrid"),
+        limit=int(args.get("limit", DEFAULT_SEARCH_LIMIT)),
+    )
+    return make_json_response(
+        request,
+        orjson.dumps(
+            [
+                {
+                    "layer": result.entry.neuron_id.layer_index,
+                    "neuron": result.entry.neuron_id.neuron_index,
+                    "explanation": result.entry.explanation,
+                    "scores": result.entry.scores,
+                    "relevance": result.relevance,
+                }
+                for result in results
+            ]
+        ),
+    )
+
+
+async def load_token_neurons(request: web.Request) -> web.Response:
+    """
+    Return the neurons most strongly associated with a token across all layers, for each source
+    (e.g. "activation-based.average_activations"), e.g. {"token": " dog", "limit": 20}. The token
+    must match exactly, including leading spaces.
+    """
+    if TOKEN_NEURON_INDEX not in request.app:
+        return make_error_response(404, "No token neuron index was loaded")
+    args = await get_args(request)
+    top_neurons_by_source = request.app[TOKEN_NEURON_INDEX].get_top_neurons_by_source(
+        args["token"], limit=int(args.get("limit", DEFAULT_TOKEN_NEURONS_LIMIT))
+    )
+    return make_json_response(
+        request,
+        orjson.dumps(
+            {
+                source: [
+                    {
+                        "layer": connection.neuron_id.layer_index,
+                        "neuron": connection.neuron_id.neuron_index,
+                        "strength": connection.strength,
+                    }
+                    for connection in top_neurons
+                ]
+                for source, top_neurons in top_neurons_by_source.items()
+            }
+        ),
+    )
 
-def load_az_json(url):
-    with urllib.request.urlopen(url) as f:
-        return json.load(f)
 
 def start(
     dev: bool = False,
     host_name: str = "0.0.0.0",
     port: int = 80,
+    cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+    explanation_index_path: Optional[str] = None,
+    explanation_search_index_path: Optional[str] = None,
+    token_neuron_index_path: Optional[str] = None,
 ):
-    app = Flask("interpretability chat")
-    app.logger.setLevel(logging.INFO)
-    # app.logger.disabled = True
-    CORS(app)
-
-    @app.after_request
-    def after_request(response):
-        response.headers.add("Access-Control-Allow-Origin", "*")
-        response.headers.add(
-            "Access-Control-Allow-Headers", "Content-Type,Authorization"
-        )
-        response.headers.add(
-            "Access-Control-Allow-Methods", "GET,PUT,POST,DELETE,OPTIONS"
-        )
-        return response
-
-    @app.route("/load_az", methods=["GET", "POST"])
-    async def load_az():
-        args = request.get_json()
-        path = args["path"]
-        result = load_az_json(path)
-        return result
-
-    app.run(debug=dev, host=host_name, port=port, use_reloader=False)
+    logging.basicConfig(level=logging.DEBUG if dev else logging.INFO)
+    web.run_app(
+        make_app(
+            cache_dir=cache_dir,
+            explanation_index_path=explanation_index_path,
+            explanation_search_index_path=explanation_search_index_path,
+            token_neuron_index_path=token_neuron_index_path,
+        ),
+        host=host_name,
+        port=port,
+    )
 
 
 def main(dev: bool = True, host_name: str = "0.0.0.0", port: int = 8000):
@@ -0,0 +1,67 @@
+import asyncio
+import os
+from pathlib import Path
+
+from blob_cache import BlobCache
+
+
+class FakeFetch:
+    """Returns the URL repeated to a given size after a short delay, counting fetches per URL."""
+
+    def __init__(self, size: int = 10):
+        self.size = size
+        self.num_fetches: dict[str, int] = {}
+
+    async def __call__(self, url: str) -> bytes:
+        self.num_fetches[url] = self.num_fetches.get(url, 0) + 1
+        await asyncio.sleep(0.01)
+        return (url.encode("utf-8") * self.size)[: self.size]
+
+
+def test_concurrent_gets_share_one_fetch() -> None:
+    fetch = FakeFetch()
+    blob_cache = BlobCache(fetch)
+
+    async def get_concurrently() -> list[bytes]:
+        return await asyncio.gather(*[blob_cache.get("a") for _ in range(5)], blob_cache.get("b"))
+
+    blobs = asyncio.run(get_concurrently())
+    assert blobs == [b"a" * 10] * 5 + [b"b" * 10]
+    assert fetch.num_fetches == {"a": 1, "b": 1}
+    # Later requests are served from memory.
+    assert asyncio.run(blob_cache.get("a")) == b"a" * 10
+    assert blob_cache.num_upstream_fetches == 2
+
+
+def test_memory_cache_evicts_least_recently_used() -> None:
+    fetch = FakeFetch()
+    blob_cache = BlobCache(fetch, max_memory_bytes=25)
+
+    async def get_all(urls: list[str]) -> None:
+        for url in urls:
+            await blob_cache.get(url)
+
+    asyncio.run(get_all(["a", "b", "a", "c", "a", "b"]))
+    # "b" was evicted to make room for "c", while "a" stayed because it was used more recently.
+    assert fetch.num_fetches == {"a": 1, "b": 2, "c": 1}
+
+
+def test_disk_cache_survives_restarts_and_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache_dir = os.path.join(tmp_path, "cache")
+    fetch = FakeFetch()
+
+    async def get_all(blob_cache: BlobCache, urls: list[str]) -> None:
+        for url in urls:
+            await blob_cache.get(url)
+            # Modification times need to differ for the LRU order to be well defined.
+            await asyncio.sleep(0.01)
+
+    blob_cache = BlobCache(fetch, cache_dir=cache_dir, max_memory_bytes=0, max_disk_bytes=25)
+    asyncio.run(get_all(blob_cache, ["a", "b", "a", "c"]))
+    assert sorted(blob_cache._disk_sizes) == sorted(map(BlobCache._filename, ["a", "c"]))
+    assert sorted(os.listdir(cache_dir)) == sorted(blob_cache._disk_sizes)
+
+    restarted_blob_cache = BlobCache(fetch, cache_dir=cache_dir, max_disk_bytes=25)
+    asyncio.run(get_all(restarted_blob_cache, ["a", "c", "b"]))
+    assert fetch.num_fetches == {"a": 1, "b": 2, "c": 1}
+    assert restarted_blob_cache.num_upstream_fetches == 1
@@ -0,0 +1,237 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+
+import orjson
+from aiohttp.test_utils import TestClient, TestServer
+from neuron_explainer.activations.activations import ActivationRecord, NeuronId, NeuronRecord
+from neuron_explainer.explanations.explanation_index import ExplanationIndex
+from neuron_explainer.explanations.explanation_search import (
+    ExplanationSearchIndex,
+    HashingEmbedder,
+)
+from neuron_explainer.explanations.explanations import (
+    NeuronSimulationResults,
+    ScoredExplanation,
+    ScoredSimulation,
+)
+from neuron_explainer.fast_dataclasses import dumps
+from server import (
+    CONNECTIONS_PATH,
+    EXPLANATION_SEARCH_INDEX,
+    EXPLANATIONS_PATH,
+    NEURON_RECORDS_PATH,
+    UpstreamError,
+    make_app,
+)
+
+
+def _make_results(
+    layer_index: int, neuron_index: int, explanation: str, score: Optional[float]
+) -> NeuronSimulationResults:
+    return NeuronSimulationResults(
+        neuron_id=NeuronId(layer_index=layer_index, neuron_index=neuron_index),
+        scored_explanations=[
+            ScoredExplanation(
+                explanation=explanation,
+                scored_simulation=ScoredSimulation(
+                    scored_sequence_simulations=[], ev_correlation_score=score
+                ),
+            )
+        ],
+    )
+
+
+BLOBS = {
+    f"{NEURON_RECORDS_PATH}/0/0.json": dumps(
+        NeuronRecord(
+            neuron_id=NeuronId(layer_index=0, neuron_index=0),
+            most_positive_activation_records=[
+                ActivationRecord(tokens=["a", "b"], activations=[4.0, 1.5]),
+                ActivationRecord(tokens=["c", "d"], activations=[-1.0, 1.0]),
+            ],
+            random_sample=[ActivationRecord(tokens=["e"], activations=[8.0])],
+            random_sample_by_quantile=[
+                [ActivationRecord(tokens=["f"], activations=[float(i)])] for i in range(4)
+            ],
+            quantile_boundaries=[0.5, 1.0, 2.0],
+        )
+    ),
+    # This neuron record was collected without quantile tracking.
+    f"{NEURON_RECORDS_PATH}/2/0.json": dumps(
+        NeuronRecord(
+            neuron_id=NeuronId(layer_index=2, neuron_index=0),
+            most_positive_activation_records=[ActivationRecord(tokens=["g"], activations=[1.0])],
+            random_sample=[ActivationRecord(tokens=["h"], activations=[0.5])],
+        )
+    ),
+    f"{EXPLANATIONS_PATH}/0/0.jsonl": dumps(_make_results(0, 0, "vowels", 0.5)) + b"\n",
+    f"{EXPLANATIONS_PATH}/1/0.jsonl": dumps(_make_results(1, 0, "consonants", 0.3)) + b"\n",
+    # Explanations for this neuron haven't been scored.
+    f"{EXPLANATIONS_PATH}/1/1.jsonl": dumps(_make_results(1, 1, "letters", None)) + b"\n",
+    f"{CONNECTIONS_PATH}/0/0.json": orjson.dumps(
+        {
+            "c_proj": {
+                "top_positive_neurons": ["1_0", "1_1", "1_2"],
+                "top_positive_weights": [0.9, 0.8, 0.7],
+            }
+        }
+    ),
+}
+
+
+class FakeFetch:
+    """Serves BLOBS, counting fetches per URL."""
+
+    def __init__(self) -> None:
+        self.num_fetches: dict[str, int] = {}
+
+    async def __call__(self, url: str) -> bytes:
+        self.num_fetches[url] = self.num_fetches.get(url, 0) + 1
+        if url not in BLOBS:
+            raise UpstreamError(404, url)
+        return BLOBS[url]
+
+
+def _run_with_client(
+    test: Callable[[TestClient], Awaitable[None]],
+    search_index: Optional[ExplanationSearchIndex] = None,
+) -> FakeFetch:
+    fetch = FakeFetch()
+    app = make_app(cache_dir=None, fetch=fetch)
+    if search_index is not None:
+        app[EXPLANATION_SEARCH_INDEX] = search_index
+
+    async def run() -> None:
+        async with TestClient(TestServer(app)) as client:
+            await test(client)
+
+    asyncio.run(run())
+    return fetch
+
+
+async def _post_json(client: TestClient, path: str, args: dict[str, Any]) -> Any:
+    response = await client.post(path, json=args)
+    assert response.status == 200, await response.text()
+    return await response.json()
+
+
+def test_load_neuron_bundle() -> None:
+    async def test(client: TestClient) -> None:
+        bundle = await _post_json(client, "/load_neuron_bundle", {"layer": 0, "neuron": 0})
+        assert bundle["activation_records"]["max_activation"] == 4.0
+        top_section = bundle["activation_records"]["sections"]["top"]
+        assert top_section["total"] == 2
+        assert [record["tokens"] for record in top_section["records"]] == [["a", "b"], ["c", "d"]]
+        assert bundle["explanations"]["scored_explanations"][0]["explanation"] == "vowels"
+        assert bundle["top_tokens"] == {"weight": None, "activation": None}
+        assert bundle["connections"]["c_proj"]["top_positive_neurons"][0] == "1_0"
+
+        # Responses carry ETags.
+        response = await client.get("/load_neuron_bundle", params={"layer": 0, "neuron": 0})
+        assert await response.json() == bundle
+        response = await client.get(
+            "/load_neuron_bundle",
+            params={"layer": 0, "neuron": 0},
+            headers={"If-None-Match": response.headers["ETag"]},
+        )
+        assert response.status == 304
+
+    # Blobs that exist are only fetched once.
+    num_fetches = _run_with_client(test).num_fetches
+    assert {url: num_fetches[url] for url in BLOBS if url in num_fetches} == {
+        f"{NEURON_RECORDS_PATH}/0/0.json": 1,
+        f"{EXPLANATIONS_PATH}/0/0.jsonl": 1,
+        f"{CONNECTIONS_PATH}/0/0.json": 1,
+    }
+
+
+def test_load_neuron_records() -> None:
+    async def test(client: TestClient) -> None:
+        records = await _post_json(
+            client,
+            "/load_neuron_records",
+            {"layer": 0, "neuron": 0, "sections": {"top": {"offset": 1, "limit": 5}}},
+        )
+        assert list(records["sections"]) == ["top"]
+        assert records["sections"]["top"]["offset"] == 1
+        (record,) = records["sections"]["top"]["records"]
+        assert record["tokens"] == ["c", "d"]
+        assert record["activations"] == [-1.0, 1.0]
+        assert record["normalized_activations"] == [0.0, 0.25]
+        # Activations above the max of the top records are clipped.
+        records = await _post_json(client, "/load_neuron_records", {"layer": 0, "neuron": 0})
+        assert records["sections"]["random"]["records"][0]["normalized_activations"] == [1.0]
+
+        records = await _post_json(client, "/load_neuron_records", {"layer": 2, "neuron": 0})
+        assert sorted(records["sections"]) == ["random", "top"]
+
+        response = await client.post("/load_neuron_records", json={"layer": 0, "neuron": 1})
+        assert response.status == 404
+        response = await client.post("/load_neuron_records", json={"layer": 0})
+        assert response.status == 400
+
+    _run_with_client(test)
+
+
+def test_load_neighbor_explanations() -> None:
+    async def test(client: TestClient) -> None:
+        neighbors = await _post_json(
+            client, "/load_neighbor_explanations", {"layer": 0, "neuron": 0}
+        )
+        assert neighbors == {
+            "output": [
+                {
+                    "layer": 1,
+                    "neuron": 0,
+                    "strength": 0.9,
+                    "explanation": "consonants",
+                    "score": 0.3,
+                },
+                {"layer": 1, "neuron": 1, "strength": 0.8, "explanation": "letters", "score": None},
+                {"layer": 1, "neuron": 2, "strength": 0.7, "explanation": None, "score": None},
+            ]
+        }
+        neighbors = await _post_json(
+            client, "/load_neighbor_explanations", {"layer": 0, "neuron": 0, "num_neighbors": 1}
+        )
+        assert [neighbor["neuron"] for neighbor in neighbors["output"]] == [0]
+
+    _run_with_client(test)
+
+
+def test_search_explanations() -> None:
+    explanation_index = ExplanationIndex.from_neuron_simulation_results(
+        [
+            _make_results(0, 0, "vowels", 0.5),
+            _make_results(1, 0, "consonants", 0.3),
+            _make_results(1, 1, "letters", None),
+        ]
+    )
+    search_index = asyncio.run(
+        ExplanationSearchIndex.build(explanation_index, embedder=HashingEmbedder(), num_lists=1)
+    )
+
+    async def test(client: TestClient) -> None:
+        results = await _post_json(
+            client, "/search_explanations", {"query": "consonants", "method": "bm25"}
+        )
+        assert results == [
+            {
+                "layer": 1,
+                "neuron": 0,
+                "explanation": "consonants",
+                "scores": results[0]["scores"],
+                "relevance": results[0]["relevance"],
+            }
+        ]
+        assert results[0]["scores"]["ev_correlation_score"] == 0.3
+
+    _run_with_client(test, search_index=search_index)
+
+
+def test_search_explanations_without_index() -> None:
+    async def test(client: TestClient) -> None:
+        response = await client.post("/search_explanations", json={"query": "vowels"})
+        assert response.status == 404
+
+    _run_with_client(test)
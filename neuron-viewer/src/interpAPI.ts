@@ -1,11 +1,8 @@
 import {Neuron} from './types';
 import {memoizeAsync} from "./utils"
 
-export const load_file_no_cache = async(path: string) => {
-  const data = {
-    path: path
-  }
-  const url = new URL("/load_az", window.location.href)
+const post_local = async(route: string, data: any) => {
+  const url = new URL(route, window.location.href)
   url.port = '8000';
   return await (
     await fetch(url, {
@@ -16,7 +13,10 @@ export const load_file_no_cache = async(path: string) => {
       body: JSON.stringify(data),
     })
   ).json()
-  
+}
+
+export const load_file_no_cache = async(path: string) => {
+  return await post_local("/load_az", {path: path})
 }
 
 export  const load_file_az = async(path: string) => {
@@ -38,7 +38,19 @@ export  const load_file_az = async(path: string) => {
 
 
 // export const load_file = memoizeAsync('load_file', load_file_no_cache)
-export  const load_file = window.location.host.indexOf('localhost:') === -1 ? load_file_az : load_file_no_cache;
+export const is_local = window.location.host.indexOf('localhost:') !== -1
+export  const load_file = is_local ? load_file_no_cache : load_file_az;
+
+// When running locally, the data for the active neuron's panes is loaded in a single request to the
+// backend, shared between the panes.
+const neuron_bundles: Map<string, Promise<any>> = new Map()
+export const get_neuron_bundle = (activeNeuron: Neuron) => {
+  const key = `${activeNeuron.layer}:${activeNeuron.neuron}`
+  if (!neuron_bundles.has(key)) {
+    neuron_bundles.set(key, post_local("/load_neuron_bundle", {layer: activeNeuron.layer, neuron: activeNeuron.neuron}))
+  }
+  return neuron_bundles.get(key) as Promise<any>
+}
 
 
 // # (derived from az://oaialignment/datasets/interp/gpt2_xl/v1/webtext1/len_nomax/n_50000/mlp_post_act/ranked_by_max_activation)
@@ -76,6 +88,9 @@ export const get_top_tokens = async (activeNeuron: Neuron, weightType: string) =
   } else {
     throw new Error(`Invalid weightType: ${weightType}`)
   }
+  if (is_local) {
+    return (await get_neuron_bundle(activeNeuron)).top_tokens[weightType]
+  }
   const result = await load_file(`${TOKENS_PATH}/${activeNeuron.layer}/${activeNeuron.neuron}.json`)
   return result
   // const result = await load_file_no_cache(`${ORIG_TOKENS_PATH}/${activeNeuron.layer}.json`)
@@ -83,9 +98,11 @@ export const get_top_tokens = async (activeNeuron: Neuron, weightType: string) =
 }
 
 export const get_top_neuron_connections = async (activeNeuron: Neuron) => {
-    const result = await load_file(`${CONNECTIONS_PATH}/${activeNeuron.layer}/${activeNeuron.neuron}.json`)
+    const result = is_local
+      ? (await get_neuron_bundle(activeNeuron)).connections
+      : await load_file(`${CONNECTIONS_PATH}/${activeNeuron.layer}/${activeNeuron.neuron}.json`)
 
-    const res: {[key: string]: [number, number]} = {};
+    const res: {[key: string]: [number, number, number][]} = {};
     ["input", "output"].forEach((direction) => {
         const sign = "positive"  // "negative"
         const weight_name: string = {output: "c_proj", input: "c_fc"}[direction] as string;
@@ -106,8 +123,97 @@ export const get_top_neuron_connections = async (activeNeuron: Neuron) => {
     return res
 }
 
+// Connected neurons in each direction ("input" and "output"), each with its best explanation and
+// score. Locally this is a single request; otherwise explanations are loaded concurrently.
+export const get_neighbor_explanations = async (activeNeuron: Neuron, num_neighbors: number = 10) => {
+  if (is_local) {
+    return await post_local("/load_neighbor_explanations", {layer: activeNeuron.layer, neuron: activeNeuron.neuron, num_neighbors})
+  }
+  const connections = await get_top_neuron_connections(activeNeuron)
+  const res: {[key: string]: any[]} = {}
+  await Promise.all(Object.entries(connections).map(async ([direction, neurons]) => {
+    res[direction] = await Promise.all(neurons.slice(0, num_neighbors).map(async ([layer, neuron, strength]) => {
+      const result = await get_explanations({layer, neuron})
+      const best = (result?.scored_explanations || []).reduce(
+        (best: any, explanation: any) => (
+          best === null || explanation.scored_simulation.ev_correlation_score > best.scored_simulation.ev_correlation_score
+            ? explanation : best
+        ), null)
+      return {
+        layer,
+        neuron,
+        strength,
+        explanation: best ? best.explanation : null,
+        score: best ? best.scored_simulation.ev_correlation_score : null,
+      }
+    }))
+  }))
+  return res
+}
+
 export const get_neuron_record = async(activeNeuron: Neuron) => {
   const result = await load_file(`${NEURON_RECORDS_PATH}/${activeNeuron.layer}/${activeNeuron.neuron}.json`)
   return result
 }
 
+
+// Pages of activation records to load, by section. Sections are "top", "random" and "quantile_{i}".
+export type RecordSections = {[section: string]: {offset: number, limit: number}}
+
+export const DEFAULT_RECORD_SECTIONS: RecordSections = {
+  top: {offset: 0, limit: 4},
+  quantile_0: {offset: 0, limit: 1},
+  quantile_1: {offset: 0, limit: 1},
+  quantile_2: {offset: 0, limit: 1},
+  quantile_3: {offset: 0, limit: 1},
+  random: {offset: 0, limit: 2},
+}
+
+// Same format as the /load_neuron_records endpoint of the local backend (see python/server.py),
+// for when the full neuron record is loaded directly.
+const slice_neuron_record = (neuron_record: any, sections: RecordSections) => {
+  const record_sections: {[section: string]: any[]} = {
+    top: neuron_record.most_positive_activation_records,
+    random: neuron_record.random_sample,
+  }
+  const by_quantile: any[][] = neuron_record.random_sample_by_quantile || []
+  by_quantile.forEach((records, i) => {
+    record_sections[`quantile_${i}`] = records
+  })
+  const max_activation = Math.max(...neuron_record.most_positive_activation_records.map(
+    (record: any) => Math.max(...record.activations)))
+  const sliced_sections: {[section: string]: any} = {}
+  Object.entries(sections).forEach(([name, {offset, limit}]) => {
+    const records = record_sections[name]
+    if (records === undefined) {
+      return
+    }
+    sliced_sections[name] = {
+      total: records.length,
+      offset,
+      records: records.slice(offset, offset + limit),
+    }
+  })
+  return {max_activation, sections: sliced_sections}
+}
+
+export const get_activation_records = async (activeNeuron: Neuron, sections?: RecordSections) => {
+  if (is_local) {
+    if (sections === undefined) {
+      return (await get_neuron_bundle(activeNeuron)).activation_records
+    }
+    return await post_local("/load_neuron_records", {layer: activeNeuron.layer, neuron: activeNeuron.neuron, sections})
+  }
+  return slice_neuron_record(await get_neuron_record(activeNeuron), sections || DEFAULT_RECORD_SECTIONS)
+}
+
+// Only available with the local backend, when it was started with an explanation search index.
+export const search_explanations = async (query: string, method: string = "hybrid", limit: number = 20) => {
+  return await post_local("/search_explanations", {query, method, limit})
+}
+
+// Only available with the local backend, when it was started with a token neuron index. Tokens must
+// match exactly, including leading spaces.
+export const get_top_neurons_for_token = async (token: string, limit: number = 20) => {
+  return await post_local("/load_token_neurons", {token, limit})
+}
@@ -1,14 +1,33 @@
 import HeatmapGrid from "../heatmapGrid"
 import React, { useEffect, useState } from "react"
-import { normalizeTokenActs } from "../types"
 
-import {get_neuron_record} from "../interpAPI"
+import {get_activation_records} from "../interpAPI"
 
-function zip_sequences(sequences) {
-  return sequences.map(({ activations, tokens }) => {
+// Sections of activation records, in display order.
+// for reference
+// intervals = [(0, 1), (0, 0.5), (0.5, 0.9), (0.9, 0.99), (0.99, 0.999), (0.999, 1)]
+// saved_activations_by_interval = [neuron_record.random_sample] + neuron_record.random_sample_by_decile[:-1] + [neuron_record.top_activations]
+const SECTIONS = [
+  // label: '[0.999, 1] (Top quantile, sorted.  50 of 50000)',
+  {name: 'top', label: 'Top'},
+  {name: 'quantile_3', label: 'Quantile range [0.99, 0.999] sample'},
+  {name: 'quantile_2', label: 'Quantile range [0.9, 0.99] sample'},
+  {name: 'quantile_1', label: 'Quantile range [0.5, 0.9] sample'},
+  {name: 'quantile_0', label: 'Quantile range [0, 0.5] sample'},
+  // label: '[0, 1] (Random)',
+  {name: 'random', label: 'Random sample'},
+]
+
+// Activations are normalized to [0, 1] using the neuron's max activation. The local backend sends
+// them pre-normalized in the same way (see normalize_activations_for_display in python/server.py).
+function zip_sequences(records, max_activation) {
+  return records.map(({ activations, tokens, normalized_activations }) => {
     return tokens.map((token, idx) => ({
       token,
       activation: activations[idx],
+      normalized_activation: normalized_activations
+        ? normalized_activations[idx]
+        : (max_activation > 0 ? Math.min(1, Math.max(activations[idx], 0) / max_activation) : 0),
     }))
   })
 }
@@ -23,50 +42,42 @@ export default ({ activeNeuron }) => {
       if (data) {
         return
       }
-      const result = await get_neuron_record(activeNeuron)
-    console.log(result)
-      const all_sequences = []
-      all_sequences.push({
-        // label: '[0.999, 1] (Top quantile, sorted.  50 of 50000)',
-        label: 'Top',
-        sequences: zip_sequences(result.most_positive_activation_records),
-        default_show: 4,
-      })
-      all_sequences.push({
-        label: 'Quantile range [0.99, 0.999] sample',
-        sequences: zip_sequences(result.random_sample_by_quantile[3]),
-        default_show: 1,
-      })
-      all_sequences.push({
-        label: 'Quantile range [0.9, 0.99] sample',
-        sequences: zip_sequences(result.random_sample_by_quantile[2]),
-        default_show: 1,
-      })
-      all_sequences.push({
-        label: 'Quantile range [0.5, 0.9] sample',
-        sequences: zip_sequences(result.random_sample_by_quantile[1]),
-        default_show: 1,
-      })
-      all_sequences.push({
-        label: 'Quantile range [0, 0.5] sample',
-        sequences: zip_sequences(result.random_sample_by_quantile[0]),
-        default_show: 1,
+      // Only the records shown by default are loaded up front.
+      const result = await get_activation_records(activeNeuron)
+      // Datasets collected without quantile tracking don't have the quantile sections.
+      const available_sections = SECTIONS.filter(({name}) => result.sections[name] !== undefined)
+      const all_sequences = available_sections.map(({name, label}) => {
+        const section = result.sections[name]
+        return {
+          name,
+          label,
+          total: section.total,
+          sequences: zip_sequences(section.records, result.max_activation),
+          default_show: section.records.length,
+        }
       })
-      all_sequences.push({
-        // label: '[0, 1] (Random)',
-        label: 'Random sample',
-        sequences: zip_sequences(result.random_sample),
-        default_show: 2,
-      })
-      // for reference
-      // intervals = [(0, 1), (0, 0.5), (0.5, 0.9), (0.9, 0.99), (0.99, 0.999), (0.999, 1)]
-      // saved_activations_by_interval = [neuron_record.random_sample] + neuron_record.random_sample_by_decile[:-1] + [neuron_record.top_activations]
-      setData(all_sequences)
+      setData({max_activation: result.max_activation, sections: all_sequences})
       setIsLoading(false)
     }
     fetchData()
   }, [activeNeuron])
 
+  const toggleShowingMore = async (idx) => {
+    const section = data.sections[idx]
+    if (!showingMore[section.label] && section.sequences.length < section.total) {
+      // Load the rest of this section the first time it's expanded.
+      const offset = section.sequences.length
+      const result = await get_activation_records(
+        activeNeuron, {[section.name]: {offset, limit: section.total - offset}})
+      const more_sequences = zip_sequences(result.sections[section.name].records, data.max_activation)
+      const sections = data.sections.map((s, i) => (
+        i === idx ? {...s, sequences: s.sequences.concat(more_sequences)} : s
+      ))
+      setData({...data, sections})
+    }
+    setShowingMore({...showingMore, [section.label]: !showingMore[section.label]})
+  }
+
   if (isLoading) {
     return (
       <div className="flex justify-center items-center h-64">
@@ -76,25 +87,22 @@ export default ({ activeNeuron }) => {
     )
   }
 
-  // const activations = data.top_activations;
-  const all_normalized_sequences = normalizeTokenActs(...data.map(({sequences}) => sequences))
-
   return (
     <div>
       <h2 className="text-2xl font-bold mb-4">Activations</h2>
       {
-        data.map(({label, default_show}, idx) => {
-          const n_show = showingMore[label] ? all_normalized_sequences[idx].length : default_show;
+        data.sections.map(({label, sequences, default_show}, idx) => {
+          const n_show = showingMore[label] ? sequences.length : default_show;
           return (
           <React.Fragment key={idx}>
           <h3 className="text-md font-bold">
             {label}
             <button className="ml-2 text-sm text-gray-500"
-              onClick={() => setShowingMore({...showingMore, [label]: !showingMore[label]})}>
+              onClick={() => toggleShowingMore(idx)}>
               {showingMore[label] ? 'show less' : 'show more'}
             </button>
           </h3>
-          <HeatmapGrid allTokens={all_normalized_sequences[idx].slice(0, n_show)} />
+          <HeatmapGrid allTokens={sequences.slice(0, n_show)} />
           </React.Fragment>
           )
         })
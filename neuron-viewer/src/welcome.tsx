@@ -1,6 +1,106 @@
 import { useState, FormEvent } from "react"
 import { useNavigate } from "react-router-dom"
 
+import { get_top_neurons_for_token, is_local, search_explanations } from "./interpAPI"
+
+// Search for neurons by explanation. Needs the local backend.
+function ExplanationSearch() {
+  const [query, setQuery] = useState("")
+  const [results, setResults] = useState<any[] | null>(null)
+  const navigate = useNavigate()
+
+  const handleSubmit = async (e: FormEvent) => {
+    e.preventDefault()
+    if (query.trim() === "") {
+      return
+    }
+    const result = await search_explanations(query)
+    setResults(Array.isArray(result) ? result : [])
+  }
+
+  return (
+    <div className="flex flex-col items-center justify-center mb-4">
+      <form onSubmit={handleSubmit} className="flex flex-row items-center">
+        <input
+          type="text"
+          value={query}
+          placeholder="Search explanations"
+          style={{ width: 300, marginRight: 10 }}
+          onChange={(e) => setQuery(e.target.value)}
+          className="border border-gray-300 rounded-md p-2"
+        />
+        <button className="border border-gray-300 rounded-md p-2">Search</button>
+      </form>
+      {results !== null ?
+        <div className="mt-2">
+          {results.length === 0 ? <p className="text-gray-500">No results</p> : null}
+          {results.map(({ layer, neuron, explanation, scores }) => (
+            <button
+              onClick={() => navigate(`/layers/${layer}/neurons/${neuron}`)}
+              key={`${layer}:${neuron}:${explanation}`}
+              className="block m-1 text-left text-blue-500 hover:text-blue-700"
+            >
+              {layer}:{neuron} {explanation}
+              {scores.ev_correlation_score !== null ? ` (score: ${scores.ev_correlation_score.toFixed(2)})` : ""}
+            </button>
+          ))}
+        </div> : null
+      }
+    </div>
+  )
+}
+
+// Look up the neurons most associated with a token. Needs the local backend.
+function TokenNeurons() {
+  const [token, setToken] = useState("")
+  const [results, setResults] = useState<{[source: string]: any[]} | null>(null)
+  const navigate = useNavigate()
+
+  const handleSubmit = async (e: FormEvent) => {
+    e.preventDefault()
+    if (token === "") {
+      return
+    }
+    const result = await get_top_neurons_for_token(token, 10)
+    setResults(result && !result.error ? result : {})
+  }
+
+  return (
+    <div className="flex flex-col items-center justify-center mb-4">
+      <form onSubmit={handleSubmit} className="flex flex-row items-center">
+        <input
+          type="text"
+          value={token}
+          placeholder='Token, e.g. " dog"'
+          style={{ width: 300, marginRight: 10 }}
+          onChange={(e) => setToken(e.target.value)}
+          className="border border-gray-300 rounded-md p-2"
+        />
+        <button className="border border-gray-300 rounded-md p-2">Find neurons</button>
+      </form>
+      {results !== null ?
+        <div className="mt-2">
+          {Object.values(results).every((neurons) => neurons.length === 0) ? <p className="text-gray-500">No results</p> : null}
+          {Object.entries(results).filter(([_, neurons]) => neurons.length > 0).map(([source, neurons]) => (
+            <div key={source}>
+              <h4>{source}</h4>
+              {neurons.map(({ layer, neuron, strength }) => (
+                <button
+                  onClick={() => navigate(`/layers/${layer}/neurons/${neuron}`)}
+                  key={`${layer}:${neuron}`}
+                  className="m-1 text-blue-500 hover:text-blue-700"
+                >
+                  {layer}:{neuron} ({strength.toFixed(2)})
+                </button>
+              ))}
+            </div>
+          ))}
+        </div> : null
+      }
+    </div>
+  )
+}
+
 function NeuronForm() {
   const [input_layer, setLayer] = useState(0)
   const [input_neuron, setNeuron] = useState(0)
@@ -129,6 +229,8 @@ function NeuronForm() {
       >
         I'm feeling lucky
       </button>
+      {is_local ? <ExplanationSearch /> : null}
+      {is_local ? <TokenNeurons /> : null}
       <div className="mt-4">
         <h2 className="text-xl font-bold mb-2">Interesting neurons:</h2>
         <div className="mb-10 flex-row">